@@ -0,0 +1,65 @@
+"""
+Benchmark for building graphs through `Delayed` attribute syntax, from
+module-level, nested and deeply called functions.
+
+Run as a script from the repository root::
+
+    python benchmarks/bench_delayed.py
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+import timeit
+
+from searchspaces.delayed_eval import Delayed
+from searchspaces.partialplus import partial
+
+delayed = Delayed(proxy=partial)
+
+
+def halve(x):
+    return x / 2
+
+
+def build_globals(n):
+    """Delayed calls of builtins and module globals."""
+    return [delayed.halve(delayed.float(i)) for i in xrange(n)]
+
+
+def build_nested(n):
+    """Delayed calls of names local to an enclosing calling scope."""
+    def outer():
+        def scale(x, factor):
+            return x * factor
+
+        def inner():
+            return [delayed.scale(i, 2) for i in xrange(n)]
+        return inner()
+    return outer()
+
+
+def at_depth(depth, builder, n):
+    """Run `builder(n)` with `depth` more frames on the stack."""
+    if depth:
+        return at_depth(depth - 1, builder, n)
+    return builder(n)
+
+
+def bench(name, builder, n=1000, depth=0, repeat=5):
+    best = min(timeit.repeat(lambda: at_depth(depth, builder, n), number=1,
+                             repeat=repeat))
+    # Each element takes two `Delayed` lookups.
+    lookups = 2 * n if builder is build_globals else n
+    print '%-14s depth %4d  %10.3f ms  %10.0f delayed calls/s' % (
+        name, depth, best * 1e3, lookups / best)
+
+
+def main():
+    for depth in (0, 50, 200):
+        bench('build_globals', build_globals, depth=depth)
+        bench('build_nested', build_nested, depth=depth)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark for the per-node overhead of `evaluate` on deep and wide graphs.
+
+Run as a script from the repository root::
+
+    python benchmarks/bench_evaluate.py
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+import operator
+import timeit
+
+from searchspaces.partialplus import as_partialplus, evaluate, partial
+
+
+def deep_chain(depth):
+    """A chain of `depth` additions, each depending on the last."""
+    p = partial(int, 0)
+    for _ in xrange(depth):
+        p = p + 1
+    return p
+
+
+def wide_list(width):
+    """A list of `width` independent calls."""
+    return as_partialplus([partial(operator.add, i, 1)
+                           for i in xrange(width)])
+
+
+def deep_index(depth):
+    """Nested lists indexed lazily, `depth` levels deep."""
+    p = partial(int, 0)
+    for i in xrange(depth):
+        p = as_partialplus([p, partial(float, i)])[0]
+    return p
+
+
+def count_nodes(root):
+    seen = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        stack.extend(node.inputs())
+    return len(seen)
+
+
+def bench(name, builder, size, repeat=5):
+    graph = builder(size)
+    n_nodes = count_nodes(graph)
+    try:
+        best = min(timeit.repeat(lambda: evaluate(graph), number=1,
+                                 repeat=repeat))
+    except RuntimeError as e:
+        print '%-12s %8d nodes  failed: %s' % (name, n_nodes, e)
+        return
+    print '%-12s %8d nodes  %10.3f ms  %8.3f us/node' % (
+        name, n_nodes, best * 1e3, best * 1e6 / n_nodes)
+
+
+def main():
+    for size in (100, 300, 3000, 30000):
+        bench('deep_chain', deep_chain, size)
+        bench('wide_list', wide_list, size)
+        bench('deep_index', deep_index, size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark for the memory footprint of `PartialPlus` graphs.
+
+Builds a graph of about one million nodes and reports the growth in
+resident memory. Run as a script from the repository root::
+
+    python benchmarks/bench_memory.py [n_nodes]
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+import gc
+import operator
+import os
+import resource
+import sys
+import time
+
+from searchspaces.partialplus import as_partialplus, partial
+
+
+def rss():
+    """Current resident set size of this process, in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except IOError:
+        # Peak rather than current, but good enough on a fresh process.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def build(n_nodes):
+    """
+    A list of `add(int(i), 1)` expressions, each of which is four
+    nodes: two calls and two literals.
+    """
+    n_elements = n_nodes // 4
+    return as_partialplus([partial(operator.add, partial(int, i), 1)
+                           for i in xrange(n_elements)])
+
+
+def main(n_nodes=10 ** 6):
+    gc.collect()
+    before = rss()
+    t0 = time.time()
+    graph = build(n_nodes)
+    elapsed = time.time() - t0
+    gc.collect()
+    after = rss()
+    n_elements = len(graph.args)
+    actual = 4 * n_elements + 1
+    print '%d nodes built in %.2f s' % (actual, elapsed)
+    print '%.1f MB retained, %.1f bytes/node' % (
+        (after - before) / 1e6, float(after - before) / actual)
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
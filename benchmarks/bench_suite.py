@@ -0,0 +1,281 @@
+"""
+Benchmark suite for the core graph operations, at sizes from ten to a
+million nodes.
+
+Each benchmark runs in a child process of its own, and reports the
+time taken (the best of a few runs, for fast ones) and the peak memory
+used on top of what the process held beforehand (from the first run).
+Run as a script from the repository root::
+
+    python benchmarks/bench_suite.py [--max-size N] [--only NAME ...]
+                                     [--save FILE] [--compare FILE]
+
+With `--save`, results are written to a JSON file; with `--compare`,
+they are compared with such a file, and the script exits with status 1
+if any benchmark got slower or used more memory than `--tolerance`
+allows.
+
+Benchmarks whose optional dependencies (hyperopt for `as_pyll`,
+pylearn2 for `pylearn2_yaml.load`) are missing are skipped.
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+import argparse
+from collections import OrderedDict
+import gc
+import json
+from multiprocessing import Pipe, Process
+import resource
+import sys
+import time
+
+from searchspaces.partialplus import (as_partialplus, depth_first_traversal,
+                                      evaluate, partial, topological_sort)
+
+SIZES = (10, 100, 1000, 10 ** 4, 10 ** 5, 10 ** 6)
+
+# Maps benchmark names to (setup, requires) pairs. `setup(size)` builds
+# the inputs for a graph of about `size` nodes, and returns the function
+# to time.
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name, requires=None):
+    def register(setup):
+        BENCHMARKS[name] = (setup, requires)
+        return setup
+    return register
+
+
+def nested_literal(size):
+    """
+    A list of dicts of lists and tuples, which `as_partialplus`
+    turns into about `size` nodes.
+    """
+    return [{'id': i, 'values': [i, 0.5 * i, str(i)], 'pair': (i, None)}
+            for i in xrange(max(1, size // 16))]
+
+
+def chains(size):
+    """
+    A list of chains of additions, about as wide as they are deep, of
+    about `size` nodes in total.
+    """
+    width = max(1, int(size ** 0.5) // 2)
+    depth = max(1, size // (2 * width))
+    elements = []
+    for i in xrange(width):
+        p = partial(int, i)
+        for _ in xrange(depth):
+            p = p + 1
+        elements.append(p)
+    return as_partialplus(elements)
+
+
+def yaml_source(size):
+    """A pylearn2 YAML document loading to about `size` nodes."""
+    entries = ['    item%d: !obj:__builtin__.dict {a: %d, b: [%d, 1.5, x]},'
+               % (i, i, i) for i in xrange(max(1, size // 8))]
+    return '!obj:__builtin__.dict {\n%s\n}\n' % '\n'.join(entries)
+
+
+@benchmark('as_partialplus')
+def setup_as_partialplus(size):
+    data = nested_literal(size)
+    return lambda: as_partialplus(data)
+
+
+@benchmark('partial')
+def setup_partial(size):
+    return lambda: chains(size)
+
+
+@benchmark('depth_first_traversal')
+def setup_depth_first_traversal(size):
+    graph = chains(size)
+    return lambda: list(depth_first_traversal(graph))
+
+
+@benchmark('topological_sort')
+def setup_topological_sort(size):
+    graph = chains(size)
+    return lambda: list(topological_sort(graph))
+
+
+@benchmark('evaluate')
+def setup_evaluate(size):
+    graph = chains(size)
+    return lambda: evaluate(graph)
+
+
+@benchmark('clone')
+def setup_clone(size):
+    graph = chains(size)
+    return graph.clone
+
+
+@benchmark('as_pyll', requires='hyperopt')
+def setup_as_pyll(size):
+    from searchspaces.export.pyll import as_pyll
+    graph = chains(size)
+    return lambda: as_pyll(graph)
+
+
+@benchmark('pylearn2_yaml.load', requires='pylearn2')
+def setup_pylearn2_yaml_load(size):
+    from searchspaces.load.pylearn2_yaml import load
+    source = yaml_source(size)
+    return lambda: load(source)
+
+
+def reset_peak_rss():
+    """Reset the peak resident set size, where the platform allows."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except IOError:
+        pass
+
+
+def rss(peak=False):
+    """The current (or peak) resident set size of this process, in bytes."""
+    field = 'VmHWM:' if peak else 'VmRSS:'
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    # Peak since the process started, on platforms without procfs.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def measure(name, size, repeat, conn):
+    """Run a benchmark, and send its results through `conn`."""
+    try:
+        run = BENCHMARKS[name][0](size)
+        gc.collect()
+        reset_peak_rss()
+        before = rss()
+        t0 = time.time()
+        result = run()
+        best = time.time() - t0
+        peak = rss(peak=True) - before
+        del result
+        # Repeat fast benchmarks for a less noisy time.
+        for _ in xrange(repeat - 1 if best < 1. else 0):
+            t0 = time.time()
+            run()
+            best = min(best, time.time() - t0)
+        conn.send({'name': name, 'size': size, 'seconds': best,
+                   'peak_bytes': max(peak, 0)})
+    except Exception as e:
+        conn.send({'name': name, 'size': size,
+                   'error': '%s: %s' % (type(e).__name__, e)})
+
+
+def run_benchmark(name, size, repeat):
+    parent, child = Pipe(duplex=False)
+    process = Process(target=measure, args=(name, size, repeat, child))
+    process.start()
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        result = {'name': name, 'size': size,
+                  'error': 'exited with code %s' % process.exitcode}
+    process.join()
+    return result
+
+
+def report(result):
+    if 'error' in result:
+        print '%-22s %8d  failed: %s' % (result['name'], result['size'],
+                                         result['error'])
+    else:
+        print '%-22s %8d  %10.3f ms  %8.3f us/node  %8.1f MB peak' % (
+            result['name'], result['size'], result['seconds'] * 1e3,
+            result['seconds'] * 1e6 / result['size'],
+            result['peak_bytes'] / 1e6)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the benchmarks that regressed relative to `baseline`, and
+    return their number. Differences below a millisecond or a megabyte
+    are ignored as noise.
+    """
+    old = dict(((r['name'], r['size']), r) for r in baseline
+               if 'error' not in r)
+    regressions = 0
+    for result in results:
+        previous = old.get((result['name'], result['size']))
+        if previous is None or 'error' in result:
+            continue
+        slower = (result['seconds'] > previous['seconds'] *
+                  (1 + tolerance) + 1e-3)
+        bigger = (result['peak_bytes'] > previous['peak_bytes'] *
+                  (1 + tolerance) + 1e6)
+        if slower or bigger:
+            regressions += 1
+            print 'REGRESSION %-22s %8d  time x%.2f  peak x%.2f' % (
+                result['name'], result['size'],
+                result['seconds'] / max(previous['seconds'], 1e-9),
+                result['peak_bytes'] / max(previous['peak_bytes'], 1.))
+    return regressions
+
+
+def available(module):
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--max-size', type=int, default=SIZES[-1],
+                        help='the largest graph size to run')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS),
+                        help='the benchmarks to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs of benchmarks taking under a second')
+    parser.add_argument('--save', metavar='FILE',
+                        help='write the results to a JSON file')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results with a saved JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='the relative slowdown or growth in memory '
+                             'reported as a regression')
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in args.only or BENCHMARKS:
+        requires = BENCHMARKS[name][1]
+        if requires is not None and not available(requires):
+            print '%-22s skipped: requires %s' % (name, requires)
+            continue
+        for size in SIZES:
+            if size > args.max_size:
+                break
+            result = run_benchmark(name, size, args.repeat)
+            report(result)
+            results.append(result)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1 +1,3 @@
-from .partialplus import as_partialplus, evaluate, choice, partial, variable
+from .partialplus import (as_partialplus, evaluate, evaluate_async,
+                          evaluate_batch, iter_evaluate, EvaluationSession,
+                          choice, partial, variable)
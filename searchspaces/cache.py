@@ -0,0 +1,663 @@
+"""
+Memoization of subgraph results across evaluations, in memory or on
+disk.
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+__all__ = ["ResultCache", "DiskCache", "mark_cacheable", "is_cacheable"]
+
+import cPickle as pickle
+from collections import OrderedDict
+from contextlib import contextmanager
+import errno
+import hashlib
+import itertools
+import os
+import sys
+import tempfile
+import types
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .optimize import _literal_key
+from .partialplus import Literal, is_literal, is_variable_node
+from .partialplus import topological_sort
+
+# Returned by `get` for keys with no cached value.
+_MISSING = object()
+
+# File extensions of `DiskCache` entries, by storage format.
+_NPY = '.npy'
+_PICKLE = '.pkl'
+
+# The types of values `_stable_repr` represents by their `repr`.
+_ATOM_TYPES = frozenset([type(None), bool, int, long, float, complex,
+                         str, unicode])
+# Types of values `_stable_repr` represents by their qualified names.
+_NAMED_TYPES = (type, types.ClassType, types.FunctionType,
+                types.BuiltinFunctionType, types.MethodType)
+_METHOD_TYPES = (types.MethodType, types.BuiltinMethodType)
+
+# Functions whose results caches keep by default; add to it with
+# `mark_cacheable`.
+_cacheable_functions = set()
+
+# When `DiskCache` goes over `max_bytes`, it evicts entries until it
+# is back under this fraction of it.
+_EVICT_TO = 0.75
+
+
+def _qualified_name(func):
+    """
+    The dotted name under which `func` can be imported, or `None` if
+    it has none (e.g. lambdas, methods bound to instances, or nested
+    functions and closures, whose names lead to other objects).
+    """
+    module = getattr(func, '__module__', None)
+    name = getattr(func, '__name__', None)
+    owner = getattr(func, '__self__', None)
+    if owner is None:
+        owner = getattr(func, 'im_class', None)
+    if owner is not None and not isinstance(owner, type(sys)):
+        if not isinstance(owner, type):
+            return None
+        module = owner.__module__
+        name = '%s.%s' % (owner.__name__, name)
+    if module is None or name is None or '<' in name:
+        return None
+    # Check that the name leads back to `func`. Methods are built anew
+    # on each access, so those are compared for equality.
+    obj = sys.modules.get(module)
+    for attr in name.split('.'):
+        obj = getattr(obj, attr, None)
+    if obj is not func and not (isinstance(obj, _METHOD_TYPES) and
+                                obj == func):
+        return None
+    return '%s.%s' % (module, name)
+
+
+def _stable_repr(obj):
+    """
+    A string identifying `obj` by value, the same in every process, or
+    `None` if there is none: only for numbers, strings, `None`, tuples
+    of these, and classes and functions with a qualified name.
+    """
+    if type(obj) in _ATOM_TYPES:
+        return repr(obj)
+    if type(obj) is tuple:
+        parts = [_stable_repr(o) for o in obj]
+        if None in parts:
+            return None
+        return '(%s)' % ''.join(p + ',' for p in parts)
+    if isinstance(obj, type) and obj in _ATOM_TYPES:
+        # NoneType has no qualified name.
+        return '<%s>' % obj.__name__
+    if isinstance(obj, _NAMED_TYPES):
+        name = _qualified_name(obj)
+        return None if name is None else '<%s>' % name
+    return None
+
+
+def _digest(obj):
+    """A hex digest of `repr(obj)`."""
+    return hashlib.sha1(repr(obj)).hexdigest()
+
+
+def mark_cacheable(f):
+    """
+    Declare that the results of calls to `f` are worth caching: they
+    are expensive to compute, depend only on the arguments, and are
+    never mutated once built.
+
+    Parameters
+    ----------
+    f : callable
+
+    Returns
+    -------
+    f : callable
+        `f` itself, so that this can be used as a decorator.
+    """
+    _cacheable_functions.add(f)
+    return f
+
+
+def is_cacheable(f):
+    """
+    Check whether `f` has been declared cacheable with
+    `mark_cacheable`.
+
+    Parameters
+    ----------
+    f : callable
+
+    Returns
+    -------
+    cacheable : bool
+    """
+    try:
+        return f in _cacheable_functions
+    except TypeError:  # Unhashable callable.
+        return False
+
+
+def _is_cacheable_call(node):
+    return is_cacheable(node.func)
+
+
+class _NodeCache(object):
+    """
+    Machinery shared by caches plugged into `evaluate`.
+
+    Subclasses implement `get` and `put`, and the hooks fingerprinting
+    literals and calls and building keys from fingerprints.
+    """
+    def __init__(self, cacheable=None):
+        self.cacheable = cacheable
+        # Fingerprints and variable dependencies of the last graph seen.
+        self._structure = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _analyze(self, root):
+        """
+        Fingerprint every subgraph of `root`, and find the names of
+        the variables each depends on.
+
+        Returns
+        -------
+        fingerprints : dict
+            Maps each node to a fingerprint of the structure of its
+            subgraph, or `None` if it can't be fingerprinted.
+        depends : dict
+            Maps each node to a frozenset of variable names, or `None`
+            if it depends on a variable whose name is not a literal.
+        """
+        if self._structure is not None and self._structure[0] is root:
+            return self._structure[1:]
+        fingerprints = {}
+        depends = {}
+        no_names = frozenset()
+        for node in topological_sort(root, reverse=True):
+            if isinstance(node, Literal):
+                key = _literal_key(node.value)
+                fingerprints[node] = (None if key is None else
+                                      self._literal_fingerprint(key))
+                depends[node] = no_names
+                continue
+            keywords = node._keywords or {}
+            children = node.args + tuple(keywords.itervalues())
+            child_fps = [fingerprints[c] for c in children]
+            if None in child_fps:
+                fingerprints[node] = None
+            else:
+                n_args = len(node.args)
+                fingerprints[node] = self._call_fingerprint(
+                    node.func, tuple(child_fps[:n_args]),
+                    tuple(sorted(zip(keywords, child_fps[n_args:]))))
+            child_deps = [depends[c] for c in children]
+            if None in child_deps:
+                names = None
+            else:
+                names = no_names
+                for d in child_deps:
+                    if d and d is not names:
+                        names = d if not names else names | d
+            if is_variable_node(node):
+                name = node.keywords['name']
+                if names is not None and is_literal(name):
+                    names = names | frozenset([name.value])
+                else:
+                    names = None
+            depends[node] = names
+        self._structure = (root, fingerprints, depends)
+        return fingerprints, depends
+
+    def wrap_bindings(self, root, bindings):
+        """
+        Wrap the initial `bindings` of an evaluation of `root` so that
+        cached values are looked up as the evaluation reaches each
+        node. Pass the result to `store` once the evaluation is done.
+        """
+        fingerprints, depends = self._analyze(root)
+        return _CachedBindings(self, fingerprints, depends, bindings)
+
+    def store(self, bindings):
+        """
+        Cache the values computed during an evaluation, given the
+        bindings returned by `wrap_bindings`.
+        """
+        for node, key in bindings.missed.iteritems():
+            if dict.__contains__(bindings, node):
+                self.misses += 1
+                self.put(key, dict.__getitem__(bindings, node))
+
+
+class ResultCache(_NodeCache):
+    """
+    A least-recently-used cache of node values, shared across calls
+    to `evaluate`.
+
+    Parameters
+    ----------
+    max_entries : int, optional
+        The maximum number of values to keep. Unlimited by default.
+    max_bytes : int, optional
+        The maximum total size of the values to keep, as measured by
+        `sizeof`. Unlimited by default. Values larger than this on
+        their own are never cached.
+    sizeof : callable, optional
+        Function estimating the size in bytes of a value. Defaults to
+        `sys.getsizeof`, which does not count the objects a value
+        refers to; pass a deeper estimate if that matters.
+    cacheable : callable, optional
+        Predicate on nodes deciding whether their values are cached.
+        By default only calls to functions marked with
+        `mark_cacheable` are; in particular, the lists and dicts built
+        from a graph's containers are not.
+    max_fingerprints : int, optional
+        The maximum number of distinct subgraphs and literals to keep
+        fingerprints of. When an evaluation of a new graph starts with
+        more, the cache is cleared. Defaults to 100000.
+
+    Attributes
+    ----------
+    hits : int
+        The number of node values taken from the cache.
+    misses : int
+        The number of cacheable node values that had to be computed.
+    evictions : int
+        The number of values evicted to respect the limits.
+    n_bytes : int
+        The total size of the cached values.
+
+    Notes
+    -----
+    A node's value is cached under a key combining a structural
+    fingerprint of its subgraph with the values of the variables the
+    subgraph depends on, so structurally identical subgraphs in
+    different graphs share entries. Nodes depending on literals or
+    variable values that are not hashable are not cached. Fingerprints
+    are kept in a table holding the literal values and functions seen,
+    hence `max_fingerprints`.
+
+    Cached values are returned as-is rather than copied: an evaluation
+    that hits the cache gets the very object built by an earlier one,
+    and structurally identical nodes of a graph get the same object.
+    Only make `cacheable` accept nodes building objects that are never
+    mutated, unlike e.g. models that are trained in place.
+    """
+    def __init__(self, max_entries=None, max_bytes=None, sizeof=None,
+                 cacheable=None, max_fingerprints=100000):
+        super(ResultCache, self).__init__(
+            _is_cacheable_call if cacheable is None else cacheable)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sys.getsizeof if sizeof is None else sizeof
+        self.max_fingerprints = max_fingerprints
+        self._entries = OrderedDict()
+        self._sizes = {}
+        # Interned structural keys of subgraphs, mapped to ints. These
+        # are never reused, so that keys from before a `clear` can't
+        # match anything after it.
+        self._fingerprints = {}
+        self._next_fingerprint = itertools.count()
+        self.n_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Return the value cached under `key`, marking it as most
+        recently used, or `default` if there is none.
+        """
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            return default
+        self._entries[key] = value
+        return value
+
+    def put(self, key, value):
+        """Cache `value` under `key`, evicting old values as needed."""
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._discard(key)
+        self._entries[key] = value
+        self._sizes[key] = size
+        self.n_bytes += size
+        while ((self.max_entries is not None and
+                len(self._entries) > self.max_entries) or
+               (self.max_bytes is not None and
+                self.n_bytes > self.max_bytes)):
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Drop every cached value, and the fingerprints of the graphs
+        seen. Statistics are kept.
+        """
+        self._entries.clear()
+        self._sizes.clear()
+        self._fingerprints.clear()
+        self._structure = None
+        self.n_bytes = 0
+
+    def _discard(self, key):
+        del self._entries[key]
+        self.n_bytes -= self._sizes.pop(key)
+
+    def _analyze(self, root):
+        # Without a fingerprint, cached values can't be found again.
+        if (len(self._fingerprints) > self.max_fingerprints and
+                (self._structure is None or self._structure[0] is not root)):
+            self.clear()
+        return super(ResultCache, self)._analyze(root)
+
+    def _intern(self, key):
+        interned = self._fingerprints
+        try:
+            return interned[key]
+        except KeyError:
+            fingerprint = interned[key] = next(self._next_fingerprint)
+            return fingerprint
+
+    def _literal_fingerprint(self, key):
+        return self._intern((Literal, key))
+
+    def _call_fingerprint(self, func, args, keywords):
+        try:
+            return self._intern((func, args, keywords))
+        except TypeError:
+            return None
+
+    def _key(self, fingerprint, values):
+        return fingerprint, values
+
+
+class DiskCache(_NodeCache):
+    """
+    A cache of node values stored as files in a directory, shared
+    across calls to `evaluate` and across processes.
+
+    Parameters
+    ----------
+    directory : str
+        The directory holding the cached values. It is created if it
+        does not exist.
+    max_bytes : int, optional
+        The maximum total size of the files in `directory`. Unlimited
+        by default. Once it is exceeded, the least recently used
+        entries are removed until the cache is back under three
+        quarters of it.
+    cacheable : callable, optional
+        Predicate on nodes deciding whether their values are cached.
+        By default only calls to functions marked with
+        `mark_cacheable` are.
+
+    Attributes
+    ----------
+    hits : int
+        The number of node values read from the cache.
+    misses : int
+        The number of cacheable node values that had to be computed.
+    evictions : int
+        The number of entries this object removed to respect
+        `max_bytes`.
+
+    Notes
+    -----
+    Keys are SHA-1 digests of the structure of a node's subgraph,
+    built from the qualified names of its functions and the values of
+    its literals, and of the values of the variables it depends on.
+    They are therefore stable across processes, but calls to functions
+    without a qualified name leading back to them (lambdas, methods of
+    instances, closures) are never cached, nor is anything depending
+    on one. Likewise, only literals and variable values that are
+    numbers, strings, `None`, tuples of these, or classes and
+    functions with a qualified name make keys; values of other types
+    have no representation identifying them across processes.
+
+    NumPy arrays are saved in `.npy` format and loaded back as
+    read-only memory maps, without copying; other values are pickled,
+    and values that can't be pickled are not cached. Entries are
+    written to a temporary file and renamed into place, so concurrent
+    readers never see partial entries. Reading an entry marks it as
+    recently used by updating its modification time.
+
+    The size of the cache is tracked by adding up the entries written
+    since the directory was last scanned, so that it is only scanned
+    when eviction is due. Entries written by other processes sharing
+    the directory are only accounted for at that point.
+    """
+    def __init__(self, directory, max_bytes=None, cacheable=None):
+        super(DiskCache, self).__init__(
+            _is_cacheable_call if cacheable is None else cacheable)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Estimated total size of the entries, if known.
+        self._size_estimate = None
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def __len__(self):
+        return len(self._entries())
+
+    def __contains__(self, key):
+        return any(os.path.exists(self._path(key, ext))
+                   for ext in (_NPY, _PICKLE))
+
+    @property
+    def n_bytes(self):
+        """The total size of the entries in the cache."""
+        return sum(size for _, size, _ in self._entries())
+
+    def get(self, key, default=None):
+        """
+        Return the value cached under `key`, marking it as most
+        recently used, or `default` if there is none.
+        """
+        for ext in (_NPY, _PICKLE):
+            path = self._path(key, ext)
+            try:
+                if ext == _NPY:
+                    if np is None:
+                        continue
+                    value = np.load(path, mmap_mode='r')
+                else:
+                    with open(path, 'rb') as f:
+                        value = pickle.load(f)
+            except (IOError, OSError, EOFError, ValueError,
+                    pickle.UnpicklingError):
+                # Missing, or truncated or corrupt: a miss.
+                continue
+            try:
+                os.utime(path, None)
+            except OSError:
+                # Evicted by another process since we opened it.
+                pass
+            return value
+        return default
+
+    def put(self, key, value):
+        """Cache `value` under `key`, evicting old entries as needed."""
+        if (np is not None and isinstance(value, np.ndarray) and
+                not value.dtype.hasobject):
+            ext = _NPY
+        else:
+            ext = _PICKLE
+        fd, tmp = tempfile.mkstemp(prefix='.tmp-', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if ext == _NPY:
+                    np.save(f, value)
+                else:
+                    pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            size = os.path.getsize(tmp)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            os.rename(tmp, self._path(key, ext))
+            tmp = None
+        except (pickle.PicklingError, TypeError):
+            return
+        finally:
+            if tmp is not None:
+                os.remove(tmp)
+        if self.max_bytes is None:
+            return
+        if self._size_estimate is None:
+            self._size_estimate = self.n_bytes
+        else:
+            self._size_estimate += size
+        if self._size_estimate > self.max_bytes:
+            self._evict()
+
+    def clear(self):
+        """Remove every entry. Statistics are kept."""
+        with self._lock():
+            for _, _, path in self._entries():
+                self._remove(path)
+            self._size_estimate = 0
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    def _entries(self):
+        """`(mtime, size, path)` for each entry, in no particular order."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    @contextmanager
+    def _lock(self):
+        """Hold an exclusive lock on the directory, where supported."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, '.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _evict(self):
+        with self._lock():
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            target = int(self.max_bytes * _EVICT_TO)
+            if total > self.max_bytes:
+                for _, size, path in entries:
+                    if total <= target:
+                        break
+                    self._remove(path)
+                    total -= size
+                    self.evictions += 1
+            self._size_estimate = total
+
+    def _literal_fingerprint(self, key):
+        value = _stable_repr(key)
+        if value is None:
+            return None
+        return _digest(('literal', value))
+
+    def _call_fingerprint(self, func, args, keywords):
+        name = _qualified_name(func)
+        if name is None:
+            return None
+        return _digest(('call', name, args, keywords))
+
+    def _key(self, fingerprint, values):
+        encoded = []
+        for name, value_key in values:
+            value = _stable_repr(value_key)
+            if value is None:
+                return None
+            encoded.append((name, value))
+        return _digest((fingerprint, tuple(encoded)))
+
+
+class _CachedBindings(dict):
+    """
+    The bindings of a single evaluation, taking node values from a
+    cache when they are first looked for.
+    """
+    def __init__(self, cache, fingerprints, depends, bindings):
+        dict.__init__(self, bindings)
+        self.cache = cache
+        self.fingerprints = fingerprints
+        self.depends = depends
+        # Cacheable nodes that were not in the cache, with their keys.
+        self.missed = {}
+
+    def key(self, node):
+        """The cache key for the value of `node`, or `None`."""
+        fingerprint = self.fingerprints.get(node)
+        names = self.depends.get(node)
+        if fingerprint is None or names is None:
+            return None
+        values = []
+        for name in sorted(names):
+            if not dict.__contains__(self, name):
+                return None
+            value_key = _literal_key(dict.__getitem__(self, name))
+            if value_key is None:
+                return None
+            values.append((name, value_key))
+        return self.cache._key(fingerprint, tuple(values))
+
+    def __contains__(self, node):
+        if dict.__contains__(self, node):
+            return True
+        if (node in self.missed or node not in self.fingerprints or
+                isinstance(node, Literal) or is_variable_node(node)):
+            return False
+        cache = self.cache
+        if not cache.cacheable(node):
+            return False
+        key = self.key(node)
+        if key is None:
+            return False
+        value = cache.get(key, _MISSING)
+        if value is _MISSING:
+            self.missed[node] = key
+            return False
+        cache.hits += 1
+        self[node] = value
+        return True
@@ -6,8 +6,56 @@ __license__ = "3-clause BSD License"
 __contact__ = "github.com/hyperopt/hyperopt"
 
 
+import __builtin__
 import functools
 import inspect
+import sys
+import weakref
+
+# Maps the code objects of functions to the names their frames can
+# have in `locals()`, or to `None` for code whose frames can have any.
+# Weakly keyed, so that code compiled at run time (e.g. by `exec`) is
+# not kept alive.
+_LOCAL_NAMES = weakref.WeakKeyDictionary()
+
+
+def _local_names(code):
+    """
+    The names a frame executing `code` can hold in its `locals()`, or
+    `None` if there is no telling: for module and class bodies, and
+    functions using `exec` or `import *`.
+    """
+    try:
+        return _LOCAL_NAMES[code]
+    except KeyError:
+        if code.co_flags & inspect.CO_OPTIMIZED:
+            names = frozenset(code.co_varnames + code.co_cellvars +
+                              code.co_freevars)
+        else:
+            names = None
+        _LOCAL_NAMES[code] = names
+        return names
+
+
+def _lookup_local(frame, name):
+    """
+    Look `name` up in the `locals()` of `frame`, without building them
+    for a function that can't have it.
+
+    Returns
+    -------
+    resolved : bool
+        `True` if `name` is bound in `frame`.
+    obj : object
+        Its value if so, or else `None`.
+    """
+    names = _local_names(frame.f_code)
+    if names is not None and name not in names:
+        return False, None
+    f_locals = frame.f_locals
+    if name in f_locals:
+        return True, f_locals[name]
+    return False, None
 
 
 def is_nested(frame=None):
@@ -29,12 +77,13 @@ def is_nested(frame=None):
         its definition is nested.
     """
     if frame is None:
-        frame = inspect.currentframe().f_back
+        frame = sys._getframe(1)
     caller = frame.f_back
+    if caller is None:
+        return False
     code = frame.f_code
-    name = code.co_name
-    return (caller is not None and name in caller.f_locals and
-            getattr(caller.f_locals[name], 'func_code', None) == code)
+    resolved, obj = _lookup_local(caller, code.co_name)
+    return resolved and getattr(obj, 'func_code', None) == code
 
 
 def _resolve_upward(frame, name):
@@ -60,16 +109,12 @@ def _resolve_upward(frame, name):
         it can be `None` if `resolved` is `True`, as well, in which case
         `None` was the value found for `name` in some valid scope.
     """
-    obj = None
-    resolved = False
     while is_nested(frame):
-        if name in frame.f_locals:
-            resolved = True
-            obj = frame.f_locals[name]
-            break
-        else:
-            frame = frame.f_back
-    return resolved, obj
+        resolved, obj = _lookup_local(frame, name)
+        if resolved:
+            return resolved, obj
+        frame = frame.f_back
+    return False, None
 
 
 class Delayed(object):
@@ -87,6 +132,11 @@ class Delayed(object):
     -----
     TODO: examples
 
+    Names are resolved from the frame accessing the attribute, walking
+    up the stack only through nested calling scopes; the frames of
+    functions whose code can't bind a name are skipped without
+    building their `locals()`.
+
     TODO: make this picklable. Involves passing through a bunch of methods
     like `__getstate__`, `__setstate__`, but also `__mro__` and `__reduce__`
     and so forth.
@@ -95,20 +145,16 @@ class Delayed(object):
         self._proxy_ = proxy
 
     def __getattribute__(self, name):
-        caller = inspect.getouterframes(inspect.currentframe())[1][0]
         if name in ('__str__', '__repr__', '__dict__', '_proxy_'):
             return super(Delayed, self).__getattribute__(name)
-        elif name in caller.f_locals:
-            resolved = True
-            obj = caller.f_locals[name]
-        else:
-            resolved = False
+        caller = sys._getframe(1)
+        resolved, obj = _lookup_local(caller, name)
+        if not resolved:
             if is_nested(caller):
                 resolved, obj = _resolve_upward(caller, name)
             if not resolved and name in caller.f_globals:
                 resolved = True
                 obj = caller.f_globals[name]
-            import __builtin__
             if not resolved and hasattr(__builtin__, name):
                 resolved = True
                 obj = getattr(__builtin__, name)
@@ -0,0 +1,243 @@
+"""
+Fixed-width numeric encoding of the variable bindings of a search
+space, for model-based optimizers.
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+__all__ = ["Encoder"]
+
+from collections import OrderedDict
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("This functionality requires numpy "
+                      "<http://www.numpy.org/>")
+
+from .graph import FrozenGraph
+from .partialplus import is_categorical
+from .variables import (active_masks, as_column, from_unit_interval,
+                        hyperparameter, require)
+
+_erf = np.vectorize(math.erf, otypes=[float])
+
+
+def _option_indices(options, column, name):
+    """The indices in `options` of the values in `column`."""
+    try:
+        lookup = dict((v, i) for i, v in reversed(list(enumerate(options))))
+    except TypeError:
+        lookup = None
+    indices = np.empty(len(column), dtype=int)
+    for j, value in enumerate(column):
+        try:
+            indices[j] = (lookup[value] if lookup is not None
+                          else options.index(value))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("%r is not an option of variable '%s'" %
+                             (value, name))
+    return indices
+
+
+def _untransform(node, column):
+    """
+    Map values of the variable `node` to the unit interval: the
+    inverse of `from_unit_interval`. Discrete values map to the middle
+    of the interval that `from_unit_interval` maps to them.
+    """
+    kw = node.keywords
+    name = kw['name'].value
+    if is_categorical(node):
+        options = list(hyperparameter(kw['value_type'], name))
+        if 'p' in kw:
+            p = np.asarray(hyperparameter(kw['p'], name), dtype=float)
+            cdf = np.cumsum(p) / p.sum()
+            middles = cdf - p / p.sum() / 2
+        else:
+            middles = (np.arange(len(options)) + 0.5) / len(options)
+        return middles[_option_indices(options, column, name)]
+    x = np.asarray(column, dtype=float)
+    kw = dict((k, hyperparameter(v, name)) for k, v in kw.iteritems())
+    distribution = kw['distribution']
+    low, high = kw['minimum'], kw['maximum']
+    if distribution is None:
+        if low is None or high is None:
+            raise ValueError("variable '%s' needs a minimum and a maximum "
+                             "to be encoded" % name)
+        if kw['log_scale']:
+            u = np.log(x / low) / np.log(float(high) / low)
+        elif kw['value_type'] is int:
+            u = (x - low + 0.5) / (high - low + 1)
+        else:
+            u = (x - low) / (high - low)
+    elif distribution == 'randint':
+        high, = require(kw, name, distribution, 'maximum')
+        u = (x + 0.5) / (high + 1)
+    elif distribution in ('uniform', 'quniform', 'loguniform', 'qloguniform'):
+        low, high = require(kw, name, distribution, 'minimum', 'maximum')
+        if 'log' in distribution:
+            x = np.log(x)
+        u = (x - low) / (high - low)
+    elif distribution in ('normal', 'qnormal', 'lognormal', 'qlognormal'):
+        mu, sigma = require(kw, name, distribution, 'mu', 'sigma')
+        if 'log' in distribution:
+            x = np.log(x)
+        u = 0.5 * (1 + _erf((x - mu) / (sigma * math.sqrt(2))))
+    else:
+        raise ValueError("variable '%s' has unknown distribution '%s'" %
+                         (name, distribution))
+    return np.clip(u, 0., 1.)
+
+
+class Encoder(object):
+    """
+    Encodes variable bindings of a search space as rows of a matrix
+    of floats, and decodes them back.
+
+    Parameters
+    ----------
+    root : Node or FrozenGraph
+        The root of the search space.
+    categorical : str, optional
+        How to encode categorical variables: `'onehot'` (the default)
+        gives each option a column, set to 1 for the chosen option and
+        0 otherwise; `'ordinal'` gives the variable a single column.
+
+    Attributes
+    ----------
+    slices : OrderedDict
+        Maps each variable name to the slice of the columns encoding
+        it, in the order of `FrozenGraph.variables`.
+    width : int
+        The number of columns.
+
+    Raises
+    ------
+    ValueError
+        If a variable can't be encoded, e.g. because it lacks bounds,
+        or its hyperparameters depend on other variables.
+
+    Notes
+    -----
+    Values are mapped to `[0, 1]` as `sampling.sample` maps points of
+    the unit interval to values, i.e. through their cumulative
+    distribution function: bounded variables are normalized linearly,
+    or logarithmically with `log_scale` and the log distributions;
+    normal distributions map through their CDF; integers, randint
+    values and ordinal categoricals map to the middle of the interval
+    decoding to them. Values outside a variable's bounds are clipped.
+    """
+    def __init__(self, root, categorical='onehot'):
+        if categorical not in ('onehot', 'ordinal'):
+            raise ValueError("unknown categorical encoding '%s'" %
+                             categorical)
+        graph = root if isinstance(root, FrozenGraph) else FrozenGraph(root)
+        self.graph = graph
+        self.categorical = categorical
+        self.slices = OrderedDict()
+        self._nodes = {}
+        # Options of the one-hot encoded variables.
+        self._options = {}
+        width = 0
+        for name, nodes in graph.variables.iteritems():
+            if not isinstance(name, basestring):
+                raise ValueError("can't encode variables with computed "
+                                 "names")
+            node = self._nodes[name] = nodes[0]
+            n_columns = 1
+            if is_categorical(node):
+                options = list(hyperparameter(node.keywords['value_type'],
+                                              name))
+                if categorical == 'onehot':
+                    self._options[name] = options
+                    n_columns = len(options)
+            else:
+                # Check the specification up front.
+                _untransform(node, [])
+            self.slices[name] = slice(width, width + n_columns)
+            width += n_columns
+        self.width = width
+
+    def encode(self, bindings, fill=0.):
+        """
+        Encode variable bindings.
+
+        Parameters
+        ----------
+        bindings : list of dicts
+            Each maps the names of the active variables of a
+            configuration to their values, as passed to `evaluate`.
+        fill : float, optional
+            The value of the columns of inactive variables, i.e. those
+            missing from a dict. Pass `nan` to tell them apart.
+
+        Returns
+        -------
+        encoded : ndarray, shape (len(bindings), width)
+            One row per configuration.
+
+        Raises
+        ------
+        ValueError
+            If a categorical variable is bound to a value that is not
+            one of its options.
+        """
+        encoded = np.empty((len(bindings), self.width))
+        encoded.fill(fill)
+        for name, columns in self.slices.iteritems():
+            rows = [i for i, b in enumerate(bindings) if name in b]
+            if not rows:
+                continue
+            column = [bindings[i][name] for i in rows]
+            if name in self._options:
+                indices = _option_indices(self._options[name], column, name)
+                block = np.zeros((len(rows), columns.stop - columns.start))
+                block[np.arange(len(rows)), indices] = 1.
+                encoded[rows, columns] = block
+            else:
+                encoded[rows, columns.start] = _untransform(self._nodes[name],
+                                                            column)
+        return encoded
+
+    def decode(self, encoded):
+        """
+        Decode rows of a matrix into variable bindings.
+
+        Parameters
+        ----------
+        encoded : array_like, shape (n, width)
+            Rows as returned by `encode`, or any points of the unit
+            hypercube, e.g. proposed by a model. Values are clipped to
+            `[0, 1]`; a one-hot encoded variable takes the option with
+            the largest column.
+
+        Returns
+        -------
+        bindings : list of dicts
+            Each maps the names of the variables active in a row to
+            their values. Columns of inactive variables are ignored.
+        """
+        encoded = np.clip(np.nan_to_num(np.asarray(encoded, dtype=float)),
+                          0., 1.)
+        if encoded.ndim != 2 or encoded.shape[1] != self.width:
+            raise ValueError("expected an array of shape (n, %d), got %s" %
+                             (self.width, encoded.shape))
+        n = len(encoded)
+        values = OrderedDict()
+        for name, columns in self.slices.iteritems():
+            if name in self._options:
+                indices = encoded[:, columns].argmax(axis=1)
+                values[name] = as_column(self._options[name])[indices]
+            else:
+                values[name] = from_unit_interval(self._nodes[name],
+                                          encoded[:, columns.start])
+        active = active_masks(self.graph, values, n)
+        bindings = [{} for _ in xrange(n)]
+        for name, column in values.iteritems():
+            column = column.tolist()
+            for i in np.flatnonzero(active[name]):
+                bindings[i][name] = column[i]
+        return bindings
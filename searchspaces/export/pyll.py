@@ -24,6 +24,7 @@ from ..partialplus import (is_sequence_of_literals, is_sequence_node,
                            is_pos_args_node, is_variable_node, is_choice_node,
                            is_literal, is_categorical)
 from ..partialplus import topological_sort, Literal
+from ..graph import FrozenGraph
 
 
 def _convert_categorical(pp_var, bindings):
@@ -220,15 +221,22 @@ def as_pyll(root):
 
     Parameters
     ----------
-    root : Node
+    root : Node or FrozenGraph
+        The root of the graph, or a `FrozenGraph` whose cached
+        topological order is then reused.
 
     Returns
     -------
     pyll_root : Apply
         A (graph of) `hyperopt.pyll.Apply` node(s).
     """
+    if isinstance(root, FrozenGraph):
+        nodes = root.topological_sort(reverse=True)
+        root = root.root
+    else:
+        nodes = topological_sort(root, reverse=True)
     bindings = {}
-    for node in reversed(list(topological_sort(root))):
+    for node in nodes:
         if isinstance(node, Literal):
             bindings[node] = _convert_literal(node)
         else:
@@ -4,6 +4,7 @@ import numpy as np
 from searchspaces.partialplus import (
     partial, as_partialplus, evaluate, choice, variable
 )
+from searchspaces.graph import FrozenGraph
 from searchspaces.test_utils import skip_if_no_module
 try:
     from searchspaces.export.pyll import as_pyll
@@ -21,6 +22,14 @@ def test_repeated_node():
     assert p.pos_args[0] is p.pos_args[2].pos_args[0]
 
 
+@skip_if_no_module('hyperopt.pyll')
+def test_frozen_graph():
+    q = as_partialplus([partial(float, 5), 3])
+    g = FrozenGraph(q)
+    assert rec_eval(as_pyll(g)) == rec_eval(as_pyll(q))
+    assert list(rec_eval(as_pyll(g))) == [5.0, 3]
+
+
 def test_randint():
     v = variable('some_random_int', value_type=int, distribution='randint',
                  maximum=5)
@@ -0,0 +1,183 @@
+"""
+Cached structural metadata for `PartialPlus` graphs.
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+__all__ = ["FrozenGraph"]
+
+from array import array
+from collections import Counter, OrderedDict
+
+from .partialplus import (Node, is_literal, is_variable_node,
+                          topological_sort)
+
+
+class FrozenGraph(object):
+    """
+    A graph rooted at a `Node`, with its structure computed once.
+
+    Parameters
+    ----------
+    root : Node
+        The root of the graph.
+
+    Attributes
+    ----------
+    root : Node
+        The root of the graph.
+    nodes : tuple
+        Every node in the graph, in topological order, so that
+        `nodes[0]` is `root`. A node's position in this tuple is its
+        index.
+    index : dict
+        Maps each node to its index in `nodes`.
+
+    Raises
+    ------
+    ValueError
+        If the graph contains a directed cycle.
+
+    Notes
+    -----
+    Adjacency is stored as integer arrays in compressed sparse row
+    form: the children of node `i` are the node indices
+    `child_indices[child_offsets[i]:child_offsets[i + 1]]`, in the
+    order of `nodes[i].inputs()`, and similarly for parents (each
+    parent listed once). Parents, the variable table, per-function
+    counts and variable dependents are computed on first use and then
+    cached.
+
+    The graph must not be modified (e.g. with `append_arg`) once it
+    has been frozen, as the cached structure would then be stale.
+    """
+    def __init__(self, root):
+        assert isinstance(root, Node)
+        self.root = root
+        self.nodes = tuple(topological_sort(root))
+        self.index = dict((node, i) for i, node in enumerate(self.nodes))
+        index = self.index
+        self.child_offsets = array('l', [0])
+        self.child_indices = array('l')
+        for node in self.nodes:
+            self.child_indices.extend(index[c] for c in node.inputs())
+            self.child_offsets.append(len(self.child_indices))
+        self._parent_offsets = None
+        self._parent_indices = None
+        self._variables = None
+        self._func_counts = None
+        self._variable_dependents = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __contains__(self, node):
+        return node in self.index
+
+    def topological_sort(self, reverse=False):
+        """
+        Iterate over the nodes in topological order.
+
+        Parameters
+        ----------
+        reverse : bool, optional
+            If `True`, iterate in reverse topological order (inputs
+            before the nodes that use them, `root` last).
+
+        Returns
+        -------
+        it : iterator
+        """
+        return reversed(self.nodes) if reverse else iter(self.nodes)
+
+    def children(self, i):
+        """Indices of the inputs of the node with index `i`."""
+        return self.child_indices[self.child_offsets[i]:
+                                  self.child_offsets[i + 1]]
+
+    def parents(self, i):
+        """Indices of the nodes that take the node with index `i` as input."""
+        offsets, indices = self.parent_offsets, self.parent_indices
+        return indices[offsets[i]:offsets[i + 1]]
+
+    @property
+    def parent_offsets(self):
+        if self._parent_offsets is None:
+            self._build_parents()
+        return self._parent_offsets
+
+    @property
+    def parent_indices(self):
+        if self._parent_indices is None:
+            self._build_parents()
+        return self._parent_indices
+
+    def _build_parents(self):
+        n = len(self.nodes)
+        # Distinct (parent, child) pairs, by child.
+        edges = set()
+        for i in xrange(n):
+            edges.update((i, c) for c in self.children(i))
+        counts = [0] * n
+        for _, c in edges:
+            counts[c] += 1
+        offsets = array('l', [0] * (n + 1))
+        for i in xrange(n):
+            offsets[i + 1] = offsets[i] + counts[i]
+        indices = array('l', [0] * len(edges))
+        fill = list(offsets[:-1])
+        for p, c in sorted(edges):
+            indices[fill[c]] = p
+            fill[c] += 1
+        self._parent_offsets = offsets
+        self._parent_indices = indices
+
+    @property
+    def variables(self):
+        """
+        An `OrderedDict` mapping each variable name to a tuple of the
+        variable nodes with that name, in topological order. Variables
+        whose names are not literals are keyed by their name node.
+        """
+        if self._variables is None:
+            variables = OrderedDict()
+            for node in self.nodes:
+                if is_variable_node(node):
+                    name = node.keywords['name']
+                    key = name.value if is_literal(name) else name
+                    variables.setdefault(key, []).append(node)
+            self._variables = OrderedDict((k, tuple(v))
+                                          for k, v in variables.iteritems())
+        return self._variables
+
+    @property
+    def func_counts(self):
+        """
+        A `Counter` mapping each `func` to the number of nodes calling
+        it. Literals are counted under `None`.
+        """
+        if self._func_counts is None:
+            self._func_counts = Counter(node.func for node in self.nodes)
+        return self._func_counts
+
+    @property
+    def variable_dependents(self):
+        """
+        A `frozenset` of the nodes whose value depends on a variable:
+        every variable node, together with every node that has one
+        among its transitive inputs. See also
+        `partialplus.variable_dependents`.
+        """
+        if self._variable_dependents is None:
+            depends = [False] * len(self.nodes)
+            # Inputs come before the nodes using them in reverse order.
+            for i in xrange(len(self.nodes) - 1, -1, -1):
+                depends[i] = (is_variable_node(self.nodes[i]) or
+                              any(depends[c] for c in self.children(i)))
+            self._variable_dependents = frozenset(
+                node for node, d in zip(self.nodes, depends) if d)
+        return self._variable_dependents
@@ -0,0 +1,285 @@
+"""
+Lazy enumeration of the grid of values of a discrete search space.
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+__all__ = ["Grid"]
+
+from bisect import bisect_right
+import math
+import operator
+
+from .graph import FrozenGraph
+from .partialplus import (Literal, is_categorical, is_indexable, is_literal,
+                          is_sequence_node, is_variable_node)
+from .variables import hyperparameter
+
+# The scope of the variables evaluated unconditionally.
+_ROOT = None
+
+
+def _options(node):
+    """The values a discrete variable can take, in order."""
+    kw = node.keywords
+    name = kw['name'].value
+    if is_categorical(node):
+        return list(hyperparameter(kw['value_type'], name))
+    kw = dict((k, hyperparameter(v, name)) for k, v in kw.iteritems())
+    distribution = kw['distribution']
+    low, high = kw['minimum'], kw['maximum']
+    if distribution is None and kw['value_type'] is int:
+        if low is None or high is None:
+            raise ValueError("variable '%s' needs a minimum and a maximum "
+                             "to be enumerated" % name)
+        return range(low, high + 1)
+    elif distribution == 'randint':
+        return range(0, high + 1)
+    elif distribution in ('quniform', 'qloguniform') and 'q' in kw:
+        q = kw['q']
+        if distribution == 'qloguniform':
+            low, high = math.exp(low), math.exp(high)
+        values = [k * q for k in xrange(int(round(low / q)),
+                                        int(round(high / q)) + 1)]
+        if kw['value_type'] is int:
+            values = [int(v) for v in values]
+        return values
+    raise ValueError("variable '%s' is continuous and can't be enumerated" %
+                     name)
+
+
+class Grid(object):
+    """
+    The Cartesian product of the values of the variables of a
+    discrete search space, enumerated lazily.
+
+    Parameters
+    ----------
+    root : Node or FrozenGraph
+        The root of the search space. Every variable in it must be
+        discrete: categorical, an `int` with a `minimum` and a
+        `maximum`, or drawn from a `randint`, `quniform` or
+        `qloguniform` distribution.
+
+    Raises
+    ------
+    ValueError
+        If a variable can't be enumerated.
+
+    Notes
+    -----
+    Points of the grid are dicts mapping variable names to values,
+    ready to be passed to `evaluate`. They only hold the variables
+    that are active: a variable used only in one branch of a `choice`
+    (or of another lazily indexed sequence or dict) is only assigned
+    in the points selecting that branch, so inactive branches don't
+    multiply the size of the grid. For instance, a choice between a
+    branch with a 10-valued variable and one with a 3-valued one has
+    13 points, not 20.
+
+    The size of the grid is computed once, and any point can be
+    computed from its index in time proportional to the number of
+    variables, so that the grid can be split among workers with
+    `iter_chunks`. Points are ordered as by `itertools.product`, the
+    last variable varying fastest. Grids can be too large for `len`
+    to report their size on Python 2; the `count` attribute holds it
+    regardless.
+    """
+    def __init__(self, root):
+        graph = root if isinstance(root, FrozenGraph) else FrozenGraph(root)
+        self.options = {}
+        for name, nodes in graph.variables.iteritems():
+            if not isinstance(name, basestring):
+                raise ValueError("can't enumerate variables with computed "
+                                 "names")
+            self.options[name] = _options(nodes[0])
+        occurrences = self._find_scopes(graph)
+        # The branches of a variable's options are scopes nested in the
+        # one the variable is placed in; place variables outermost first.
+        self._placement = {}
+        self._scope_names = {}
+        for name in graph.variables:
+            self._place(name, occurrences)
+        self._counts = {}
+        self._cumulative = {}
+        self.count = self._scope_count(_ROOT)
+
+    def _find_scopes(self, graph):
+        """
+        Map each variable name to the set of scopes it is evaluated in,
+        a scope being `_ROOT` or a `(name, i)` pair for the branch
+        taken when variable `name` has its `i`th option as value.
+        """
+        scopes = {graph.root: frozenset([_ROOT])}
+        occurrences = dict((name, set()) for name in graph.variables)
+
+        def add(node, node_scopes):
+            if node in scopes:
+                scopes[node] = scopes[node] | node_scopes
+            else:
+                scopes[node] = node_scopes
+
+        for node in graph.nodes:
+            node_scopes = scopes.pop(node, None)
+            if node_scopes is None or isinstance(node, Literal):
+                continue
+            if is_variable_node(node):
+                occurrences[node.keywords['name'].value] |= node_scopes
+                continue
+            if (node.func is operator.getitem and is_indexable(node) and
+                    is_variable_node(node.args[1])):
+                obj, index = node.args
+                name = index.keywords['name'].value
+                add(index, node_scopes)
+                if is_sequence_node(obj):
+                    branches = self._sequence_branches(name, obj.args)
+                else:
+                    lookup = {}
+                    for pair in obj.args[1:]:
+                        key, value = pair.args
+                        add(key, node_scopes)
+                        if is_literal(key):
+                            lookup[key.value] = value
+                        else:
+                            # Can't tell which values this key selects.
+                            add(value, node_scopes)
+                    branches = []
+                    for i, option in enumerate(self.options[name]):
+                        try:
+                            branches.append((i, lookup[option]))
+                        except (KeyError, TypeError):
+                            pass
+                for i, value in branches:
+                    add(value, frozenset([(name, i)]))
+            else:
+                for child in node.inputs():
+                    add(child, node_scopes)
+        return occurrences
+
+    def _sequence_branches(self, name, elements):
+        """
+        `(i, element)` pairs for the elements of a sequence selected by
+        each option `i` of the variable `name`, which indexes it.
+        """
+        n = len(elements)
+        branches = []
+        for i, option in enumerate(self.options[name]):
+            if (not isinstance(option, (int, long)) or
+                    not -n <= option < n):
+                raise ValueError("variable '%s' can take the value %r, "
+                                 "which doesn't index a sequence of "
+                                 "length %d" % (name, option, n))
+            branches.append((i, elements[option]))
+        return branches
+
+    def _ancestors(self, scope):
+        """`scope` and the scopes enclosing it, innermost first."""
+        chain = [scope]
+        while scope is not _ROOT:
+            scope = self._placement[scope[0]]
+            chain.append(scope)
+        return chain
+
+    def _place(self, name, occurrences):
+        """
+        Place the variable `name` in the innermost scope enclosing all
+        those it is evaluated in.
+        """
+        if name in self._placement:
+            return
+        for scope in occurrences[name]:
+            if scope is not _ROOT:
+                if scope[0] == name:
+                    raise ValueError("variable '%s' is used in its own "
+                                     "branches" % name)
+                self._place(scope[0], occurrences)
+        if not occurrences[name]:
+            occurrences[name].add(_ROOT)
+        chains = [self._ancestors(s) for s in occurrences[name]]
+        common = set(chains[0]).intersection(*chains[1:])
+        placement = next(s for s in chains[0] if s in common)
+        self._placement[name] = placement
+        self._scope_names.setdefault(placement, []).append(name)
+
+    def _scope_count(self, scope):
+        """The number of points in the grid of `scope`."""
+        count = 1
+        for name in self._scope_names.get(scope, ()):
+            count *= self._variable_count(name)
+        return count
+
+    def _variable_count(self, name):
+        if name not in self._counts:
+            cumulative = [0]
+            for i in xrange(len(self.options[name])):
+                cumulative.append(cumulative[-1] +
+                                  self._scope_count((name, i)))
+            self._cumulative[name] = cumulative
+            self._counts[name] = cumulative[-1]
+        return self._counts[name]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        """
+        The point of the grid with the given index.
+
+        Parameters
+        ----------
+        index : int
+            May be negative, to count from the end.
+
+        Returns
+        -------
+        point : dict
+            Maps the names of the active variables to their values.
+        """
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("grid index out of range")
+        point = {}
+        # Scopes left to fill in, with the index of their point.
+        to_fill = [(_ROOT, index)]
+        while to_fill:
+            scope, index = to_fill.pop()
+            for name in reversed(self._scope_names.get(scope, ())):
+                index, remainder = divmod(index, self._counts[name])
+                cumulative = self._cumulative[name]
+                i = bisect_right(cumulative, remainder) - 1
+                point[name] = self.options[name][i]
+                to_fill.append(((name, i), remainder - cumulative[i]))
+        return point
+
+    def __iter__(self):
+        index = 0
+        while index < self.count:
+            yield self[index]
+            index += 1
+
+    def iter_chunks(self, chunk_size, start=0, stop=None):
+        """
+        Iterate over a range of points of the grid, in lists.
+
+        Parameters
+        ----------
+        chunk_size : int
+            The number of points in each list (except the last).
+        start : int, optional
+            The index of the first point.
+        stop : int, optional
+            One past the index of the last point. Defaults to the size
+            of the grid.
+
+        Returns
+        -------
+        chunks : iterator
+            Lists of at most `chunk_size` points.
+        """
+        stop = self.count if stop is None else min(stop, self.count)
+        while start < stop:
+            end = min(start + chunk_size, stop)
+            yield [self[start + i] for i in xrange(end - start)]
+            start = end
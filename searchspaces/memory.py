@@ -0,0 +1,262 @@
+"""
+Memory-lean evaluation: freeing intermediate values as soon as every
+node using them has been evaluated, and spilling large arrays to
+memory-mapped files under a memory budget.
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+__all__ = ["MemoryManager"]
+
+import operator
+import os
+import sys
+import tempfile
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .partialplus import Literal, Node, is_indexable, is_sequence_node
+
+
+def _spillable(value):
+    """Whether `value` is an array that can be spilled to a file."""
+    return (np is not None and type(value) is np.ndarray and
+            not value.dtype.hasobject and value.nbytes > 0)
+
+
+def _spill(value, directory):
+    """
+    Save the array `value` to a temporary file, and map it back into
+    memory, copy-on-write. The file is removed right away: the mapping
+    keeps its data until it is closed.
+    """
+    fd, path = tempfile.mkstemp(prefix='.spill-', suffix='.npy',
+                                dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, value)
+        return np.load(path, mmap_mode='c')
+    finally:
+        os.remove(path)
+
+
+def _effective_inputs(node):
+    """
+    The nodes whose values the evaluation of `node` reads. A lazily
+    indexed sequence or dict-like is not evaluated itself: its
+    elements (or keys and values) are read by the indexing node.
+    """
+    if node.func is operator.getitem and is_indexable(node):
+        obj, index = node.args
+        if is_sequence_node(obj):
+            return (index,) + obj.args
+        inputs = [index]
+        for pair in obj.args[1:]:
+            inputs.extend(pair.args)
+        return tuple(inputs)
+    return tuple(node.inputs())
+
+
+class MemoryManager(object):
+    """
+    Frees the values of intermediate nodes during an evaluation once
+    every node using them has been evaluated, and measures the memory
+    held by the values retained. Under a memory budget, also spills
+    large arrays to memory-mapped files.
+
+    Pass one to `evaluate` as its `_memory` argument. It can be reused
+    across evaluations; its measurements are those of the last one.
+
+    Parameters
+    ----------
+    pinned : iterable of Nodes, optional
+        Nodes whose values are never freed. The root of the graph
+        evaluated always is.
+    sizeof : callable, optional
+        A function returning the size in bytes of a value. Defaults to
+        `sys.getsizeof`, which does not count the objects a value
+        refers to, but does count the data of NumPy arrays owning it.
+    budget : int, optional
+        A number of bytes. Whenever the values retained take more,
+        NumPy arrays among them are spilled, largest first, until they
+        fit: each is written to a temporary file, and replaced by a
+        copy-on-write memory map of that file, read back from disk
+        without copying as nodes use it. No budget by default.
+    directory : str, optional
+        Where to write spilled arrays. Defaults to the system's
+        temporary directory; a directory on a local disk with room for
+        them is best. The files are removed as soon as they are
+        mapped, and their space freed once the maps are.
+
+    Attributes
+    ----------
+    retained_bytes : int
+        The total size of the values retained at the end of the last
+        evaluation.
+    peak_bytes : int
+        The largest total size of the values retained at any point
+        during the last evaluation.
+    released : int
+        The number of values freed during the last evaluation.
+    spilled : int
+        The number of arrays spilled during the last evaluation.
+    spilled_bytes : int
+        Their total size. Spilled arrays no longer count towards
+        `retained_bytes`: the operating system can evict their pages.
+
+    Notes
+    -----
+    The number of nodes using each node is computed once per root,
+    counting the elements of a lazily indexed sequence (or the keys
+    and values of a dict-like) as used by the indexing node. A value
+    also used by a branch that is not taken is retained until the end
+    of the evaluation. Literals are not counted: the graph holds their
+    values regardless.
+
+    Freed values are no longer in the bindings of the evaluation, so
+    they can't be stored in a `ResultCache`; the two can't be used
+    together.
+
+    Only arrays of exactly the `ndarray` type, not of an object dtype,
+    are spilled, and never the values of pinned nodes or of the root.
+    A value is only spilled once it is computed and the values it
+    made unnecessary are freed, so `peak_bytes` can exceed the budget
+    by the size of a value. Spilling only frees memory if the
+    evaluation holds the last reference to an array; an array that is
+    also part of another value, e.g. of a list, stays in memory.
+    """
+    def __init__(self, pinned=(), sizeof=None, budget=None, directory=None):
+        self.pinned = frozenset(pinned)
+        self.sizeof = sys.getsizeof if sizeof is None else sizeof
+        self.budget = budget
+        self.directory = directory
+        self.retained_bytes = 0
+        self.peak_bytes = 0
+        self.released = 0
+        self.spilled = 0
+        self.spilled_bytes = 0
+        # The root last analyzed, with its consumer counts and inputs.
+        self._structure = None
+
+    def _analyze(self, root):
+        """
+        Map each node evaluated through effective inputs from `root`
+        to the number of distinct nodes using it, and each of those to
+        its effective inputs.
+        """
+        if self._structure is not None and self._structure[0] is root:
+            return self._structure[1:]
+        counts = {}
+        inputs = {}
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node in inputs:
+                continue
+            node_inputs = inputs[node] = tuple(
+                set(c for c in _effective_inputs(node)
+                    if not isinstance(c, Literal)))
+            for child in node_inputs:
+                counts[child] = counts.get(child, 0) + 1
+                if child not in inputs:
+                    stack.append(child)
+        self._structure = (root, counts, inputs)
+        return counts, inputs
+
+    def wrap_bindings(self, root, bindings):
+        """
+        Wrap the initial `bindings` of an evaluation of `root` so that
+        values are freed as they stop being needed.
+        """
+        counts, inputs = self._analyze(root)
+        self.retained_bytes = 0
+        self.peak_bytes = 0
+        self.released = 0
+        self.spilled = 0
+        self.spilled_bytes = 0
+        return _LeanBindings(self, root, counts, inputs, bindings)
+
+
+class _LeanBindings(dict):
+    """
+    The bindings of a single evaluation, dropping the value of a node
+    once the last node using it is bound, and spilling arrays when
+    over budget.
+    """
+    def __init__(self, memory, root, counts, inputs, bindings):
+        dict.__init__(self, bindings)
+        self.memory = memory
+        self.keep = memory.pinned | frozenset([root])
+        self.remaining = dict(counts)
+        self.inputs = inputs
+        # The nodes bound to each distinct value retained, its size,
+        # and the value itself, by id: a lazily indexed node's value is
+        # the selected element's, and is only counted once.
+        self.objects = {}
+        # The entries of `objects` that could be spilled.
+        self.spillable = {}
+        # Nodes evaluated, then freed.
+        self.freed = set()
+
+    def __setitem__(self, node, value):
+        dict.__setitem__(self, node, value)
+        if isinstance(node, Literal) or not isinstance(node, Node):
+            return
+        memory = self.memory
+        entry = self.objects.get(id(value))
+        if entry is None:
+            size = memory.sizeof(value)
+            entry = self.objects[id(value)] = [set([node]), size, value]
+            if memory.budget is not None and _spillable(value):
+                self.spillable[id(value)] = entry
+            memory.retained_bytes += size
+            if memory.retained_bytes > memory.peak_bytes:
+                memory.peak_bytes = memory.retained_bytes
+        else:
+            entry[0].add(node)
+        if node in self.keep:
+            self.spillable.pop(id(value), None)
+        remaining = self.remaining
+        for child in self.inputs.get(node, ()):
+            remaining[child] -= 1
+            if (not remaining[child] and child not in self.keep and
+                    dict.__contains__(self, child)):
+                self.free(child)
+        if (memory.budget is not None and
+                memory.retained_bytes > memory.budget and self.spillable):
+            self.spill()
+
+    def free(self, node):
+        value = dict.pop(self, node)
+        self.freed.add(node)
+        entry = self.objects[id(value)]
+        entry[0].discard(node)
+        if not entry[0]:
+            del self.objects[id(value)]
+            self.spillable.pop(id(value), None)
+            self.memory.retained_bytes -= entry[1]
+        self.memory.released += 1
+
+    def spill(self):
+        """Spill arrays, largest first, until within the budget."""
+        memory = self.memory
+        largest = sorted(self.spillable.values(), key=lambda e: e[1],
+                         reverse=True)
+        for entry in largest:
+            if memory.retained_bytes <= memory.budget:
+                break
+            nodes, size, value = entry
+            del self.spillable[id(value)]
+            del self.objects[id(value)]
+            mapped = _spill(value, memory.directory)
+            for node in nodes:
+                dict.__setitem__(self, node, mapped)
+            # Mapped values take no memory of their own.
+            self.objects[id(mapped)] = [nodes, 0, mapped]
+            memory.retained_bytes -= size
+            memory.spilled += 1
+            memory.spilled_bytes += size
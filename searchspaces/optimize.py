@@ -0,0 +1,208 @@
+"""
+Optimization passes over `PartialPlus` graphs.
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+__all__ = ["optimize", "fold_constants", "eliminate_common_subexpressions",
+           "DEFAULT_PASSES"]
+
+from .partialplus import (Literal, PartialPlus, is_dict_like_node, is_pure,
+                          is_variable_node, topological_sort)
+
+
+def _literal_key(value):
+    """
+    A hashable key identifying a literal value, or `None` if literals
+    holding `value` should never be merged.
+    """
+    # Include the type, so that e.g. 1, 1.0 and True stay distinct, at
+    # every level of tuples and frozensets: (1,) == (1.0,) too.
+    if isinstance(value, (tuple, frozenset)):
+        keys = [_literal_key(v) for v in value]
+        if None in keys:
+            return None
+        if isinstance(value, tuple):
+            return (type(value), tuple(keys))
+        return (type(value), frozenset(keys))
+    if isinstance(value, (float, complex)):
+        # Keep 0.0 and -0.0 apart.
+        key = (type(value), value, repr(value))
+    else:
+        key = (type(value), value)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _rebuild(node, args, keywords):
+    """
+    `node` itself if its inputs are `args` and `keywords`, or else a
+    copy of it taking those inputs.
+    """
+    if (all(a is b for a, b in zip(args, node.args)) and
+            all(keywords[k] is v
+                for k, v in (node._keywords or {}).iteritems())):
+        return node
+    return PartialPlus(node.func, *args, **keywords)
+
+
+def fold_constants(root, pure=is_pure):
+    """
+    Replace calls computable ahead of time with their values.
+
+    Parameters
+    ----------
+    root : Node
+        The root of the graph to optimize. It is not modified.
+    pure : callable, optional
+        Predicate on functions deciding whether calls to a function
+        may be made ahead of time. Defaults to `is_pure`.
+
+    Returns
+    -------
+    new_root : Node
+        The root of an equivalent graph in which every call to a pure
+        function whose inputs are all literals has been replaced with
+        a `Literal` holding its value.
+    n_folded : int
+        The number of calls that were replaced.
+
+    Notes
+    -----
+    Calls are folded bottom-up, so whole literal-only subgraphs fold
+    into a single literal. Variables are never folded, nor is
+    anything among the inputs of a variable, since exporters such as
+    `as_pyll` inspect the structure of those, nor are the key-value
+    pairs of dict-likes, which evaluation indexes lazily. Calls that
+    raise are left in place, to raise when the graph is evaluated.
+    """
+    # Nodes whose structure is inspected, found going down from the
+    # root: everything among the inputs of variables, and the key-value
+    # pairs of dict-likes, which are indexed lazily.
+    under_variables = set()
+    protected = set()
+    for node in topological_sort(root):
+        if node in under_variables or is_variable_node(node):
+            under_variables.update(node.inputs())
+        elif is_dict_like_node(node):
+            protected.update(node.args[1:])
+    protected |= under_variables
+    replacement = {}
+    n_folded = 0
+    for node in topological_sort(root, reverse=True):
+        if isinstance(node, Literal):
+            replacement[node] = node
+            continue
+        args = tuple(replacement[a] for a in node.args)
+        keywords = dict((k, replacement[v])
+                        for k, v in (node._keywords or {}).iteritems())
+        if (node not in protected and not is_variable_node(node) and
+                pure(node.func) and
+                all(isinstance(a, Literal) for a in args) and
+                all(isinstance(v, Literal) for v in keywords.itervalues())):
+            try:
+                value = node.func(*[a.value for a in args],
+                                  **dict((k, v.value)
+                                         for k, v in keywords.iteritems()))
+            except Exception:
+                pass
+            else:
+                replacement[node] = Literal(value)
+                n_folded += 1
+                continue
+        replacement[node] = _rebuild(node, args, keywords)
+    return replacement[root], n_folded
+
+
+def eliminate_common_subexpressions(root, pure=is_pure):
+    """
+    Merge structurally identical subgraphs of a graph.
+
+    Parameters
+    ----------
+    root : Node
+        The root of the graph to optimize. It is not modified.
+    pure : callable, optional
+        Predicate on functions deciding whether two calls to a function
+        with identical inputs may be merged. Defaults to `is_pure`.
+
+    Returns
+    -------
+    new_root : Node
+        The root of an equivalent graph in which no two literals hold
+        equal hashable values of the same type, and no two calls to
+        pure functions have the same (merged) inputs.
+    n_removed : int
+        The number of nodes in the graph of `root` that are not in
+        the graph of `new_root`.
+
+    Notes
+    -----
+    Nodes none of whose inputs were merged are reused rather than
+    copied. Calls to functions that are not pure are never merged, so
+    e.g. two `partial(Foo)` nodes still produce two `Foo` objects.
+    """
+    canonical_literals = {}
+    canonical_calls = {}
+    replacement = {}
+    for node in topological_sort(root, reverse=True):
+        if isinstance(node, Literal):
+            key = _literal_key(node.value)
+            if key is None:
+                replacement[node] = node
+            else:
+                replacement[node] = canonical_literals.setdefault(key, node)
+            continue
+        args = tuple(replacement[a] for a in node.args)
+        keywords = dict((k, replacement[v])
+                        for k, v in (node._keywords or {}).iteritems())
+        key = None
+        if pure(node.func):
+            # Inputs are canonical at this point, so their identities
+            # determine the structure of the whole subgraph.
+            key = (node.func, tuple(id(a) for a in args),
+                   tuple(sorted((k, id(v)) for k, v in keywords.iteritems())))
+            if key in canonical_calls:
+                replacement[node] = canonical_calls[key]
+                continue
+        new = _rebuild(node, args, keywords)
+        if key is not None:
+            canonical_calls[key] = new
+        replacement[node] = new
+    n_removed = (len(replacement) -
+                 len(set(id(n) for n in replacement.itervalues())))
+    return replacement[root], n_removed
+
+
+# Passes run by `optimize` by default. Folding first leaves more
+# literals for the elimination of common subexpressions to merge.
+DEFAULT_PASSES = (fold_constants, eliminate_common_subexpressions)
+
+
+def optimize(root, passes=DEFAULT_PASSES):
+    """
+    Run a sequence of optimization passes over a graph.
+
+    Parameters
+    ----------
+    root : Node
+        The root of the graph to optimize. It is not modified.
+    passes : sequence of callables, optional
+        The passes to run, in order. Each takes the root of a graph
+        and returns the root of an equivalent graph, along with a
+        count of the changes it made, like `fold_constants` and
+        `eliminate_common_subexpressions`. Defaults to
+        `DEFAULT_PASSES`.
+
+    Returns
+    -------
+    new_root : Node
+        The root of the optimized graph.
+    """
+    for optimization in passes:
+        root, _ = optimization(root)
+    return root
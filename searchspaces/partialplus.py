@@ -12,8 +12,19 @@ from collections import deque
 import compiler
 from functools import partial as _partial
 import operator
+import os
+import sys
+import threading
+from thread import get_ident
+import time
 import warnings
 from itertools import izip, repeat
+from Queue import Queue
+
+try:
+    from concurrent.futures import Future
+except ImportError:
+    Future = None
 
 # TODO: support o_len functionality from old Apply nodes
 
@@ -86,7 +97,7 @@ def is_dict_like_node(node):
 
 
 def is_indexable(node):
-    if len(node.args) != 2 or len(node.keywords) > 0:
+    if len(node.args) != 2 or node._keywords:
         return False
     obj, index = node.args
     if is_sequence_node(obj) or is_dict_like_node(obj):
@@ -142,6 +153,57 @@ def call_with_list_of_pos_args(f, *args):
     return f(args)
 
 
+# Functions known to have no side effects and to return values that can be
+# shared between structurally identical calls. Graph optimizations consult
+# this via `is_pure`; add to it with `mark_pure`.
+_pure_functions = set([
+    make_tuple, variable_node, choice_node,
+    operator.add, operator.sub, operator.mul, operator.div,
+    operator.truediv, operator.floordiv, operator.mod, operator.pow,
+    operator.neg, operator.pos, operator.abs, operator.invert,
+    operator.lshift, operator.rshift, operator.and_, operator.or_,
+    operator.xor, operator.lt, operator.le, operator.eq, operator.ne,
+    operator.gt, operator.ge, operator.getitem,
+    abs, bool, complex, divmod, float, hex, int, long, oct, pow, str,
+])
+
+
+def mark_pure(f):
+    """
+    Declare that calls to `f` have no side effects, and that the
+    result of one call may stand in for another with the same inputs.
+
+    Parameters
+    ----------
+    f : callable
+
+    Returns
+    -------
+    f : callable
+        `f` itself, so that this can be used as a decorator.
+    """
+    _pure_functions.add(f)
+    return f
+
+
+def is_pure(f):
+    """
+    Check whether `f` has been declared pure with `mark_pure`.
+
+    Parameters
+    ----------
+    f : callable
+
+    Returns
+    -------
+    pure : bool
+    """
+    try:
+        return f in _pure_functions
+    except TypeError:  # Unhashable callable.
+        return False
+
+
 def partial(f, *args, **kwargs):
     """
     A workalike for `functools.partial` that actually (recursively)
@@ -278,7 +340,7 @@ class UniqueStack(object):
 
 def _traversal_helper(root, build_inverted=False):
     """
-    Helper function for `depth_first_traversal` and `topological_sort`.
+    Helper function for `depth_first_traversal`.
 
     Parameters
     ----------
@@ -323,9 +385,7 @@ def _traversal_helper(root, build_inverted=False):
                 visited[node] = True
             yield node
             if isinstance(node, PartialPlus):
-                children = node.args + (tuple(node.keywords.values())
-                                        if node.keywords is not None else ())
-                to_visit.extend((node, c) for c in children)
+                to_visit.extend((node, c) for c in node.inputs())
         elif build_inverted:
             visited[node].add(parent)
     if build_inverted:
@@ -354,36 +414,57 @@ def depth_first_traversal(root):
     return _traversal_helper(root)
 
 
-def topological_sort(root):
+def topological_sort(root, reverse=False):
     """
     Perform a topological sort of a graph of PartialPlus objects.
 
     Parameters
     ----------
     root : Node
+    reverse : bool, optional
+        If `True`, produce the nodes in reverse topological order,
+        i.e. every node after all of its inputs, ending with `root`.
 
     Returns
     -------
-    gen : generator object
-        A generator producing nodes from the graph, in a topological order.
+    it : iterator
+        An iterator producing nodes from the graph, in a topological
+        order: `root` first, and every node after all nodes that take
+        it as an input.
 
     Raises
     ------
     ValueError
         If the graph contains a directed cycle.
+
+    Notes
+    -----
+    Runs in time linear in the number of nodes and edges (Kahn's
+    algorithm), and builds the ordering once whichever direction is
+    requested.
     """
-    # TODO: make this more efficient and natively support reverse sort
-    # (probably by getting two dictionaries).
-    candidates = deque(_traversal_helper(root, build_inverted=True))
-    dependencies = candidates.pop()
-    visited = set()
-    while candidates:
-        proposed = candidates.popleft()
-        if dependencies[proposed].difference(visited):
-            candidates.append(proposed)
-        else:
-            visited.add(proposed)
-            yield proposed
+    assert isinstance(root, Node)
+    # Count, for every node, the number of edges coming from its parents.
+    # Edges are counted with multiplicity, e.g. twice for `x` in `x + x`.
+    n_parents = {root: 0}
+    to_visit = [root]
+    while to_visit:
+        for child in to_visit.pop().inputs():
+            if child in n_parents:
+                n_parents[child] += 1
+            else:
+                n_parents[child] = 1
+                to_visit.append(child)
+    # Emit a node once all edges from its parents have been emitted.
+    order = [root] if n_parents[root] == 0 else []
+    for node in order:  # Grows as we go.
+        for child in node.inputs():
+            n_parents[child] -= 1
+            if n_parents[child] == 0:
+                order.append(child)
+    if len(order) != len(n_parents):
+        raise ValueError("call graph contains a directed cycle")
+    return reversed(order) if reverse else iter(order)
 
 
 class MissingArgument(object):
@@ -492,7 +573,7 @@ def _param_assignment(pp):
     fn = pp.func
     code = fn.__code__
     pos_args = pp.args
-    named_args = {} if pp.keywords is None else pp.keywords
+    named_args = pp._keywords or {}
     params, args_param, kwargs_param = _extract_param_names(fn)
 
     if len(pos_args) > code.co_argcount and not args_param:
@@ -525,19 +606,21 @@ def _param_assignment(pp):
 
 
 class Node(object):
+    # No per-instance __dict__; subclasses declare their own slots.
+    __slots__ = ('__weakref__',)
+
     def clone(self):
         bindings = {}
-        nodes = reversed(list(topological_sort(self)))
-        for node in nodes:
+        for node in topological_sort(self, reverse=True):
             if isinstance(node, Literal):
                 bindings[node] = Literal(node.value)
             else:  # PartialPlus
                 func = node.func
                 args = [bindings[a] for a in node.args]
                 keywords = dict((k, bindings[v])
-                                for k, v in node.keywords.iteritems())
+                                for k, v in (node._keywords or {}).iteritems())
                 bindings[node] = PartialPlus(func, *args, **keywords)
-        return bindings[nodes[-1]]
+        return bindings[self]
 
     def inputs(self):
         return ()
@@ -547,11 +630,18 @@ class Literal(Node):
     func = None
     args = None
     keywords = None
-    __slots__ = ['value']
+    __slots__ = ('_value',)
 
     def __init__(self, value):
         self._value = value
 
+    @property
+    def value(self):
+        return self._value
+
+    def __reduce__(self):
+        return (Literal, (self.value,))
+
     def __gt__(self, other):
         if not hasattr(other, 'value'):
             return False
@@ -567,30 +657,73 @@ class Literal(Node):
             return False
         return self.value == other.value
 
-    @property
-    def value(self):
-        return self._value
+
+class _PendingKeywords(dict):
+    """
+    Empty keywords of a `PartialPlus` without any, which becomes the
+    node's keywords on the first write.
+    """
+    __slots__ = ('_node',)
+
+    def __init__(self, node):
+        dict.__init__(self)
+        self._node = node
+
+    def _attach(self):
+        if self._node is not None:
+            if self._node._keywords is None:
+                self._node._keywords = self
+            self._node = None
+
+    def __setitem__(self, key, value):
+        self._attach()
+        dict.__setitem__(self, key, value)
+
+    def setdefault(self, key, default=None):
+        self._attach()
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        self._attach()
+        dict.update(self, *args, **kwargs)
+
+
+def _rebuild_partialplus(func, args, keywords):
+    """Unpickling helper for `PartialPlus`."""
+    return PartialPlus(func, *args, **keywords)
 
 
-class PartialPlus(_partial, Node):
+class PartialPlus(Node):
     """
-    A subclass of `functools.partial` that allows for
+    A workalike for `functools.partial` that allows for
     common arithmetic/builtin operations to be performed
     on them, deferred by wrapping in another object of
-    this same type. Also overrides `__call__` to suggest
+    this same type. Calling one raises, to suggest
     you use the recursive version, `evaluate`.
 
     Notable exceptions *not* implemented include __len__ and
     __iter__, because returning non-integer/iterator stuff
     from those methods tends to break things.
+
+    Notes
+    -----
+    Instances only hold the function, the tuple of positional
+    arguments and, if there are any, the dictionary of keyword
+    arguments, all in slots. `args` and `keywords` values are expected
+    to be `Node` instances, as produced by `as_partialplus`.
     """
+    __slots__ = ('func', 'args', '_keywords')
 
     def __init__(self, f, *args, **kwargs):
-        assert all(isinstance(a, Node) for a in args)
-        assert all(isinstance(v, Node) for k, v in kwargs.iteritems())
-        super(PartialPlus, self).__init__(self, f, *args, **kwargs)
-        self._keywords = kwargs
-        self._args = args
+        self.func = f
+        self.args = args
+        # Most nodes have no keyword arguments; don't keep an empty
+        # dictionary around for each of them.
+        self._keywords = kwargs if kwargs else None
+
+    def __reduce__(self):
+        return (_rebuild_partialplus,
+                (self.func, self.args, self._keywords or {}))
 
     def __call__(self, *args, **kwargs):
         raise TypeError("use evaluate() for %s objects" %
@@ -692,8 +825,8 @@ class PartialPlus(_partial, Node):
 
     def inputs(self):
         # TODO: make this a property
-        return self.args + (tuple(self.keywords.itervalues())
-                            if self.keywords is not None else ())
+        return (self.args + tuple(self._keywords.itervalues())
+                if self._keywords else self.args)
 
     @property
     def arg(self):
@@ -705,20 +838,16 @@ class PartialPlus(_partial, Node):
         """
         Overwrite the default keywords attribute to always have a dictionary
         in that spot rather than None sometimes, which makes for a lot of
-        annoying special cases.
+        annoying special cases. Nodes constructed without keyword
+        arguments hand out an empty dictionary that is only attached to
+        them once something is stored in it.
         """
+        if self._keywords is None:
+            return _PendingKeywords(self)
         return self._keywords
 
-    @property
-    def args(self):
-        """
-        Overwrite the default args attribute so that we have more control
-        over it, and can thereby append arguments.
-        """
-        return self._args
-
     def append_arg(self, arg):
-        self._args = self._args + (arg,)
+        self.args = self.args + (arg,)
 
 
 def variable(name, value_type, minimum=None, maximum=None, default=None,
@@ -759,7 +888,8 @@ def variable(name, value_type, minimum=None, maximum=None, default=None,
     return partial(variable_node, **d)
 
 
-def evaluate(p, **kwargs):
+def evaluate(p, _executor=None, _cache=None, _profiler=None, _memory=None,
+             **kwargs):
     """
     Evaluate a nested tree of functools.partial objects,
     used for deferred evaluation.
@@ -767,50 +897,422 @@ def evaluate(p, **kwargs):
     Parameters
     ----------
     p : object
+    _executor : object, optional
+        A `concurrent.futures` executor (e.g. a thread or process
+        pool). If given, each call is submitted to it as soon as its
+        inputs are available, so independent subgraphs are evaluated
+        concurrently. See `_evaluate_parallel`.
+    _cache : ResultCache, optional
+        A `searchspaces.cache.ResultCache` holding node values from
+        earlier evaluations. Nodes whose values are in it are not
+        evaluated again, and the values computed here are added.
+    _profiler : Profiler, optional
+        A `searchspaces.profiling.Profiler` recording the time taken
+        by each call, and the size of its result. Without one, calls
+        are made directly, at no extra cost.
+    _memory : MemoryManager, optional
+        A `searchspaces.memory.MemoryManager`. If given, the values of
+        intermediate nodes are freed as soon as every node using them
+        has been evaluated, rather than once the evaluation is done,
+        and the memory they take is measured.
 
+    Notes
+    -----
+    Any other keyword argument binds the variable of that name. The
+    options above are prefixed with an underscore so as not to take
+    the names of variables.
+    """
+    bindings = _wrap_bindings(p, _cache, _memory, kwargs)
+    try:
+        if _executor is not None:
+            return _evaluate_parallel(p, _executor, bindings=bindings,
+                                      profiler=_profiler)
+        return _evaluate(p, bindings=bindings, profiler=_profiler)
+    finally:
+        if _profiler is not None and isinstance(p, Node):
+            _profiler.evaluated(p, bindings)
+        if _cache is not None and bindings is not kwargs:
+            _cache.store(bindings)
+
+
+def iter_evaluate(p, _executor=None, _cache=None, _profiler=None,
+                  _memory=None, **kwargs):
     """
-    return _evaluate(p, bindings=kwargs)
+    Evaluate a graph, yielding the value of each node as soon as it
+    is computed.
 
+    Parameters
+    ----------
+    p : Node
+        The root of the graph to evaluate.
+    _executor, _cache, _profiler, _memory : optional
+        See `evaluate`. Other keyword arguments bind variables.
 
-def _handle_indexing(p, instantiate_call, bindings, recurse):
-    # Assumes is_indexable has already returned True.
-    obj, index = p.args
-    index_val = recurse(index)
-    if is_sequence_node(obj):
-        elem_val = obj.args[index_val]
-        if isinstance(index_val, slice):  # TODO: something more robust?
-            # elem_val is a sliced out sublist, recurse on each element
-            # therein and call obj.func (make_list, make_tuple) on result.
-            elem_val = instantiate_call(obj.func,
-                                        *[recurse(e) for e in elem_val])
-        else:
-            elem_val = recurse(elem_val)
+    Returns
+    -------
+    results : iterator
+        `(node, value)` pairs, in the order the nodes were evaluated,
+        ending with the root. Literals, and nodes whose values were
+        found in `_cache`, are not included.
+
+    Notes
+    -----
+    The same nodes are evaluated as by `evaluate`, including the lazy
+    evaluation of indexed sequences and dict-likes, but in dataflow
+    order: without an executor, calls are made in the calling thread
+    as the iterator is advanced, and with one, they are submitted as
+    soon as their inputs are available, and yielded as they complete.
+    Work stops as soon as iteration does. Closing the iterator (or
+    letting it be garbage collected) cancels the calls submitted to
+    `_executor` that have not started, and none are submitted
+    afterwards.
+    """
+    bindings = _wrap_bindings(p, _cache, _memory, kwargs)
+    try:
+        for result in _iter_dataflow(p, _executor, bindings=bindings,
+                                     profiler=_profiler):
+            yield result
+    finally:
+        if _profiler is not None and isinstance(p, Node):
+            _profiler.evaluated(p, bindings)
+        if _cache is not None and bindings is not kwargs:
+            _cache.store(bindings)
+
+
+def evaluate_async(p, _executor=None, _cache=None, _profiler=None,
+                   _memory=None, **kwargs):
+    """
+    Evaluate a graph in a background thread, without blocking on the
+    futures returned by its calls.
+
+    Parameters
+    ----------
+    p : Node
+        The root of the graph to evaluate.
+    _executor : object, optional
+        A `concurrent.futures` executor. If given, calls are submitted
+        to it as by `evaluate`; otherwise they are made one at a time
+        in the background thread.
+    _cache, _profiler, _memory : optional
+        See `evaluate`. Other keyword arguments bind variables.
+
+    Returns
+    -------
+    result : concurrent.futures.Future
+        The future value of `p`, or of the exception raised while
+        evaluating it.
+
+    Notes
+    -----
+    A call may return a `concurrent.futures.Future`, such as a read
+    submitted to an I/O thread pool, rather than a value: its node is
+    bound to the future's result once it is done, and the evaluation
+    of nodes that do not depend on it carries on in the meantime. The
+    latency of a graph of such calls is then that of its slowest
+    chain rather than the sum of all of them, even without an
+    executor. Since the result is itself a future, the evaluation of
+    one graph can be a call in another. `evaluate` binds such nodes to
+    the futures themselves.
+
+    Futures are waited for in dataflow order, as with an executor; see
+    `_evaluate_parallel`. If the evaluation fails, the futures it was
+    waiting for are cancelled where they have not started. The
+    background thread is a daemon thread: it doesn't keep the
+    interpreter running once the main thread exits.
+    """
+    if Future is None:
+        raise ImportError("evaluate_async requires concurrent.futures "
+                          "(the futures package on Python 2)")
+    bindings = _wrap_bindings(p, _cache, _memory, kwargs)
+    result = Future()
+
+    def run():
+        if not result.set_running_or_notify_cancel():
+            return
         try:
-            # bindings the value of this subexpression as
-            int(index_val)
-            bindings[p] = elem_val
-        except TypeError:
-            # TODO: is this even conceivably used?
-            bindings[p] = instantiate_call(p.func, elem_val, index_val)
-    else:  # assumes is_dict_like_node(obj) is True
-        assert obj.func == call_with_list_of_pos_args
-        assert all(is_tuple_node(node) and len(node.args) == 2
-                   for node in obj.args[1:])
-        # TODO: check length better when output-length annotation is supported.
-        keys, values = zip(*(node.args for node in obj.args[1:]))
-        # We could only evaluate as many keys as it takes to find the right
-        # one, but this might make what gets evaluated or not kind of hard
-        # to predict.
-        keys = [recurse(k) for k in keys]
+            try:
+                value = _evaluate_parallel(p, _executor,
+                                           bindings=bindings,
+                                           profiler=_profiler,
+                                           await_futures=True)
+            finally:
+                if _profiler is not None and isinstance(p, Node):
+                    _profiler.evaluated(p, bindings)
+                if _cache is not None and bindings is not kwargs:
+                    _cache.store(bindings)
+        except BaseException:
+            # Even KeyboardInterrupt and SystemExit: they would only end
+            # this thread, leaving `result` pending forever.
+            result.set_exception_info(*sys.exc_info()[1:])
+        else:
+            result.set_result(value)
+
+    # A daemon thread, so that pending evaluations don't keep the
+    # interpreter from exiting.
+    thread = threading.Thread(target=run, name='evaluate_async')
+    thread.daemon = True
+    thread.start()
+    return result
+
+
+def _wrap_bindings(p, cache, memory, bindings):
+    """
+    Wrap the initial `bindings` of an evaluation of `p` for `cache` or
+    `memory`, whichever is given.
+    """
+    if cache is not None and memory is not None:
+        raise ValueError("_cache and _memory can't be used together")
+    if not isinstance(p, Node):
+        return bindings
+    if cache is not None:
+        return cache.wrap_bindings(p, bindings)
+    if memory is not None:
+        return memory.wrap_bindings(p, bindings)
+    return bindings
+
+
+def variable_dependents(root):
+    """
+    Find the nodes in a graph whose value depends on a variable.
+
+    Parameters
+    ----------
+    root : Node
+
+    Returns
+    -------
+    dependents : set
+        The set of variable nodes reachable from `root`, together with
+        every node that has one of them among its transitive inputs.
+    """
+    parents = deque(_traversal_helper(root, build_inverted=True)).pop()
+    to_visit = [node for node in parents if is_variable_node(node)]
+    dependents = set(to_visit)
+    while to_visit:
+        for parent in parents[to_visit.pop()]:
+            if parent not in dependents:
+                dependents.add(parent)
+                to_visit.append(parent)
+    return dependents
+
+
+def evaluate_batch(p, bindings_list, instantiate_call=None):
+    """
+    Evaluate a graph once for each of several variable assignments.
+
+    Parameters
+    ----------
+    p : object
+        The root of the graph to evaluate.
+    bindings_list : list of dicts, or dict
+        Either a list of dictionaries mapping variable names to values,
+        one per configuration, or a "columnar" dictionary mapping each
+        variable name to a sequence of values, all of the same length.
+    instantiate_call : callable, optional
+        See `_evaluate`.
+
+    Returns
+    -------
+    results : list
+        The value of `evaluate(p, **bindings)` for each configuration,
+        in order.
+
+    Notes
+    -----
+    Nodes that do not depend on any variable are evaluated at most
+    once for the whole batch, and their values are shared between
+    configurations. Only variable-dependent nodes are evaluated for
+    each configuration.
+    """
+    if isinstance(bindings_list, dict):
+        names = list(bindings_list)
+        columns = [bindings_list[name] for name in names]
+        if len(set(len(c) for c in columns)) > 1:
+            raise ValueError("columns of bindings_list differ in length")
+        bindings_list = [dict(izip(names, values))
+                         for values in izip(*columns)]
+    dependents = variable_dependents(p)
+    # Variable-independent nodes not computed yet. Those in lazily
+    # indexed branches may only be needed by some configurations.
+    pending = set(node for node in depth_first_traversal(p)
+                  if node not in dependents and
+                  not isinstance(node, Literal))
+    shared = {}
+    results = []
+    for kwargs in bindings_list:
+        bindings = _LayeredBindings(shared, kwargs)
+        results.append(_evaluate(p, instantiate_call, bindings))
+        # Only the values computed for this configuration are looked
+        # at, not the shared ones.
+        for node, value in bindings.iteritems():
+            if node in pending:
+                shared[node] = value
+                pending.discard(node)
+    return results
+
+
+class _LayeredBindings(dict):
+    """
+    The bindings of one evaluation of a batch, holding the values
+    computed for it, and reading through to the values shared by the
+    whole batch without copying them.
+    """
+    def __init__(self, shared, bindings):
+        dict.__init__(self, bindings)
+        self.shared = shared
+
+    def __contains__(self, node):
+        return dict.__contains__(self, node) or node in self.shared
+
+    def __getitem__(self, node):
         try:
-            ind = keys.index(index_val)
-        except ValueError:
-            raise KeyError(index_val)
-        bindings[p] = recurse(values[ind])
-    return bindings[p]
+            return dict.__getitem__(self, node)
+        except KeyError:
+            return self.shared[node]
 
 
-def _evaluate(p, instantiate_call=None, bindings=None):
+def _same_value(a, b):
+    """
+    Conservatively decide whether two variable values are the same, i.e.
+    whether nodes computed from `a` can be reused for `b`.
+    """
+    if a is b:
+        return True
+    if type(a) is not type(b):
+        return False
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        # e.g. NumPy arrays, whose truth value is ambiguous.
+        return False
+
+
+class EvaluationSession(object):
+    """
+    Evaluate a graph repeatedly, reusing node values across calls.
+
+    Parameters
+    ----------
+    root : Node
+        The root of the graph to evaluate.
+    instantiate_call : callable, optional
+        See `_evaluate`.
+
+    Notes
+    -----
+    The session keeps the `bindings` cache from one call to `evaluate`
+    to the next. When some variables change value, only the nodes
+    downstream of the corresponding variable nodes are invalidated and
+    recomputed; everything else is returned as previously computed
+    (the same objects, not copies).
+    """
+    def __init__(self, root, instantiate_call=None):
+        self.root = root
+        self.instantiate_call = instantiate_call
+        self._parents = deque(_traversal_helper(root,
+                                                build_inverted=True)).pop()
+        # Variable nodes keyed by name. Those with computed names are
+        # invalidated whenever anything changes.
+        self._variables = {}
+        self._computed_name_variables = []
+        for node in self._parents:
+            if not is_variable_node(node):
+                continue
+            name = node.keywords['name']
+            if is_literal(name):
+                self._variables.setdefault(name.value, []).append(node)
+            else:
+                self._computed_name_variables.append(node)
+        self._bindings = None
+        self._values = None
+        self.n_invalidated = 0
+
+    def reset(self):
+        """Discard all cached node values."""
+        self._bindings = None
+        self._values = None
+
+    def _invalidate(self, names):
+        """
+        Remove the cached values of all nodes downstream of the
+        variables named in `names`. Returns the number removed.
+        """
+        to_visit = list(self._computed_name_variables)
+        for name in names:
+            to_visit.extend(self._variables.get(name, ()))
+        dirty = set(to_visit)
+        while to_visit:
+            for parent in self._parents[to_visit.pop()]:
+                if parent not in dirty:
+                    dirty.add(parent)
+                    to_visit.append(parent)
+        bindings = self._bindings
+        for node in dirty:
+            bindings.pop(node, None)
+        return len(dirty)
+
+    def evaluate(self, **kwargs):
+        """
+        Evaluate the graph with the given variable bindings.
+
+        Parameters
+        ----------
+        kwargs : dict
+            Values for the variables in the graph, keyed by name.
+
+        Returns
+        -------
+        q : object
+            The same value `evaluate(self.root, **kwargs)` would return.
+
+        Notes
+        -----
+        `n_invalidated` is set to the number of nodes invalidated by
+        this call, or `None` if there were no cached values.
+        """
+        if self._bindings is None:
+            self._bindings = dict(kwargs)
+            self.n_invalidated = None
+        else:
+            old = self._values
+            changed = [name for name in set(old) | set(kwargs)
+                       if name not in old or name not in kwargs or
+                       not _same_value(old[name], kwargs[name])]
+            self.n_invalidated = (self._invalidate(changed)
+                                  if changed else 0)
+            for name in old:
+                del self._bindings[name]
+            self._bindings.update(kwargs)
+        self._values = dict(kwargs)
+        return _evaluate(self.root, self.instantiate_call, self._bindings)
+
+
+# Actions for the explicit work stack used by `_evaluate`. Each frame on
+# the stack is an `(action, node, data)` triple.
+_VISIT = 0        # Evaluate `node` unless it is already bound.
+_CALL = 1         # All inputs of `node` are bound; apply `node.func`.
+_INDEX = 2        # The index of a lazy getitem `node` is bound.
+_INDEX_DONE = 3   # The selected sequence element(s) of `node` are bound.
+_DICT_KEYS = 4    # The keys of the dict-like indexed by `node` are bound.
+_DICT_DONE = 5    # The selected dict-like value of `node` is bound.
+
+
+def _apply(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+def _timed_call(instantiate_call, func, args, kwargs):
+    """
+    Call `instantiate_call(func, *args, **kwargs)`, returning its
+    result and a tuple of the wall-clock time it took, the time it
+    started, and the IDs of the process and thread it ran in.
+    """
+    start = time.time()
+    value = instantiate_call(func, *args, **kwargs)
+    return value, (time.time() - start, start, os.getpid(), get_ident())
+
+
+def _evaluate(p, instantiate_call=None, bindings=None, profiler=None):
     """
     Evaluate a nested tree of functools.partial objects,
     used for deferred evaluation.
@@ -826,6 +1328,11 @@ def _evaluate(p, instantiate_call=None, bindings=None):
     bindings : dict, optional
         A dictionary mapping `Node` objects to values to use
         in their stead. Used to cache objects already evaluated.
+    profiler : object, optional
+        If given, each call of a node's `func` is timed, and reported
+        with `profiler.record(node, value, seconds, start, pid, tid)`:
+        its result, the time it took, the time it started, and the
+        IDs of the process and thread it ran in.
 
     Returns
     -------
@@ -833,46 +1340,405 @@ def _evaluate(p, instantiate_call=None, bindings=None):
         The result of evaluating `p` if `p` was a partial
         instance, or else `p` itself.
 
+    Raises
+    ------
+    ValueError
+        If the graph contains a directed cycle.
+
     Notes
     -----
-    For large graphs this recursive implementation may hit the
-    recursion limit and be kind of slow. TODO: write an
-    iterative version.
+    The graph is walked with an explicit work stack rather than by
+    recursion, so arbitrarily deep graphs can be evaluated without
+    hitting the interpreter's recursion limit. Nodes are evaluated in
+    the same depth-first, left-to-right order a recursive evaluation
+    would use.
     """
-    instantiate_call = ((lambda f, *args, **kwargs: f(*args, **kwargs))
-                        if instantiate_call is None else instantiate_call)
+    # Skip the extra indirection when no `instantiate_call` is given.
+    direct_call = instantiate_call is None and profiler is None
+    instantiate_call = (_apply if instantiate_call is None
+                        else instantiate_call)
+    if profiler is None:
+        def call_node(node, func, args, kwargs):
+            return instantiate_call(func, *args, **kwargs)
+    else:
+        def call_node(node, func, args, kwargs):
+            value, timing = _timed_call(instantiate_call, func, args, kwargs)
+            profiler.record(node, value, *timing)
+            return value
     bindings = {} if bindings is None else bindings
 
     # If we've encountered this exact partial node before,
-    # short-circuit the evaluation of this branch and return
-    # the pre-computed value.
+    # short-circuit the evaluation and return the pre-computed value.
     if p in bindings:
         return bindings[p]
-    if isinstance(p, Literal):
-        bindings[p] = p.value
-        return bindings[p]
+    # Nodes whose evaluation has started but not finished, i.e. the
+    # current path from the root. Seeing one again means a cycle.
+    active = set()
+    stack = [(_VISIT, p, None)]
+    push = stack.append
+    pop = stack.pop
+    while stack:
+        action, node, data = pop()
+        if action == _VISIT:
+            if node in bindings:
+                continue
+            if isinstance(node, Literal):
+                bindings[node] = node.value
+                continue
+            if node in active:
+                raise ValueError("call graph contains a directed cycle")
+            active.add(node)
+            # When evaluating an expression of the form
+            # `list(...)[item]`
+            # only evaluate the element(s) of the list that we need.
+            if node.func is operator.getitem and is_indexable(node):
+                push((_INDEX, node, None))
+                push((_VISIT, node.args[1], None))
+                continue
+            args = node.args
+            keywords = node._keywords
+            push((_CALL, node, (args, keywords)))
+            # Push in reverse so that inputs are evaluated in order.
+            # Literals have no side effects, so bind them right away
+            # rather than spending a stack frame on each.
+            children = (args + tuple(keywords.itervalues())
+                        if keywords else args)
+            for child in reversed(children):
+                if child in bindings:
+                    continue
+                elif isinstance(child, Literal):
+                    bindings[child] = child.value
+                else:
+                    push((_VISIT, child, None))
+        elif action == _CALL:
+            active.remove(node)
+            args, keywords = data
+            args = [bindings[arg] for arg in args]
+            func = node.func
+            if keywords:
+                kw = dict((k, bindings[v]) for k, v in keywords.iteritems())
+                if func is variable_node:
+                    assert 'name' in kw
+                    name = kw['name']
+                    try:
+                        bindings[node] = bindings[name]
+                    except KeyError:
+                        raise KeyError("variable with name '%s' not bound" %
+                                       name)
+                elif direct_call:
+                    bindings[node] = func(*args, **kw)
+                else:
+                    bindings[node] = call_node(node, func, args, kw)
+            elif direct_call:
+                bindings[node] = func(*args)
+            else:
+                bindings[node] = call_node(node, func, args, {})
+        elif action == _INDEX:
+            obj, index = node.args
+            index_val = bindings[index]
+            if is_sequence_node(obj):
+                elem = obj.args[index_val]
+                push((_INDEX_DONE, node, (elem, index_val)))
+                # TODO: something more robust?
+                if isinstance(index_val, slice):
+                    # elem is a sliced out sublist, evaluate each element
+                    # therein and call obj.func (make_list, make_tuple) on
+                    # the result.
+                    stack.extend((_VISIT, e, None) for e in reversed(elem))
+                else:
+                    push((_VISIT, elem, None))
+            else:  # assumes is_dict_like_node(obj) is True
+                assert obj.func == call_with_list_of_pos_args
+                assert all(is_tuple_node(n) and len(n.args) == 2
+                           for n in obj.args[1:])
+                # TODO: check length better when output-length annotation
+                # is supported.
+                keys, values = zip(*(n.args for n in obj.args[1:]))
+                # We could only evaluate as many keys as it takes to find
+                # the right one, but this might make what gets evaluated or
+                # not kind of hard to predict.
+                push((_DICT_KEYS, node, (keys, values, index_val)))
+                stack.extend((_VISIT, k, None) for k in reversed(keys))
+        elif action == _INDEX_DONE:
+            elem, index_val = data
+            if isinstance(index_val, slice):
+                elem_val = instantiate_call(node.args[0].func,
+                                            *[bindings[e] for e in elem])
+            else:
+                elem_val = bindings[elem]
+            try:
+                # bindings the value of this subexpression as
+                int(index_val)
+                bindings[node] = elem_val
+            except TypeError:
+                # Reached for slices: re-apply the slice to the result.
+                bindings[node] = instantiate_call(node.func, elem_val,
+                                                  index_val)
+            active.remove(node)
+        elif action == _DICT_KEYS:
+            keys, values, index_val = data
+            keys = [bindings[k] for k in keys]
+            try:
+                ind = keys.index(index_val)
+            except ValueError:
+                raise KeyError(index_val)
+            push((_DICT_DONE, node, values[ind]))
+            push((_VISIT, values[ind], None))
+        else:  # action == _DICT_DONE
+            bindings[node] = bindings[data]
+            active.remove(node)
+    return bindings[p]
 
-    recurse = _partial(_evaluate, instantiate_call=instantiate_call,
-                       bindings=bindings)
-
-    # When evaluating an expression of the form
-    # `list(...)[item]`
-    # only evaluate the element(s) of the list that we need.
-    if p.func == operator.getitem and is_indexable(p):
-        return _handle_indexing(p, instantiate_call, bindings, recurse)
-    args = [recurse(arg) for arg in p.args]
-    kw = (dict((kw, recurse(val)) for kw, val in p.keywords.iteritems())
-          if p.keywords else {})
-
-    if is_variable_node(p):
-        assert 'name' in p.keywords
-        name = kw['name']
-        try:
-            return bindings[name]
-        except KeyError:
-            raise KeyError("variable with name '%s' not bound" % name)
 
-    # bindings the evaluated value (for subsequent calls that
-    # will look at this bindings dictionary) and return.
-    bindings[p] = instantiate_call(p.func, *args, **kw)
+# Calls that only assemble containers; cheap enough that shipping them
+# (and their possibly large inputs) to an executor would cost more.
+_INLINE_FUNCS = frozenset([make_list, make_tuple, call_with_list_of_pos_args,
+                           operator.getitem])
+
+
+def _evaluate_parallel(p, executor, instantiate_call=None, bindings=None,
+                       profiler=None, await_futures=False):
+    """
+    Evaluate a graph, submitting calls to an executor as soon as their
+    inputs are available.
+
+    Parameters
+    ----------
+    p : Node
+        The root of the graph to evaluate.
+    executor : object
+        An object with the `submit` method of a
+        `concurrent.futures.Executor`, returning futures that support
+        `add_done_callback` and `result`. If `None`, every call is
+        made in the calling thread.
+    instantiate_call : callable, optional
+        Rather than submit `node.func` to the executor, instead submit
+        `instantiate_call(node.func, ...)`.
+    bindings : dict, optional
+        A dictionary mapping `Node` objects to values to use
+        in their stead. Used to cache objects already evaluated.
+    profiler : object, optional
+        See `_evaluate`. Calls submitted to `executor` are timed where
+        they run, and recorded in the calling thread once done.
+    await_futures : bool, optional
+        If `True`, a call returning a `concurrent.futures.Future` is
+        bound to its result once it is done, and the evaluation of
+        other nodes proceeds in the meantime.
+
+    Returns
+    -------
+    q : object
+        The result of evaluating `p`.
+
+    Raises
+    ------
+    ValueError
+        If the graph contains a directed cycle.
+
+    Notes
+    -----
+    The same nodes are evaluated as by `_evaluate`, including the lazy
+    evaluation of indexed sequences and dict-likes, but in dataflow
+    order rather than depth-first order, so wall-clock time is bounded
+    by the critical path of the graph rather than its total cost.
+    Variables and the calls that build containers are evaluated in the
+    calling thread; everything else is submitted to `executor`, which
+    must be able to pickle the functions and values involved if it is
+    a process pool. If a call raises, the exception is propagated and
+    calls not yet started are cancelled.
+    """
+    bindings = {} if bindings is None else bindings
+    if isinstance(p, Literal) and p not in bindings:
+        return p.value
+    for _ in _iter_dataflow(p, executor, instantiate_call, bindings,
+                            profiler, await_futures):
+        pass
     return bindings[p]
+
+
+def _iter_dataflow(p, executor, instantiate_call=None, bindings=None,
+                   profiler=None, await_futures=False):
+    """
+    Evaluate a graph in dataflow order, yielding `(node, value)` for
+    each node as soon as it is bound.
+
+    Parameters
+    ----------
+    p : Node
+        The root of the graph to evaluate.
+    executor : object or None
+        See `_evaluate_parallel`.
+    instantiate_call, bindings, profiler, await_futures : optional
+        See `_evaluate_parallel`.
+
+    Notes
+    -----
+    Literals are bound without being yielded. Work only progresses
+    while the generator is iterated over: no new call starts between
+    two steps, and closing the generator cancels the calls submitted
+    to `executor` that have not started.
+    """
+    bindings = {} if bindings is None else bindings
+    if p in bindings:
+        yield p, bindings[p]
+        return
+    if isinstance(p, Literal):
+        bindings[p] = p.value
+        return
+    # Calls completed by the executor, reported from its threads.
+    done = Queue()
+    # For each node demanded but not yet bound: the action to take once
+    # the inputs of its current stage are bound, how many of them are
+    # still unbound, and the nodes whose current stage is waiting on it.
+    stage = {}
+    n_unbound = {}
+    dependents = {p: []}
+    unstarted = [p]
+    ready = deque()
+    futures = set()
+    # Nodes bound since the last step, to be yielded.
+    completed = deque()
+
+    def wait(node, action, data, inputs):
+        stage[node] = (action, data)
+        count = 0
+        for child in inputs:
+            if child in bindings:
+                continue
+            elif isinstance(child, Literal):
+                bindings[child] = child.value
+                continue
+            count += 1
+            if child in dependents:
+                dependents[child].append(node)
+            else:
+                dependents[child] = [node]
+                unstarted.append(child)
+        n_unbound[node] = count
+        if not count:
+            ready.append(node)
+
+    def bind(node, value):
+        bindings[node] = value
+        completed.append(node)
+        for parent in dependents.pop(node):
+            n_unbound[parent] -= 1
+            if not n_unbound[parent]:
+                ready.append(parent)
+
+    def settle(node, value):
+        if await_futures and isinstance(value, Future):
+            futures.add(value)
+            value.add_done_callback(lambda f: done.put((node, f, False)))
+        else:
+            bind(node, value)
+
+    def call(func, *args, **kwargs):
+        if instantiate_call is None:
+            return func(*args, **kwargs)
+        return instantiate_call(func, *args, **kwargs)
+
+    def call_node(node, func, args, kwargs):
+        if profiler is None:
+            return call(func, *args, **kwargs)
+        value, timing = _timed_call(call, func, args, kwargs)
+        profiler.record(node, value, *timing)
+        return value
+
+    def submit(node, func, args, kwargs):
+        if profiler is not None:
+            future = executor.submit(_timed_call, instantiate_call or _apply,
+                                     func, args, kwargs)
+        elif instantiate_call is None:
+            future = executor.submit(func, *args, **kwargs)
+        else:
+            future = executor.submit(instantiate_call, func, *args, **kwargs)
+        futures.add(future)
+        timed = profiler is not None
+        future.add_done_callback(lambda f: done.put((node, f, timed)))
+
+    try:
+        while p not in bindings:
+            if unstarted:
+                node = unstarted.pop()
+                if node.func is operator.getitem and is_indexable(node):
+                    wait(node, _INDEX, None, (node.args[1],))
+                else:
+                    args, keywords = node.args, node._keywords
+                    wait(node, _CALL, (args, keywords),
+                         args + tuple(keywords.itervalues())
+                         if keywords else args)
+            elif ready:
+                node = ready.popleft()
+                action, data = stage.pop(node)
+                if action == _CALL:
+                    args, keywords = data
+                    args = [bindings[arg] for arg in args]
+                    kw = (dict((k, bindings[v])
+                               for k, v in keywords.iteritems())
+                          if keywords else {})
+                    func = node.func
+                    if func is variable_node:
+                        assert 'name' in kw
+                        name = kw['name']
+                        try:
+                            bind(node, bindings[name])
+                        except KeyError:
+                            raise KeyError("variable with name '%s' not "
+                                           "bound" % name)
+                    elif executor is None or func in _INLINE_FUNCS:
+                        settle(node, call_node(node, func, args, kw))
+                    else:
+                        submit(node, func, args, kw)
+                elif action == _INDEX:
+                    obj, index = node.args
+                    index_val = bindings[index]
+                    if is_sequence_node(obj):
+                        elem = obj.args[index_val]
+                        wait(node, _INDEX_DONE, (elem, index_val),
+                             elem if isinstance(index_val, slice)
+                             else (elem,))
+                    else:  # assumes is_dict_like_node(obj) is True
+                        assert obj.func == call_with_list_of_pos_args
+                        assert all(is_tuple_node(n) and len(n.args) == 2
+                                   for n in obj.args[1:])
+                        keys, values = zip(*(n.args for n in obj.args[1:]))
+                        wait(node, _DICT_KEYS, (keys, values, index_val),
+                             keys)
+                elif action == _INDEX_DONE:
+                    elem, index_val = data
+                    if isinstance(index_val, slice):
+                        elem_val = call(node.args[0].func,
+                                        *[bindings[e] for e in elem])
+                        bind(node, call(node.func, elem_val, index_val))
+                    else:
+                        bind(node, bindings[elem])
+                elif action == _DICT_KEYS:
+                    keys, values, index_val = data
+                    keys = [bindings[k] for k in keys]
+                    try:
+                        ind = keys.index(index_val)
+                    except ValueError:
+                        raise KeyError(index_val)
+                    wait(node, _DICT_DONE, values[ind], (values[ind],))
+                else:  # action == _DICT_DONE
+                    bind(node, bindings[data])
+            elif futures:
+                node, future, timed = done.get()
+                futures.discard(future)
+                if timed:
+                    value, timing = future.result()
+                    profiler.record(node, value, *timing)
+                else:
+                    value = future.result()
+                settle(node, value)
+            else:
+                # Nothing is running or runnable, yet the root is unbound:
+                # some node is (transitively) waiting on itself.
+                raise ValueError("call graph contains a directed cycle")
+            while completed:
+                node = completed.popleft()
+                yield node, bindings[node]
+    finally:
+        for future in futures:
+            future.cancel()
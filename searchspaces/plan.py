@@ -0,0 +1,347 @@
+"""
+Compilation of `PartialPlus` graphs into flat, reusable evaluation plans.
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+__all__ = ["compile", "EvaluationPlan"]
+
+from functools import partial as _partial
+import operator
+
+from .partialplus import (Literal, is_indexable, is_sequence_node,
+                          is_tuple_node, call_with_list_of_pos_args,
+                          variable_node)
+
+# Instruction kinds. Every instruction is a tuple whose first element is
+# its kind and whose second element is the slot it writes to (if any).
+#
+# (_CALL, out, func, arg_slots)
+_CALL = 0
+# (_CALL_KW, out, func, arg_slots, ((keyword, slot), ...))
+_CALL_KW = 1
+# (_VARIABLE, out, name_slot)
+_VARIABLE = 2
+# (_INDEX_SEQ, out, index_slot, ((entry, slot), ...))
+_INDEX_SEQ = 3
+# (_INDEX_SEQ_DONE, out, index_slot, ((entry, slot), ...), seq_func, getitem)
+_INDEX_SEQ_DONE = 4
+# (_INDEX_DICT, out, index_slot, key_slots, ((entry, slot), ...))
+_INDEX_DICT = 5
+# (_INDEX_DICT_DONE, out, index_slot, key_slots, ((entry, slot), ...))
+_INDEX_DICT_DONE = 6
+# (_RETURN, None)
+_RETURN = 7
+
+# Compiler work stack actions. Each frame on the compiler's stack is an
+# `(action, node, block, data)` tuple.
+_VISIT = 0            # Compile `node` into `block` unless already computed.
+_EMIT_CALL = 1        # Inputs of `node` are compiled; emit the call.
+_EMIT_INDEX = 2       # Index of a lazy getitem `node` is compiled.
+_EMIT_DICT_KEYS = 3   # Keys of the dict-like indexed by `node` are compiled.
+_FINISH_SEQ = 4       # Element subroutines of `node` are compiled.
+_FINISH_DICT = 5      # Value subroutines of `node` are compiled.
+_OPEN_BLOCK = 6       # Start compiling into the subroutine `block`.
+_CLOSE_BLOCK = 7      # Finish compiling into the subroutine `block`.
+
+
+class _Unset(object):
+    """Marker for a slot that has not been computed yet."""
+    def __init__(self):
+        assert 0, "Singleton class not meant to be instantiated"
+
+
+class EvaluationPlan(object):
+    """
+    A `PartialPlus` graph compiled into a flat array of instructions.
+
+    Parameters
+    ----------
+    code : list
+        Instruction tuples, with the top-level program starting at
+        index 0. Subroutines computing lazily indexed elements follow
+        it, each terminated by a return instruction.
+    template : list
+        The initial contents of the slot array, with literal values
+        filled in and all other slots unset.
+    root_slot : int
+        The slot holding the value of the root node.
+
+    Notes
+    -----
+    Use `compile` to construct these rather than instantiating
+    directly.
+    """
+    def __init__(self, code, template, root_slot):
+        self.code = tuple(code)
+        self.template = template
+        self.root_slot = root_slot
+
+    def __len__(self):
+        return len(self.code)
+
+    def __call__(self, **bindings):
+        """
+        Run the plan, binding variables by name.
+
+        Parameters
+        ----------
+        bindings : dict
+            Values for the variables in the graph, keyed by name.
+
+        Returns
+        -------
+        q : object
+            The same value `evaluate(root, **bindings)` would return.
+        """
+        unset = _Unset
+        slots = self.template[:]
+        code = self.code
+        returns = []
+        pc = 0
+        while True:
+            instr = code[pc]
+            pc += 1
+            kind = instr[0]
+            if kind == _CALL:
+                _, out, func, arg_slots = instr
+                if slots[out] is unset:
+                    slots[out] = func(*[slots[i] for i in arg_slots])
+            elif kind == _CALL_KW:
+                _, out, func, arg_slots, kw_slots = instr
+                if slots[out] is unset:
+                    slots[out] = func(*[slots[i] for i in arg_slots],
+                                      **dict((k, slots[i])
+                                             for k, i in kw_slots))
+            elif kind == _VARIABLE:
+                _, out, name_slot = instr
+                name = slots[name_slot]
+                try:
+                    slots[out] = bindings[name]
+                except KeyError:
+                    raise KeyError("variable with name '%s' not bound" %
+                                   name)
+            elif kind == _INDEX_SEQ:
+                _, out, index_slot, elems = instr
+                if slots[out] is not unset:
+                    continue
+                index_val = slots[index_slot]
+                selected = elems[index_val]
+                if isinstance(index_val, slice):
+                    entries = [e for e, _ in selected if e is not None]
+                elif selected[0] is not None:
+                    entries = [selected[0]]
+                else:
+                    continue
+                if entries:
+                    # Run the subroutines for each selected element in
+                    # turn, then come back to the _INDEX_SEQ_DONE.
+                    returns.append(pc)
+                    returns.extend(reversed(entries[1:]))
+                    pc = entries[0]
+            elif kind == _INDEX_SEQ_DONE:
+                _, out, index_slot, elems, seq_func, getitem = instr
+                if slots[out] is not unset:
+                    continue
+                index_val = slots[index_slot]
+                selected = elems[index_val]
+                if isinstance(index_val, slice):
+                    elem_val = seq_func(*[slots[s] for _, s in selected])
+                else:
+                    elem_val = slots[selected[1]]
+                try:
+                    int(index_val)
+                    slots[out] = elem_val
+                except TypeError:
+                    slots[out] = getitem(elem_val, index_val)
+            elif kind == _INDEX_DICT or kind == _INDEX_DICT_DONE:
+                _, out, index_slot, key_slots, values = instr
+                if slots[out] is not unset:
+                    continue
+                index_val = slots[index_slot]
+                keys = [slots[k] for k in key_slots]
+                try:
+                    entry, slot = values[keys.index(index_val)]
+                except ValueError:
+                    raise KeyError(index_val)
+                if kind == _INDEX_DICT_DONE:
+                    slots[out] = slots[slot]
+                elif entry is not None:
+                    returns.append(pc)
+                    pc = entry
+            else:  # kind == _RETURN
+                if not returns:
+                    break
+                pc = returns.pop()
+        return slots[self.root_slot]
+
+
+def compile(root, instantiate_call=None):
+    """
+    Compile a `PartialPlus` graph into a reusable `EvaluationPlan`.
+
+    Parameters
+    ----------
+    root : Node
+        The root of the graph to compile.
+    instantiate_call : callable, optional
+        Rather than call `node.func` directly, the plan will call
+        `instantiate_call(node.func, ...)`, as in `_evaluate`.
+
+    Returns
+    -------
+    plan : EvaluationPlan
+        A callable such that `plan(**bindings)` returns the same value
+        as `evaluate(root, **bindings)`.
+
+    Raises
+    ------
+    ValueError
+        If the graph contains a directed cycle.
+
+    Notes
+    -----
+    Node classification, argument gathering and literal unwrapping are
+    done once here rather than on every evaluation. Elements of lazily
+    indexed sequences and dict-likes are compiled into subroutines that
+    only run when selected, so the plan evaluates exactly the nodes
+    `evaluate` would, in the same order.
+    """
+    if instantiate_call is None:
+        wrap = lambda f: f
+    else:
+        wrap = lambda f: _partial(instantiate_call, f)
+    slot_of = {}
+    template = []
+
+    def slot(node):
+        if node not in slot_of:
+            slot_of[node] = len(template)
+            template.append(node.value if isinstance(node, Literal)
+                            else _Unset)
+        return slot_of[node]
+
+    # Code is emitted into blocks: block 0 is the top-level program and
+    # every lazily indexed element gets a block (a subroutine) of its own.
+    # Each block is also a scope: `emitted_in` records the block a node's
+    # instruction was last emitted into, and a node only counts as
+    # already computed if that block is currently open, i.e. is certain
+    # to have run by this point at evaluation time.
+    blocks = [[]]
+    open_blocks = set([0])
+    emitted_in = {}
+    in_progress = set()
+
+    def lazy_elements(action, node, block, elem_nodes):
+        # Push a frame to finish `node` once a subroutine has been
+        # compiled for each of `elem_nodes` not already computed at this
+        # point in `block`. Each subroutine is compiled in a block of its
+        # own, nested in `block`; frames are popped in reverse, so that
+        # is: open the new block, compile the element into it, close it.
+        elems = []
+        subroutines = []
+        for elem in elem_nodes:
+            if (isinstance(elem, Literal) or
+                    emitted_in.get(elem) in open_blocks):
+                elems.append((None, slot(elem)))
+            else:
+                subroutines.append((len(blocks), elem))
+                elems.append((len(blocks), slot(elem)))
+                blocks.append([])
+        stack.append((action, node, block, tuple(elems)))
+        for sub, elem in reversed(subroutines):
+            stack.append((_CLOSE_BLOCK, None, sub, None))
+            stack.append((_VISIT, elem, sub, None))
+            stack.append((_OPEN_BLOCK, None, sub, None))
+
+    stack = [(_VISIT, root, 0, None)]
+    while stack:
+        action, node, block, data = stack.pop()
+        if action == _VISIT:
+            if isinstance(node, Literal):
+                slot(node)
+                continue
+            if emitted_in.get(node) in open_blocks:
+                continue
+            if node in in_progress:
+                raise ValueError("call graph contains a directed cycle")
+            in_progress.add(node)
+            if node.func is operator.getitem and is_indexable(node):
+                stack.append((_EMIT_INDEX, node, block, None))
+                stack.append((_VISIT, node.args[1], block, None))
+            else:
+                stack.append((_EMIT_CALL, node, block, None))
+                stack.extend((_VISIT, child, block, None)
+                             for child in reversed(node.inputs()))
+        elif action == _EMIT_CALL:
+            in_progress.remove(node)
+            emitted_in[node] = block
+            out = slot(node)
+            if node.func is variable_node:
+                assert 'name' in node.keywords
+                instr = (_VARIABLE, out, slot(node.keywords['name']))
+            elif node._keywords:
+                instr = (_CALL_KW, out, wrap(node.func),
+                         tuple(slot(a) for a in node.args),
+                         tuple((k, slot(v))
+                               for k, v in node._keywords.iteritems()))
+            else:
+                instr = (_CALL, out, wrap(node.func),
+                         tuple(slot(a) for a in node.args))
+            blocks[block].append(instr)
+        elif action == _EMIT_INDEX:
+            obj, index = node.args
+            if is_sequence_node(obj):
+                lazy_elements(_FINISH_SEQ, node, block, obj.args)
+            else:  # assumes is_dict_like_node(obj) is True
+                assert obj.func == call_with_list_of_pos_args
+                assert all(is_tuple_node(n) and len(n.args) == 2
+                           for n in obj.args[1:])
+                # All keys are evaluated, as with `evaluate`.
+                stack.append((_EMIT_DICT_KEYS, node, block, None))
+                stack.extend((_VISIT, n.args[0], block, None)
+                             for n in reversed(obj.args[1:]))
+        elif action == _EMIT_DICT_KEYS:
+            obj = node.args[0]
+            lazy_elements(_FINISH_DICT, node, block,
+                          [n.args[1] for n in obj.args[1:]])
+        elif action == _FINISH_SEQ:
+            in_progress.remove(node)
+            emitted_in[node] = block
+            obj, index = node.args
+            out = slot(node)
+            blocks[block].append((_INDEX_SEQ, out, slot(index), data))
+            blocks[block].append((_INDEX_SEQ_DONE, out, slot(index), data,
+                                  wrap(obj.func), wrap(node.func)))
+        elif action == _FINISH_DICT:
+            in_progress.remove(node)
+            emitted_in[node] = block
+            obj, index = node.args
+            key_slots = tuple(slot(n.args[0]) for n in obj.args[1:])
+            out = slot(node)
+            blocks[block].append((_INDEX_DICT, out, slot(index), key_slots,
+                                  data))
+            blocks[block].append((_INDEX_DICT_DONE, out, slot(index),
+                                  key_slots, data))
+        elif action == _OPEN_BLOCK:
+            open_blocks.add(block)
+        else:  # action == _CLOSE_BLOCK
+            open_blocks.remove(block)
+            blocks[block].append((_RETURN, None))
+    blocks[0].append((_RETURN, None))
+    # Link: lay the blocks out one after another and replace block
+    # numbers in the indexing instructions with code offsets.
+    offsets = []
+    code = []
+    for b in blocks:
+        offsets.append(len(code))
+        code.extend(b)
+    resolve = lambda elems: tuple((None if e is None else offsets[e], s)
+                                  for e, s in elems)
+    for i, instr in enumerate(code):
+        if instr[0] in (_INDEX_SEQ, _INDEX_SEQ_DONE):
+            code[i] = instr[:3] + (resolve(instr[3]),) + instr[4:]
+        elif instr[0] in (_INDEX_DICT, _INDEX_DICT_DONE):
+            code[i] = instr[:4] + (resolve(instr[4]),)
+    return EvaluationPlan(code, template, slot(root))
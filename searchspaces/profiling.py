@@ -0,0 +1,467 @@
+"""
+Per-node profiling and tracing of graph evaluation.
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+__all__ = ["Profiler", "Tracer"]
+
+from itertools import chain
+import json
+import operator
+import sys
+import time
+
+from .partialplus import (Literal, Node, is_indexable, is_literal,
+                          is_sequence_node, is_variable_node,
+                          topological_sort)
+
+# Stands in for the values of nodes that are not bound.
+_MISSING = object()
+
+
+def _func_name(func):
+    module = getattr(func, '__module__', None)
+    name = getattr(func, '__name__', None)
+    if name is None:
+        return repr(func)
+    return name if module in (None, '__builtin__') else module + '.' + name
+
+
+def _bound_value(node, bindings):
+    if isinstance(node, Literal):
+        return node.value
+    # Bypass the lookups of bindings wrapped by a cache.
+    return dict.get(bindings, node, _MISSING)
+
+
+def _read_inputs(node, bindings, evaluated):
+    """
+    The inputs whose values the evaluation of the lazily indexed
+    sequence or dict-like `node` read, in the order it read them: the
+    index, then the selected elements, or the keys, then the selected
+    value. Where the values needed to tell which were selected were
+    freed, those evaluated are taken instead.
+    """
+    obj, index = node.args
+    index_value = _bound_value(index, bindings)
+    if is_sequence_node(obj):
+        elements = obj.args
+        try:
+            selected = elements[index_value]
+        except (IndexError, TypeError):
+            selected = [e for e in elements if e in evaluated]
+        else:
+            if not isinstance(index_value, slice):
+                selected = (selected,)
+        return (index,) + tuple(selected)
+    keys, values = zip(*(pair.args for pair in obj.args[1:]))
+    key_values = [_bound_value(k, bindings) for k in keys]
+    if index_value is _MISSING or _MISSING in key_values:
+        selected = [v for v in values if v in evaluated]
+    elif index_value in key_values:
+        selected = [values[key_values.index(index_value)]]
+    else:
+        selected = []
+    return (index,) + keys + tuple(selected)
+
+
+def _node_name(node):
+    return '%s at 0x%x' % (_func_name(node.func), id(node))
+
+
+class Profiler(object):
+    """
+    Records the wall-clock time taken by each call made by `evaluate`,
+    and the size of its result.
+
+    Pass one to `evaluate` as its `_profiler` argument. The same
+    profiler can be passed to several evaluations, in which case its
+    statistics accumulate.
+
+    Parameters
+    ----------
+    sizeof : callable, optional
+        A function returning the size in bytes of a value. Defaults to
+        `sys.getsizeof`, which does not count the objects a value
+        refers to.
+
+    Attributes
+    ----------
+    nodes : dict
+        Maps each node called to a list of its number of calls, the
+        total time they took in seconds, and the size of its largest
+        result.
+
+    Notes
+    -----
+    Times are those of the calls themselves, excluding the evaluation
+    of their inputs. Variables, literals and the lazy indexing of
+    sequences and dict-likes are not calls, and are not recorded.
+    Calls made by an executor are timed where they run, so with a
+    process pool the times exclude the overhead of shipping values
+    between processes.
+    """
+    def __init__(self, sizeof=None):
+        self.sizeof = sys.getsizeof if sizeof is None else sizeof
+        self.nodes = {}
+        # Times of the calls of the evaluation in progress, then those
+        # of the last one, for its critical path.
+        self._current = {}
+        self._last = None
+        # The inputs read by lazily indexed nodes in the last one.
+        self._read = {}
+
+    def record(self, node, value, seconds, start, pid, tid):
+        """
+        Record a call of `node` that gave `value` and took `seconds`,
+        starting at time `start` in thread `tid` of process `pid`.
+        """
+        try:
+            size = self.sizeof(value)
+        except TypeError:
+            size = 0
+        stats = self.nodes.get(node)
+        if stats is None:
+            self.nodes[node] = [1, seconds, size]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], size)
+        self._current[node] = self._current.get(node, 0.) + seconds
+
+    def evaluated(self, root, bindings):
+        """
+        Note the end of the evaluation of the graph rooted at `root`,
+        in which the nodes in `bindings` were evaluated.
+        """
+        evaluated = frozenset(n for n in chain(bindings,
+                                               getattr(bindings, 'freed', ()))
+                              if isinstance(n, Node))
+        # The inputs lazily indexed nodes actually read, rather than
+        # every element, or every key and value.
+        self._read = dict((n, _read_inputs(n, bindings, evaluated))
+                          for n in evaluated
+                          if n.func is operator.getitem and is_indexable(n))
+        self._last = (root, evaluated, self._current)
+        self._current = {}
+
+    def _inputs(self, node):
+        """The inputs of `node` read by the last evaluation."""
+        read = self._read.get(node)
+        return node.inputs() if read is None else read
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        self.nodes.clear()
+        self._current = {}
+        self._last = None
+        self._read = {}
+
+    @property
+    def total_seconds(self):
+        """The total time taken by all recorded calls."""
+        return sum(stats[1] for stats in self.nodes.itervalues())
+
+    def by_node(self):
+        """
+        Statistics for each node called.
+
+        Returns
+        -------
+        stats : list of tuples
+            A `(node, calls, seconds, max_bytes)` tuple for each node,
+            from the one whose calls took longest in total.
+        """
+        stats = [(node, calls, seconds, size)
+                 for node, (calls, seconds, size) in self.nodes.iteritems()]
+        stats.sort(key=lambda s: s[2], reverse=True)
+        return stats
+
+    def by_func(self):
+        """
+        Statistics for each function called, over all nodes calling it.
+
+        Returns
+        -------
+        stats : list of tuples
+            A `(func, calls, seconds, max_bytes)` tuple for each
+            function, from the one whose calls took longest in total.
+        """
+        funcs = {}
+        for node, (calls, seconds, size) in self.nodes.iteritems():
+            stats = funcs.get(node.func)
+            if stats is None:
+                funcs[node.func] = [calls, seconds, size]
+            else:
+                stats[0] += calls
+                stats[1] += seconds
+                stats[2] = max(stats[2], size)
+        stats = [(func, calls, seconds, size)
+                 for func, (calls, seconds, size) in funcs.iteritems()]
+        stats.sort(key=lambda s: s[2], reverse=True)
+        return stats
+
+    def critical_path(self):
+        """
+        The chain of calls that bounded the last evaluation.
+
+        Returns
+        -------
+        seconds : float
+            The time the calls on the path took, which no amount of
+            parallelism could have reduced.
+        path : list of tuples
+            A `(node, seconds)` tuple for each call on the path, from
+            the first to run to the last. Empty if nothing has been
+            evaluated.
+
+        Notes
+        -----
+        The path is the costliest chain of evaluated nodes, each an
+        input of the next, ending at the root.
+        """
+        if self._last is None:
+            return 0., []
+        root, evaluated, times = self._last
+        # The costliest chain ending at each node, and the input it
+        # continues from.
+        finish = {}
+        previous = {}
+        for node in topological_sort(root, reverse=True):
+            if node not in evaluated:
+                continue
+            best, best_input = 0., None
+            for child in self._inputs(node):
+                if child in finish and finish[child] > best:
+                    best, best_input = finish[child], child
+            finish[node] = best + times.get(node, 0.)
+            previous[node] = best_input
+        path = []
+        node = root if root in finish else None
+        while node is not None:
+            if node in times:
+                path.append((node, times[node]))
+            node = previous[node]
+        path.reverse()
+        return finish.get(root, 0.), path
+
+    def report(self, by='func', limit=20):
+        """
+        A table of the costliest calls, and the critical path of the
+        last evaluation.
+
+        Parameters
+        ----------
+        by : str, optional
+            `'func'` (the default) for a row per function, or `'node'`
+            for a row per node.
+        limit : int, optional
+            The maximum number of rows. `None` for all of them.
+
+        Returns
+        -------
+        report : str
+        """
+        if by == 'func':
+            rows = [(_func_name(f), c, t, b) for f, c, t, b in self.by_func()]
+        elif by == 'node':
+            rows = [(_node_name(n), c, t, b) for n, c, t, b in self.by_node()]
+        else:
+            raise ValueError("by must be 'func' or 'node', not %r" % (by,))
+        total = self.total_seconds
+        lines = ['%8s %12s %7s %12s %12s  %s' % ('calls', 'seconds', '%',
+                                                 'per call', 'max bytes',
+                                                 by)]
+        for name, calls, seconds, size in rows[:limit]:
+            lines.append('%8d %12.6f %7.2f %12.6f %12d  %s' % (
+                calls, seconds, 100 * seconds / total if total else 0.,
+                seconds / calls, size, name))
+        if limit is not None and len(rows) > limit:
+            lines.append('... %d more' % (len(rows) - limit))
+        seconds, path = self.critical_path()
+        if path:
+            lines.append('')
+            lines.append('critical path: %.6f s over %d calls' %
+                         (seconds, len(path)))
+            for node, node_seconds in path:
+                lines.append('%12.6f  %s' % (node_seconds, _node_name(node)))
+        return '\n'.join(lines)
+
+
+def _snippet(yaml_src, length=60):
+    """The first line of `yaml_src`, shortened to `length` characters."""
+    lines = yaml_src.strip().splitlines()
+    line = lines[0] if lines else ''
+    if len(line) > length or len(lines) > 1:
+        line = line[:length - 3] + '...'
+    return line
+
+
+class Tracer(Profiler):
+    """
+    A `Profiler` that also records a timeline of the calls made by
+    `evaluate`, to be written in the Trace Event Format read by
+    Chrome's `about:tracing`, Perfetto and other trace viewers.
+
+    Parameters
+    ----------
+    sizeof : callable, optional
+        See `Profiler`.
+
+    Attributes
+    ----------
+    events : list of dicts
+        The trace events recorded so far. Timestamps are in
+        microseconds since the tracer was created.
+
+    Notes
+    -----
+    Each call is a span named by its function, followed by the first
+    line of the `yaml_src` of its result if it has one (as set by the
+    pylearn2 YAML loader) or else by the names of the variables among
+    its inputs. Spans carry the IDs of the process and thread the
+    call ran in, and the time spent in the call itself, excluding its
+    inputs, as `self_us`.
+
+    When all the calls of an evaluation run in one thread, each span
+    covers the evaluation of the inputs first needed by its node
+    together with the call itself, so spans nest under those of their
+    parents as the depth-first evaluation did. When an executor runs
+    calls in several threads, spans cover the calls only, and flow
+    events link each span to the spans of the calls using its value.
+    """
+    def __init__(self, sizeof=None):
+        super(Tracer, self).__init__(sizeof)
+        self.events = []
+        self._epoch = time.time()
+        self._calls = []
+        self._flow_id = 0
+
+    def record(self, node, value, seconds, start, pid, tid):
+        super(Tracer, self).record(node, value, seconds, start, pid, tid)
+        try:
+            yaml_src = getattr(value, 'yaml_src', None)
+        except Exception:
+            yaml_src = None
+        self._calls.append((node, seconds, start, pid, tid,
+                            yaml_src if isinstance(yaml_src, basestring)
+                            else None))
+
+    def evaluated(self, root, bindings):
+        super(Tracer, self).evaluated(root, bindings)
+        calls, self._calls = self._calls, []
+        if not calls:
+            return
+        calls = dict((c[0], c[1:]) for c in calls)
+        evaluated = self._last[1]
+        if len(set((pid, tid) for _, _, pid, tid, _ in
+                   calls.itervalues())) == 1:
+            self._nested_spans(root, calls)
+        else:
+            self._flow_spans(root, evaluated, calls)
+
+    def _span(self, node, start, end, seconds, pid, tid, yaml_src):
+        name = getattr(node.func, '__name__', None) or repr(node.func)
+        if yaml_src is not None:
+            name += ': ' + _snippet(yaml_src)
+        else:
+            names = [child.keywords['name'].value
+                     for child in node.inputs()
+                     if is_variable_node(child) and
+                     is_literal(child.keywords['name'])]
+            if names:
+                name += ' (%s)' % ', '.join(str(n) for n in names)
+        event = {'name': name, 'cat': 'evaluate', 'ph': 'X',
+                 'ts': (start - self._epoch) * 1e6,
+                 'dur': (end - start) * 1e6, 'pid': pid, 'tid': tid,
+                 'args': {'self_us': seconds * 1e6}}
+        self.events.append(event)
+        return event
+
+    def _nested_spans(self, root, calls):
+        # Replay the depth-first evaluation to find, for each call, the
+        # calls made while evaluating the inputs its node needed first.
+        owner = {}
+        order = []
+        seen = set()
+        stack = [(root, None)]
+        while stack:
+            node, parent = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            if node in calls:
+                owner[node] = parent
+                order.append(node)
+                parent = node
+            stack.extend((child, parent)
+                         for child in reversed(tuple(self._inputs(node)))
+                         if child not in seen)
+        first = {}
+        for node in reversed(order):
+            seconds, start = calls[node][:2]
+            first[node] = min(first.get(node, start), start)
+            if owner[node] is not None:
+                first[owner[node]] = min(first.get(owner[node], start),
+                                         first[node])
+        for node in order:
+            seconds, start, pid, tid, yaml_src = calls[node]
+            self._span(node, first[node], start + seconds, seconds, pid,
+                       tid, yaml_src)
+
+    def _flow_spans(self, root, evaluated, calls):
+        # The calls whose values each node's value is computed from,
+        # looking through the nodes that aren't calls.
+        sources = {}
+        for node in topological_sort(root, reverse=True):
+            if node not in evaluated or node in calls:
+                continue
+            found = set()
+            for child in self._inputs(node):
+                if child in calls:
+                    found.add(child)
+                else:
+                    found.update(sources.get(child, ()))
+            sources[node] = found
+        spans = {}
+        for node, (seconds, start, pid, tid, yaml_src) in calls.iteritems():
+            spans[node] = self._span(node, start, start + seconds, seconds,
+                                     pid, tid, yaml_src)
+        for node, span in spans.iteritems():
+            inputs = set()
+            for child in self._inputs(node):
+                if child in calls:
+                    inputs.add(child)
+                else:
+                    inputs.update(sources.get(child, ()))
+            for child in inputs:
+                source = spans[child]
+                self._flow_id += 1
+                common = {'name': 'value', 'cat': 'dataflow',
+                          'id': self._flow_id}
+                self.events.append(dict(common, ph='s', pid=source['pid'],
+                                        tid=source['tid'],
+                                        ts=source['ts'] + source['dur']))
+                self.events.append(dict(common, ph='f', bp='e',
+                                        pid=span['pid'], tid=span['tid'],
+                                        ts=span['ts']))
+
+    def reset(self):
+        super(Tracer, self).reset()
+        self.events = []
+        self._calls = []
+
+    def write(self, fp):
+        """
+        Write the trace as JSON to a file.
+
+        Parameters
+        ----------
+        fp : file-like
+            A file opened for writing. The trace can then be opened
+            in a trace viewer.
+        """
+        json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'},
+                  fp)
@@ -0,0 +1,342 @@
+"""
+Vectorized random and quasi-random sampling of the variables of a
+search space.
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+__all__ = ["sample", "halton", "sobol", "latin_hypercube"]
+
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("This functionality requires numpy "
+                      "<http://www.numpy.org/>")
+
+from .graph import FrozenGraph
+from .variables import active_masks, from_unit_interval
+
+
+def _as_random_state(rng):
+    if isinstance(rng, np.random.RandomState):
+        return rng
+    return np.random.RandomState(rng)
+
+
+def _primes(n):
+    """The first `n` prime numbers."""
+    primes = []
+    candidate = 2
+    while len(primes) < n:
+        if all(candidate % p for p in primes if p * p <= candidate):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+
+def halton(n, d, skip=0):
+    """
+    Points of the Halton sequence.
+
+    Parameters
+    ----------
+    n : int
+        The number of points.
+    d : int
+        The number of dimensions.
+    skip : int, optional
+        The index of the first point; the sequence starts at zero.
+
+    Returns
+    -------
+    points : ndarray, shape (n, d)
+        Points of the unit hypercube, coordinate `j` being the radical
+        inverse of the point's index in the `j`th prime base.
+    """
+    points = np.zeros((n, d))
+    for j, base in enumerate(_primes(d)):
+        index = np.arange(skip, skip + n, dtype=np.int64)
+        scale = 1.
+        while index.any():
+            scale /= base
+            points[:, j] += index % base * scale
+            index //= base
+    return points
+
+
+# Sobol direction numbers from S. Joe and F. Y. Kuo, "Constructing Sobol
+# sequences with better two-dimensional projections" (2008), for
+# dimensions 2 to 21: the degree `s` and inner coefficients `a` of a
+# primitive polynomial, and the initial direction numbers `m`.
+_SOBOL_DIRECTIONS = [
+    (1, 0, (1,)),
+    (2, 1, (1, 3)),
+    (3, 1, (1, 3, 1)),
+    (3, 2, (1, 1, 1)),
+    (4, 1, (1, 1, 3, 3)),
+    (4, 4, (1, 3, 5, 13)),
+    (5, 2, (1, 1, 5, 5, 17)),
+    (5, 4, (1, 1, 5, 5, 5)),
+    (5, 7, (1, 1, 7, 11, 19)),
+    (5, 11, (1, 1, 5, 1, 1)),
+    (5, 13, (1, 1, 1, 3, 11)),
+    (5, 14, (1, 3, 5, 5, 31)),
+    (6, 1, (1, 3, 3, 9, 7, 49)),
+    (6, 13, (1, 1, 1, 15, 21, 21)),
+    (6, 16, (1, 3, 1, 13, 27, 49)),
+    (6, 19, (1, 1, 1, 15, 7, 5)),
+    (6, 22, (1, 3, 1, 15, 13, 25)),
+    (6, 25, (1, 1, 5, 5, 19, 61)),
+    (7, 1, (1, 3, 7, 11, 23, 15, 103)),
+    (7, 4, (1, 3, 7, 13, 13, 15, 69)),
+]
+_SOBOL_BITS = 32
+
+
+def _is_primitive(s, a):
+    """
+    Whether `x**s + (inner terms given by the bits of a) + 1` is a
+    primitive polynomial over GF(2).
+    """
+    poly = (1 << s) | (a << 1) | 1
+    order = (1 << s) - 1
+
+    def power_of_x(e):
+        # x**e modulo poly, by square-and-multiply.
+        result, base = 1, 2
+        while e:
+            if e & 1:
+                result = _gf2_mulmod(result, base, poly, s)
+            base = _gf2_mulmod(base, base, poly, s)
+            e >>= 1
+        return result
+
+    if power_of_x(order) != 1:
+        return False
+    factors = set()
+    m, f = order, 2
+    while f * f <= m:
+        while m % f == 0:
+            factors.add(f)
+            m //= f
+        f += 1
+    if m > 1:
+        factors.add(m)
+    return all(power_of_x(order // f) != 1 for f in factors)
+
+
+def _gf2_mulmod(x, y, poly, s):
+    result = 0
+    while y:
+        if y & 1:
+            result ^= x
+        y >>= 1
+        x <<= 1
+        if x >> s:
+            x ^= poly
+    return result
+
+
+def _sobol_directions(d):
+    """
+    The parameters of the first `d - 1` dimensions after the first,
+    extending the table of Joe and Kuo with further primitive
+    polynomials and fixed pseudo-random initial direction numbers.
+    """
+    directions = list(_SOBOL_DIRECTIONS[:d - 1])
+    if len(directions) < d - 1:
+        s, a = _SOBOL_DIRECTIONS[-1][:2]
+        rng = np.random.RandomState(0)
+        while len(directions) < d - 1:
+            a += 1
+            if a >= 1 << (s - 1):
+                s, a = s + 1, 0
+            if _is_primitive(s, a):
+                m = tuple(2 * rng.randint(0, 1 << k) + 1 for k in range(s))
+                directions.append((s, a, m))
+    return directions
+
+
+def sobol(n, d, skip=0):
+    """
+    Points of the Sobol sequence.
+
+    Parameters
+    ----------
+    n : int
+        The number of points.
+    d : int
+        The number of dimensions.
+    skip : int, optional
+        The index of the first point; the sequence starts at zero.
+
+    Returns
+    -------
+    points : ndarray, shape (n, d)
+        Points of the unit hypercube.
+
+    Notes
+    -----
+    The first 21 dimensions use the direction numbers of Joe and Kuo.
+    Further dimensions are generated, and have no guaranteed quality
+    of two-dimensional projections. Points are computed directly from
+    their index (using its Gray code), so any slice of the sequence
+    costs the same.
+    """
+    if skip + n > 1 << _SOBOL_BITS:
+        raise ValueError("only the first 2 ** %d Sobol points are available"
+                         % _SOBOL_BITS)
+    index = np.arange(skip, skip + n, dtype=np.uint64)
+    gray = index ^ (index >> np.uint64(1))
+    bits = [(gray >> np.uint64(k)) & np.uint64(1)
+            for k in range(_SOBOL_BITS)]
+    directions = _sobol_directions(d)
+    points = np.empty((n, d))
+    for j in range(d):
+        if j == 0:
+            v = [1 << (_SOBOL_BITS - 1 - k) for k in range(_SOBOL_BITS)]
+        else:
+            s, a, m = directions[j - 1]
+            v = [m[k] << (_SOBOL_BITS - 1 - k) for k in range(s)]
+            for k in range(s, _SOBOL_BITS):
+                x = v[k - s] ^ (v[k - s] >> s)
+                for i in range(1, s):
+                    if (a >> (s - 1 - i)) & 1:
+                        x ^= v[k - i]
+                v.append(x)
+        acc = np.zeros(n, dtype=np.uint64)
+        for k in range(_SOBOL_BITS):
+            acc ^= bits[k] * np.uint64(v[k])
+        points[:, j] = acc / float(1 << _SOBOL_BITS)
+    return points
+
+
+def latin_hypercube(n, d, rng=None):
+    """
+    A Latin hypercube design.
+
+    Parameters
+    ----------
+    n : int
+        The number of points.
+    d : int
+        The number of dimensions.
+    rng : RandomState or int, optional
+        The random number generator to draw from, or a seed for one.
+
+    Returns
+    -------
+    points : ndarray, shape (n, d)
+        Points of the unit hypercube such that, in each dimension,
+        each of the `n` intervals `[i / n, (i + 1) / n)` holds exactly
+        one point.
+    """
+    rng = _as_random_state(rng)
+    points = np.empty((n, d))
+    for j in range(d):
+        points[:, j] = (rng.permutation(n) + rng.random_sample(n)) / n
+    return points
+
+
+_METHODS = ('random', 'sobol', 'halton', 'lhs')
+
+
+def sample(root, n, rng=None, method='random', skip=0):
+    """
+    Draw random or quasi-random values for the variables of a search
+    space.
+
+    Parameters
+    ----------
+    root : Node or FrozenGraph
+        The root of the search space.
+    n : int
+        The number of samples to draw.
+    rng : RandomState or int, optional
+        The random number generator to draw from, or a seed for one.
+        With the `'sobol'` and `'halton'` methods, points are only
+        randomized if it is given.
+    method : str, optional
+        How to draw points of the unit hypercube, which are then mapped
+        to values of the variables: `'random'` (the default) draws
+        them independently, `'sobol'` and `'halton'` take them from
+        these low-discrepancy sequences, and `'lhs'` from a Latin
+        hypercube design.
+    skip : int, optional
+        With the `'sobol'` and `'halton'` methods, the index of the
+        first point of the sequence. Workers given disjoint ranges of
+        indices draw disjoint slices of the same sequence.
+
+    Returns
+    -------
+    values : OrderedDict
+        Maps each variable name to a masked array of `n` values, in
+        the order of `FrozenGraph.variables`, masked in the rows where
+        the variable is inactive. Row `i` of every array together forms
+        the `i`th sample, so this can be passed as is to
+        `evaluate_batch`.
+    active : OrderedDict
+        Maps each variable name to a boolean array, true in the rows
+        where the variable is used: a variable inside a branch of a
+        `choice` is only active in the samples selecting that branch.
+        This is the complement of the mask of its values.
+
+    Raises
+    ------
+    ValueError
+        If a variable can't be sampled, e.g. because it lacks bounds,
+        or its hyperparameters depend on other variables, or if `skip`
+        is given with a method other than `'sobol'` or `'halton'`.
+
+    Notes
+    -----
+    Variables without a `distribution` are sampled uniformly: from
+    their `value_type` if it is a sequence, and otherwise between
+    their `minimum` and `maximum` (both included for `int`), on a log
+    scale if `log_scale` is set. Named distributions follow the
+    conventions of `hyperopt.pyll.stochastic`, as `as_pyll` does:
+    `minimum` and `maximum` are `low` and `high` (in log space for
+    `loguniform`), `randint` draws from zero to `maximum`, and the
+    normal distributions take `mu` and `sigma` keyword arguments,
+    the quantized ones `q`. Categoricals may have probabilities `p`.
+
+    Each variable is one dimension of the unit hypercube, in the order
+    of `FrozenGraph.variables`, and is mapped to through its inverse
+    cumulative distribution function: categorical options, integers
+    and quantized values get intervals of the unit interval as wide as
+    their probability, and `log_scale` and the log distributions map
+    it logarithmically. Variables of different branches of a `choice`
+    get different dimensions, so the points are evenly spread in every
+    branch. Sobol points are best drawn in powers of two, starting at
+    a multiple of the number drawn.
+    """
+    if method not in _METHODS:
+        raise ValueError("unknown sampling method '%s'" % method)
+    if skip and method not in ('sobol', 'halton'):
+        raise ValueError("skip is only supported by the 'sobol' and "
+                         "'halton' methods")
+    graph = root if isinstance(root, FrozenGraph) else FrozenGraph(root)
+    for name in graph.variables:
+        if not isinstance(name, basestring):
+            raise ValueError("can't sample variables with computed names")
+    d = len(graph.variables)
+    if method == 'random':
+        points = _as_random_state(rng).random_sample((n, d))
+    elif method == 'lhs':
+        points = latin_hypercube(n, d, rng)
+    else:
+        points = (sobol if method == 'sobol' else halton)(n, d, skip)
+        if rng is not None:
+            # A random shift modulo 1 (Cranley-Patterson rotation).
+            shift = _as_random_state(rng).random_sample(d)
+            points = (points + shift) % 1.
+    values = OrderedDict()
+    for j, (name, nodes) in enumerate(graph.variables.iteritems()):
+        values[name] = from_unit_interval(nodes[0], points[:, j])
+    active = active_masks(graph, values, n)
+    for name, column in values.iteritems():
+        values[name] = np.ma.masked_array(column, mask=~active[name])
+    return values, active
@@ -0,0 +1,288 @@
+"""
+A compact binary snapshot format for `PartialPlus` graphs.
+
+A snapshot consists of
+
+* an 8-byte magic string;
+* the length of the header, as a little-endian 64-bit integer;
+* the header, a pickled dict holding the import paths of the
+  functions called, the distinct literal values (interned), the
+  keyword argument names and the descriptions of out-of-line arrays;
+* the node table, a flat array of C ints describing each node in
+  reverse topological order, so that nodes only refer to nodes
+  before them;
+* large NumPy array literals, each starting 64-byte aligned relative
+  to the start of the snapshot, so that they can be memory-mapped
+  when loading.
+
+In the node table, a literal is `-1` followed by the index of its
+value, and a call is the index of its function, the number of
+positional arguments, their node indices, the number of keyword
+arguments, and a keyword name index and node index for each.
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+__all__ = ["dump", "load"]
+
+from array import array
+import cPickle as pickle
+import gc
+import importlib
+import struct
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .cache import _qualified_name
+from .graph import FrozenGraph
+from .optimize import _literal_key
+from .partialplus import Literal, PartialPlus, topological_sort
+
+_MAGIC = 'PPSNAP\x00\x01'
+_VERSION = 1
+_LENGTH = struct.Struct('<Q')
+_ALIGN = 64
+_LITERAL = -1
+
+
+def _padding(position):
+    """The number of bytes needed to align `position`."""
+    return -position % _ALIGN
+
+
+def _import_object(path):
+    """
+    Import the object with the dotted name `path`, raising ImportError
+    if there is none.
+    """
+    parts = path.split('.')
+    for i in xrange(len(parts) - 1, 0, -1):
+        try:
+            obj = importlib.import_module('.'.join(parts[:i]))
+        except ImportError:
+            continue
+        try:
+            for attr in parts[i:]:
+                obj = getattr(obj, attr)
+        except AttributeError:
+            break
+        return obj
+    raise ImportError("can't import %s" % path)
+
+
+def dump(graph, fp, array_threshold=4096):
+    """
+    Write a snapshot of a graph to a file.
+
+    Parameters
+    ----------
+    graph : Node or FrozenGraph
+        The root of the graph to save.
+    fp : file-like
+        A file opened for writing in binary mode.
+    array_threshold : int, optional
+        NumPy array literals of at least this many bytes, and not of
+        an object dtype, are stored out of line in their raw binary
+        form, rather than pickled with the other literals.
+
+    Raises
+    ------
+    ValueError
+        If the graph calls a function that has no import path leading
+        back to it, such as a lambda, a method of an instance, or a
+        nested function or closure.
+
+    Notes
+    -----
+    Literals holding equal hashable values of the same type, down to
+    the elements of tuples and frozensets, are stored once. Node
+    identity is preserved: nodes shared in the graph are shared in the
+    loaded graph too.
+    """
+    if isinstance(graph, FrozenGraph):
+        nodes = graph.topological_sort(reverse=True)
+    else:
+        nodes = topological_sort(graph, reverse=True)
+    functions, function_index = [], {}
+    literals, literal_index = [], {}
+    keywords, keyword_index = [], {}
+    node_index = {}
+    table = array('i')
+    append = table.append
+    for node in nodes:
+        node_index[node] = len(node_index)
+        if isinstance(node, Literal):
+            value = node.value
+            # Keyed by type as well as value, so that e.g. `(1,)` and
+            # `(1.0,)` are stored separately.
+            key = _literal_key(value)
+            if key is None:
+                key = ('id', id(value))
+            i = literal_index.get(key)
+            if i is None:
+                i = literal_index[key] = len(literals)
+                literals.append(value)
+            append(_LITERAL)
+            append(i)
+            continue
+        func = node.func
+        i = function_index.get(id(func))
+        if i is None:
+            name = _qualified_name(func)
+            if name is None:
+                raise ValueError("can't save a call to %r, which has no "
+                                 "import path" % (func,))
+            i = function_index[id(func)] = len(functions)
+            functions.append(name)
+        append(i)
+        append(len(node.args))
+        table.extend(node_index[arg] for arg in node.args)
+        node_keywords = node._keywords or {}
+        append(len(node_keywords))
+        for name, value in node_keywords.iteritems():
+            i = keyword_index.get(name)
+            if i is None:
+                i = keyword_index[name] = len(keywords)
+                keywords.append(name)
+            append(i)
+            append(node_index[value])
+
+    arrays = []
+    offset = 0
+    for i, value in enumerate(literals):
+        if (np is not None and isinstance(value, np.ndarray) and
+                not value.dtype.hasobject and
+                value.nbytes >= array_threshold):
+            flags = value.flags
+            fortran = flags.f_contiguous and not flags.c_contiguous
+            arrays.append((i, value.dtype.str, value.shape, fortran, offset,
+                           value.nbytes))
+            offset += value.nbytes + _padding(value.nbytes)
+    out_of_line = set(a[0] for a in arrays)
+    header = {
+        'version': _VERSION,
+        'byteorder': sys.byteorder,
+        'functions': functions,
+        'literals': [None if i in out_of_line else v
+                     for i, v in enumerate(literals)],
+        'keywords': keywords,
+        'n_table': len(table),
+        'arrays': arrays,
+    }
+    header = pickle.dumps(header, pickle.HIGHEST_PROTOCOL)
+    fp.write(_MAGIC)
+    fp.write(_LENGTH.pack(len(header)))
+    fp.write(header)
+    fp.write(table.tostring())
+    if arrays:
+        position = (len(_MAGIC) + _LENGTH.size + len(header) +
+                    len(table) * table.itemsize)
+        fp.write('\0' * _padding(position))
+        for i, _, _, fortran, _, nbytes in arrays:
+            fp.write(literals[i].tostring(order='F' if fortran else 'C'))
+            fp.write('\0' * _padding(nbytes))
+
+
+def load(fp, mmap=True):
+    """
+    Read a graph from a snapshot written by `dump`.
+
+    Parameters
+    ----------
+    fp : file-like
+        A file opened for reading in binary mode, positioned at the
+        start of the snapshot. It is left positioned just past it.
+    mmap : bool, optional
+        If `True` (the default) and `fp` is a file on disk, array
+        literals stored out of line are memory-mapped read-only rather
+        than read into memory.
+
+    Returns
+    -------
+    root : Node
+        The root of the loaded graph.
+
+    Raises
+    ------
+    ValueError
+        If `fp` does not hold a snapshot in a supported format.
+    """
+    if fp.read(len(_MAGIC)) != _MAGIC:
+        raise ValueError("not a PartialPlus snapshot")
+    header_length, = _LENGTH.unpack(fp.read(_LENGTH.size))
+    header = pickle.loads(fp.read(header_length))
+    if header['version'] != _VERSION:
+        raise ValueError("unsupported snapshot version %d" %
+                         header['version'])
+    table = array('i')
+    table.fromstring(fp.read(header['n_table'] * table.itemsize))
+    if header['byteorder'] != sys.byteorder:
+        table.byteswap()
+    literals = header['literals']
+    if header['arrays']:
+        if np is None:
+            raise ImportError("loading this snapshot requires numpy")
+        position = (len(_MAGIC) + _LENGTH.size + header_length +
+                    len(table) * table.itemsize)
+        padding = _padding(position)
+        filename = getattr(fp, 'name', None) if isinstance(fp, file) else None
+        if mmap and filename is not None:
+            start = fp.tell() + padding
+            for i, dtype, shape, fortran, offset, nbytes in header['arrays']:
+                literals[i] = np.memmap(filename, dtype=dtype, mode='r',
+                                        offset=start + offset, shape=shape,
+                                        order='F' if fortran else 'C')
+            fp.seek(start + offset + nbytes + _padding(nbytes))
+        else:
+            fp.read(padding)
+            for i, dtype, shape, fortran, offset, nbytes in header['arrays']:
+                data = np.frombuffer(fp.read(nbytes), dtype=dtype)
+                literals[i] = data.reshape(shape,
+                                           order='F' if fortran else 'C')
+                fp.read(_padding(nbytes))
+    functions = [_import_object(name) for name in header['functions']]
+    keywords = header['keywords']
+
+    new = PartialPlus.__new__
+    nodes = []
+    append = nodes.append
+    position = 0
+    table = table.tolist()
+    end = len(table)
+    # Building many nodes triggers garbage collections, none of which can
+    # free anything: nodes only refer to nodes built before them.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while position < end:
+            kind = table[position]
+            if kind == _LITERAL:
+                append(Literal(literals[table[position + 1]]))
+                position += 2
+                continue
+            node = new(PartialPlus)
+            node.func = functions[kind]
+            n_args = table[position + 1]
+            position += 2
+            node.args = tuple([nodes[i]
+                               for i in table[position:position + n_args]])
+            position += n_args
+            n_keywords = table[position]
+            position += 1
+            if n_keywords:
+                node._keywords = dict(
+                    (keywords[table[j]], nodes[table[j + 1]])
+                    for j in xrange(position, position + 2 * n_keywords, 2))
+                position += 2 * n_keywords
+            else:
+                node._keywords = None
+            append(node)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return nodes[-1]
@@ -0,0 +1,373 @@
+import operator
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import numpy as np
+from searchspaces.partialplus import partial, evaluate, variable, choice
+from searchspaces.partialplus import Literal
+from searchspaces.partialplus import as_partialplus as as_pp
+import searchspaces
+from searchspaces.cache import ResultCache, DiskCache
+from searchspaces.cache import mark_cacheable, is_cacheable
+
+
+class Counted(object):
+    """Records how many times each name was built."""
+    def __init__(self):
+        self.calls = []
+
+    def build(self, name, *args):
+        self.calls.append(name)
+        return (name,) + args
+
+    def cacheable(self, node):
+        return node.func == self.build
+
+
+def test_cache_reuses_results():
+    """Test that cached results are reused across evaluations."""
+    c = Counted()
+    x = variable('x', value_type=int)
+    dataset = partial(c.build, 'dataset', 10)
+    model = partial(c.build, 'model', dataset, x)
+    p = as_pp([dataset, model])
+    cache = ResultCache(cacheable=c.cacheable)
+    first = evaluate(p, _cache=cache, x=1)
+    assert first == evaluate(p, x=1)
+    del c.calls[:]
+    second = evaluate(p, _cache=cache, x=2)
+    assert second[0] is first[0]
+    assert c.calls == ['model']
+    del c.calls[:]
+    assert evaluate(p, _cache=cache, x=1) == first
+    assert c.calls == []
+
+
+def test_cache_structural_keys():
+    """Test that identical subgraphs of different graphs share entries."""
+    c = Counted()
+    cache = ResultCache(cacheable=c.cacheable)
+    evaluate(partial(c.build, 'a', 1.0), _cache=cache)
+    evaluate(as_pp([partial(c.build, 'a', 1.0)]), _cache=cache)
+    assert c.calls == ['a']
+    # Equal but differently typed literals are distinct.
+    evaluate(partial(c.build, 'a', 1), _cache=cache)
+    assert c.calls == ['a', 'a']
+
+
+class Model(object):
+    pass
+
+
+@mark_cacheable
+def expensive(x):
+    return x * 2
+
+
+def test_cache_default_cacheable():
+    """Test that by default only calls marked cacheable are cached."""
+    assert is_cacheable(expensive) and not is_cacheable(operator.add)
+    assert not is_cacheable({})
+    p = as_pp([partial(Model), partial(Model), partial(operator.add, 1, 2),
+               partial(expensive, 2)])
+    cache = ResultCache()
+    results = [evaluate(p, _cache=cache) for _ in range(3)]
+    for a in results:
+        assert a[0] is not a[1] and a[2:] == [3, 4]
+    # Neither the models nor the list holding them are shared.
+    results[1].append(None)
+    assert len(results[2]) == 4 and results[0][0] is not results[1][0]
+    assert len(cache) == 1 and cache.hits == 2
+
+
+def test_cache_statistics():
+    """Test hit and miss counts, and that lazy branches don't count."""
+    c = Counted()
+    x = variable('x', value_type=['a', 'b'])
+    p = choice(x, ('a', partial(c.build, 'a')), ('b', partial(c.build, 'b')))
+    cache = ResultCache(cacheable=lambda node: node.func == c.build)
+    evaluate(p, _cache=cache, x='a')
+    assert (cache.hits, cache.misses) == (0, 1)
+    evaluate(p, _cache=cache, x='a')
+    assert (cache.hits, cache.misses) == (1, 1)
+    evaluate(p, _cache=cache, x='b')
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert c.calls == ['a', 'b']
+    assert len(cache) == 2
+
+
+def test_cache_lru_eviction():
+    """Test least-recently-used eviction by entries and by bytes."""
+    cache = ResultCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+    assert cache.evictions == 1
+    cache = ResultCache(max_bytes=10, sizeof=len)
+    cache.put('a', 'x' * 4)
+    cache.put('b', 'x' * 4)
+    cache.put('c', 'x' * 4)
+    assert len(cache) == 2 and 'a' not in cache
+    assert cache.n_bytes == 8
+    cache.put('d', 'x' * 11)
+    assert 'd' not in cache
+    cache.clear()
+    assert len(cache) == 0 and cache.n_bytes == 0
+
+
+def test_cache_fingerprints_bounded():
+    """Test that the fingerprint table is bounded, and cleared."""
+    cache = ResultCache(max_fingerprints=10, cacheable=lambda node: True)
+    for i in range(20):
+        assert evaluate(partial(operator.add, i, 1), _cache=cache) == i + 1
+        # Two literals and a call per graph.
+        assert len(cache._fingerprints) <= 10 + 3
+    p = partial(operator.add, 1, 2)
+    evaluate(p, _cache=cache)
+    evaluate(p, _cache=cache)
+    assert cache.hits == 1
+    cache.clear()
+    assert len(cache) == 0 and not cache._fingerprints
+    evaluate(p, _cache=cache)
+    assert cache.hits == 1
+
+
+def test_cache_unhashable_variable():
+    """Test that nodes depending on unhashable values are not cached."""
+    c = Counted()
+    x = variable('x', value_type=list)
+    p = partial(c.build, 'a', 1)
+    q = partial(c.build, 'b', x)
+    cache = ResultCache(cacheable=c.cacheable)
+    for _ in range(2):
+        evaluate(as_pp([p, q]), _cache=cache, x=[1, 2])
+    assert c.calls == ['a', 'b', 'b']
+
+
+def test_cache_with_executor():
+    """Test that the cache also serves parallel evaluation."""
+    class Executor(object):
+        # Runs calls immediately, standing in for a thread pool.
+        def submit(self, f, *args, **kwargs):
+            return _Done(f(*args, **kwargs))
+
+    c = Counted()
+    p = partial(operator.add, partial(c.build, 'a'), ('b',))
+    cache = ResultCache(cacheable=c.cacheable)
+    for _ in range(2):
+        assert evaluate(p, _executor=Executor(), _cache=cache) == ('a', 'b')
+    assert c.calls == ['a']
+
+
+class _Done(object):
+    def __init__(self, value):
+        self.value = value
+
+    def add_done_callback(self, f):
+        f(self)
+
+    def result(self):
+        return self.value
+
+    def cancel(self):
+        return False
+
+
+def make_range(n, scale):
+    return np.arange(n) * scale
+
+
+def test_disk_cache():
+    """Test that a disk cache is shared between cache objects."""
+    directory = tempfile.mkdtemp()
+    try:
+        x = variable('x', value_type=float)
+        p = partial(make_range, 5, x)
+        cacheable = lambda node: node.func is make_range
+        cache = DiskCache(directory, cacheable=cacheable)
+        first = evaluate(p, _cache=cache, x=2.0)
+        assert cache.misses == 1 and len(cache) == 1
+        # A fresh object, as in another process, finds the same entry.
+        other = DiskCache(directory, cacheable=cacheable)
+        second = evaluate(p, _cache=other, x=2.0)
+        assert other.hits == 1 and other.misses == 0
+        assert isinstance(second, np.memmap)
+        assert not second.flags.writeable
+        assert np.all(first == second)
+        evaluate(p, _cache=other, x=3.0)
+        assert other.misses == 1 and len(other) == 2
+        other.clear()
+        assert len(other) == 0
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_disk_cache_default_cacheable():
+    """Test that by default only calls marked cacheable are cached."""
+    directory = tempfile.mkdtemp()
+    try:
+        cache = DiskCache(directory)
+        p = partial(list, as_pp([partial(operator.add, 1, 2),
+                                 partial(expensive, 2)]))
+        assert evaluate(p, _cache=cache) == [3, 4]
+        assert len(cache) == 1
+        assert evaluate(p, _cache=cache) == [3, 4]
+        assert (cache.hits, cache.misses) == (1, 1)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_disk_cache_unnamed_functions():
+    """Test that lambdas and unpicklable values are not cached."""
+    directory = tempfile.mkdtemp()
+    try:
+        cache = DiskCache(directory, cacheable=lambda node: True)
+        evaluate(partial(lambda: 3), _cache=cache)
+        evaluate(partial(operator.add, 1, 2), _cache=cache)
+        assert len(cache) == 1
+        evaluate(partial(iter, as_pp([1])), _cache=cache)
+        assert len(cache) == 2
+    finally:
+        shutil.rmtree(directory)
+
+
+class Box(object):
+    def __init__(self, value):
+        self.value = value
+
+
+def unbox(box):
+    return box.value
+
+
+def make_adder(n):
+    def add(x):
+        return x + n
+    return add
+
+
+def test_disk_cache_unstable_literals():
+    """Test that values without a stable representation aren't keyed."""
+    directory = tempfile.mkdtemp()
+    try:
+        cache = DiskCache(directory,
+                          cacheable=lambda node: node.func is unbox)
+        # Box's repr holds an address, which freed boxes may share.
+        values = [evaluate(partial(unbox, Literal(Box(v))), _cache=cache)
+                  for v in range(6)]
+        assert values == range(6)
+        x = variable('x', value_type=Box)
+        assert [evaluate(partial(unbox, x), _cache=cache, x=Box(v))
+                for v in range(6)] == range(6)
+        assert len(cache) == 0
+        cache = DiskCache(directory, cacheable=lambda node: True)
+        # Named classes and functions, and tuples of numbers, are keyed.
+        evaluate(partial(isinstance, (1, 'a'), (tuple, Box)), _cache=cache)
+        # The call, and the two tuples.
+        assert len(cache) == 3
+        # Closures named like each other aren't keyed.
+        assert evaluate(partial(make_adder(1), 0), _cache=cache) == 1
+        assert evaluate(partial(make_adder(2), 0), _cache=cache) == 2
+        assert len(cache) == 3
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_disk_cache_corrupt_entries():
+    """Test that truncated entries are misses."""
+    directory = tempfile.mkdtemp()
+    try:
+        cache = DiskCache(directory)
+        cache.put('a', 'x' * 1000)
+        cache.put('b', np.arange(1000))
+        for name in ('a.pkl', 'b.npy'):
+            with open(os.path.join(directory, name), 'r+b') as f:
+                f.truncate(100)
+        assert cache.get('a') is None and cache.get('b') is None
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_disk_cache_eviction():
+    """Test that the least recently used entries are evicted."""
+    directory = tempfile.mkdtemp()
+    try:
+        cache = DiskCache(directory)
+        cache.put('a', 'x' * 1000)
+        size = cache.n_bytes
+        cache = DiskCache(directory, max_bytes=3 * size + 10)
+        cache.put('b', 'x' * 1000)
+        cache.put('c', 'x' * 1000)
+        for name, mtime in (('a', 1), ('b', 3), ('c', 2)):
+            os.utime(os.path.join(directory, name + '.pkl'), (mtime, mtime))
+        cache.get('a')
+        assert cache.evictions == 0
+        # Going over the limit evicts down to three quarters of it.
+        cache.put('d', 'x' * 1000)
+        assert 'a' in cache and 'd' in cache
+        assert 'b' not in cache and 'c' not in cache
+        assert cache.evictions == 2
+        cache.put('e', 'x' * 10000)
+        assert 'e' not in cache
+        assert not [f for f in os.listdir(directory)
+                    if f.startswith('.tmp')]
+    finally:
+        shutil.rmtree(directory)
+
+
+class ScanCountingDiskCache(DiskCache):
+    scans = 0
+
+    def _entries(self):
+        self.scans += 1
+        return super(ScanCountingDiskCache, self)._entries()
+
+
+def test_disk_cache_eviction_is_batched():
+    """Test that the directory isn't scanned on every put."""
+    directory = tempfile.mkdtemp()
+    try:
+        cache = ScanCountingDiskCache(directory)
+        cache.put('size', 'x' * 1000)
+        size = cache.n_bytes
+        cache.clear()
+        cache = ScanCountingDiskCache(directory, max_bytes=8 * size + 10)
+        for i in range(40):
+            cache.put(str(i), 'x' * 1000)
+        assert cache.scans < 40 // 2
+        assert cache.n_bytes <= cache.max_bytes
+        assert '39' in cache and '0' not in cache
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_disk_cache_keys_are_stable():
+    """Test that keys don't depend on the process computing them."""
+    script = (
+        "import operator\n"
+        "from searchspaces.partialplus import partial, variable\n"
+        "from searchspaces.cache import DiskCache\n"
+        "p = partial(operator.mul, variable('x', value_type=int), 2.5)\n"
+        "cache = DiskCache(%r)\n"
+        "b = cache.wrap_bindings(p, {'x': 3})\n"
+        "print b.key(p)\n"
+    )
+    # Run from elsewhere, importing this copy of the package.
+    root = os.path.dirname(os.path.dirname(
+        os.path.abspath(searchspaces.__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + filter(None, [env.get('PYTHONPATH')]))
+    directory = tempfile.mkdtemp()
+    try:
+        keys = [subprocess.check_output([sys.executable, '-c',
+                                         script % directory],
+                                        cwd=directory, env=env)
+                for _ in range(2)]
+        assert keys[0] == keys[1] and len(keys[0].strip()) == 40
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,65 @@
+import gc
+from searchspaces.delayed_eval import Delayed, is_nested, _LOCAL_NAMES
+from searchspaces.partialplus import partial, evaluate
+
+delayed = Delayed(proxy=partial)
+shadowed = 'global'
+
+
+class Geometry(object):
+    @staticmethod
+    def square(x):
+        return x * x
+
+
+def test_delayed_resolves_locals_globals_builtins():
+    """Test that names resolve in local, global, then builtin scope."""
+    def shadowed(x):
+        return 'local %s' % x
+
+    assert evaluate(delayed.shadowed(1)) == 'local 1'
+    assert evaluate(delayed.Geometry.square(delayed.float(2))) == 4.
+    raised = False
+    try:
+        delayed.not_defined_anywhere
+    except NameError:
+        raised = True
+    assert raised
+
+
+def test_delayed_resolves_enclosing_scopes():
+    """Test that names resolve in nested calling scopes."""
+    def outer():
+        def triple(x):
+            return 3 * x
+
+        def inner():
+            assert is_nested()
+            return delayed.triple(2)
+        return inner()
+    assert evaluate(outer()) == 6
+    assert not is_nested()
+
+
+def unoptimized_scope():
+    exec "def double(x): return 2 * x"
+    return delayed.double(4)
+
+
+def test_delayed_unoptimized_scope():
+    """Test that names bound by exec are resolved."""
+    assert evaluate(unoptimized_scope()) == 8
+    namespace = {'delayed': delayed}
+    exec "def triple(x): return 3 * x\np = delayed.triple(2)" in namespace
+    assert evaluate(namespace['p']) == 6
+    assert delayed.shadowed._obj_ == 'global'
+
+
+def test_local_names_not_kept():
+    """Test that names of code compiled at run time are not kept."""
+    for i in range(100):
+        namespace = {'delayed': delayed}
+        exec "def f%d(): return delayed.len" % i in namespace
+        namespace['f%d' % i]()
+    gc.collect()
+    assert len(_LOCAL_NAMES) < 100
@@ -0,0 +1,107 @@
+import numpy as np
+from searchspaces.partialplus import variable, choice
+from searchspaces.partialplus import as_partialplus as as_pp
+from searchspaces.encoding import Encoder
+from searchspaces.grid import Grid
+from searchspaces.sampling import sample
+
+
+def make_space():
+    c = variable('c', value_type=['lin', 'log', 'int'])
+    x = variable('x', value_type=float, minimum=-1., maximum=3.)
+    y = variable('y', value_type=float, minimum=1e-3, maximum=10.,
+                 log_scale=True)
+    i = variable('i', value_type=int, minimum=2, maximum=5)
+    n = variable('n', value_type=float, distribution='normal', mu=0.,
+                 sigma=2.)
+    return as_pp([choice(c, ('lin', x), ('log', y), ('int', i)), n])
+
+
+def test_encode_layout():
+    """Test the columns and values of encoded bindings."""
+    encoder = Encoder(make_space())
+    assert sorted(encoder.slices) == ['c', 'i', 'n', 'x', 'y']
+    assert encoder.width == 7
+    encoded = encoder.encode([{'c': 'lin', 'x': 2., 'n': 0.},
+                              {'c': 'log', 'y': 0.1, 'n': 1e9},
+                              {'c': 'int', 'i': 3, 'n': -1e9}])
+    assert encoded.shape == (3, 7)
+    columns = lambda name: encoded[:, encoder.slices[name]]
+    assert np.all(columns('c') == np.eye(3))
+    assert np.allclose(columns('x')[:, 0], [0.75, 0, 0])
+    assert np.allclose(columns('y')[:, 0], [0, 0.5, 0])
+    assert np.allclose(columns('i')[:, 0], [0, 0, 0.375])
+    assert np.allclose(columns('n')[:, 0], [0.5, 1, 0])
+    encoded = encoder.encode([{'c': 'lin', 'x': 2., 'n': 0.}],
+                             fill=np.nan)
+    assert np.isnan(columns('y')).all() and np.isnan(columns('i')).all()
+    assert not np.isnan(columns('x')).any()
+
+
+def test_encode_ordinal():
+    """Test ordinal encoding of categoricals."""
+    c = variable('c', value_type=['a', 'b', 'c', 'd'])
+    p = variable('p', value_type=[1, 2], distribution='categorical',
+                 p=[0.2, 0.8])
+    encoder = Encoder(as_pp([c, p]), categorical='ordinal')
+    assert encoder.width == 2
+    encoded = encoder.encode([{'c': 'a', 'p': 1}, {'c': 'd', 'p': 2}])
+    assert np.allclose(encoded, [[0.125, 0.1], [0.875, 0.6]])
+    assert encoder.decode(encoded) == [{'c': 'a', 'p': 1},
+                                       {'c': 'd', 'p': 2}]
+
+
+def test_round_trip():
+    """Test that decoding encoded bindings gives them back."""
+    p = make_space()
+    values, active = sample(p, 200, rng=0)
+    bindings = [dict((k, v[i]) for k, v in values.iteritems()
+                     if active[k][i]) for i in range(200)]
+    for categorical in ('onehot', 'ordinal'):
+        encoder = Encoder(p, categorical=categorical)
+        decoded = encoder.decode(encoder.encode(bindings))
+        for b, d in zip(bindings, decoded):
+            assert sorted(b) == sorted(d)
+            for k in b:
+                assert np.allclose(b[k], d[k]) if k != 'c' else b[k] == d[k]
+
+
+def test_round_trip_discrete():
+    """Test exact round trips over a discrete grid."""
+    c = variable('c', value_type=[None, 'b'])
+    r = variable('r', value_type=int, distribution='randint', maximum=6)
+    q = variable('q', value_type=float, distribution='quniform',
+                 minimum=0., maximum=1., q=0.25)
+    p = choice(c, (None, r), ('b', q))
+    points = list(Grid(p))
+    encoder = Encoder(p)
+    assert encoder.decode(encoder.encode(points)) == points
+
+
+def test_decode_unit_points():
+    """Test decoding arbitrary points of the unit hypercube."""
+    encoder = Encoder(make_space())
+    bindings = encoder.decode(np.random.RandomState(0).rand(100, 7))
+    for b in bindings:
+        assert set(b) in (set(['c', 'x', 'n']), set(['c', 'y', 'n']),
+                          set(['c', 'i', 'n']))
+        assert b.get('i', 2) in (2, 3, 4, 5)
+        assert isinstance(b.get('i', 2), int)
+        assert 1e-3 <= b.get('y', 1) <= 10
+
+
+def test_errors():
+    """Test that bad specifications and values raise."""
+    cases = [
+        lambda: Encoder(variable('a', value_type=float)),
+        lambda: Encoder(variable('a', value_type=[1]), categorical='bad'),
+        lambda: Encoder(variable('a', value_type=[1, 2])).encode([{'a': 3}]),
+        lambda: Encoder(variable('a', value_type=[1])).decode(np.zeros(3)),
+    ]
+    for case in cases:
+        raised = False
+        try:
+            case()
+        except ValueError:
+            raised = True
+        assert raised
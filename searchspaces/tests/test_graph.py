@@ -0,0 +1,88 @@
+import operator
+from searchspaces.partialplus import (partial, variable, is_variable_node,
+                                      variable_dependents, topological_sort)
+from searchspaces.partialplus import as_partialplus as as_pp
+from searchspaces.graph import FrozenGraph
+
+
+def build():
+    x = variable('x', value_type=int)
+    y = variable('y', value_type=float)
+    a = partial(operator.add, x, 1)
+    b = partial(operator.mul, a, a)
+    root = as_pp([b, partial(int, 5), y, variable('x', value_type=int)])
+    return root, x, y, a, b
+
+
+def test_frozen_graph_order():
+    """Test that nodes are indexed in topological order."""
+    root, x, y, a, b = build()
+    g = FrozenGraph(root)
+    assert g.nodes[0] is root
+    assert list(g.topological_sort()) == list(topological_sort(root))
+    assert (list(g.topological_sort(reverse=True)) ==
+            list(topological_sort(root, reverse=True)))
+    assert len(g) == len(g.index) == len(set(id(n) for n in g.nodes))
+    for node in g:
+        assert g.nodes[g.index[node]] is node
+        assert node in g
+    assert partial(int, 3) not in g
+
+
+def test_frozen_graph_adjacency():
+    """Test the child and parent index arrays."""
+    root, x, y, a, b = build()
+    g = FrozenGraph(root)
+    for i, node in enumerate(g.nodes):
+        assert [g.nodes[c] for c in g.children(i)] == list(node.inputs())
+        for c in g.children(i):
+            assert c > i
+            assert i in g.parents(c)
+    ib = g.index[b]
+    # b takes a twice, but is listed once as its parent.
+    assert list(g.parents(g.index[a])) == [ib]
+    assert list(g.children(ib)) == [g.index[a]] * 2
+    assert len(g.parents(0)) == 0
+
+
+def test_frozen_graph_variables():
+    """Test the variable table."""
+    root, x, y, a, b = build()
+    g = FrozenGraph(root)
+    assert set(g.variables) == set(['x', 'y'])
+    assert len(g.variables['x']) == 2 and x in g.variables['x']
+    assert g.variables['y'] == (y,)
+    for nodes in g.variables.itervalues():
+        assert all(is_variable_node(n) for n in nodes)
+    assert g.variables is g.variables
+
+
+def test_frozen_graph_func_counts():
+    """Test the per-function node counts."""
+    root, x, y, a, b = build()
+    g = FrozenGraph(root)
+    assert g.func_counts[operator.add] == 1
+    assert g.func_counts[operator.mul] == 1
+    assert g.func_counts[int] == 1
+    assert sum(g.func_counts.values()) == len(g)
+
+
+def test_frozen_graph_variable_dependents():
+    """Test that variable dependents match the uncached function."""
+    root, x, y, a, b = build()
+    g = FrozenGraph(root)
+    assert g.variable_dependents == variable_dependents(root)
+    assert g.variable_dependents is g.variable_dependents
+
+
+def test_frozen_graph_cycle_detection():
+    """Test that freezing a graph with a directed cycle raises."""
+    p1 = partial(float, 5)
+    p2 = partial(int, p1)
+    p1.append_arg(p2)
+    raised = False
+    try:
+        FrozenGraph(p2)
+    except ValueError:
+        raised = True
+    assert raised
@@ -0,0 +1,122 @@
+import itertools
+from searchspaces.partialplus import variable, choice, evaluate
+from searchspaces.partialplus import as_partialplus as as_pp
+from searchspaces.grid import Grid
+
+
+def test_grid_product():
+    """Test that unconditional variables form a Cartesian product."""
+    p = as_pp([variable('a', value_type=['x', 'y']),
+               variable('b', value_type=int, minimum=1, maximum=3),
+               variable('c', value_type=int, distribution='randint',
+                        maximum=1)])
+    grid = Grid(p)
+    assert len(grid) == grid.count == 12
+    expected = [dict(a=a, b=b, c=c) for a, b, c in
+                itertools.product(['x', 'y'], [1, 2, 3], [0, 1])]
+    assert list(grid) == expected
+    assert grid[-1] == expected[-1]
+    assert evaluate(p, **grid[5]) == ['x', 3, 1]
+
+
+def test_grid_choice():
+    """Test that inactive branches don't multiply the grid."""
+    c = variable('c', value_type=['a', 'b'])
+    x = variable('x', value_type=int, minimum=0, maximum=9)
+    y = variable('y', value_type=[1, 2, 3])
+    z = variable('z', value_type=[True, False])
+    grid = Grid(as_pp([z, choice(c, ('a', x), ('b', y))]))
+    assert len(grid) == 2 * (10 + 3)
+    points = list(grid)
+    assert len(set(tuple(sorted(p.items())) for p in points)) == 26
+    for p in points:
+        assert set(p) == set(['z', 'c', 'x' if p['c'] == 'a' else 'y'])
+
+
+def test_grid_nested_and_shared():
+    """Test nested choices, and variables shared between branches."""
+    c = variable('c', value_type=['a', 'b', 'n'])
+    d = variable('d', value_type=[0, 1])
+    x = variable('x', value_type=int, minimum=0, maximum=4)
+    y = variable('y', value_type=[1, 2, 3])
+    p = choice(c, ('a', x), ('b', as_pp([x, y])[d]), ('n', 0))
+    grid = Grid(p)
+    # x is used in two branches of c, so it is enumerated whatever c is.
+    assert len(grid) == 5 * (1 + (1 + 3) + 1)
+    for point in grid:
+        evaluate(p, **point)
+        assert ('d' in point) == (point['c'] == 'b')
+        assert ('y' in point) == (point.get('d') == 1)
+        assert 'x' in point
+
+
+def test_grid_random_access_and_chunks():
+    """Test that chunks cover the grid in order."""
+    c = variable('c', value_type=['a', 'b'])
+    p = choice(c, ('a', variable('x', value_type=range(7))),
+               ('b', variable('y', value_type=int, distribution='quniform',
+                              minimum=0, maximum=10, q=2.5)))
+    grid = Grid(p)
+    assert len(grid) == 7 + 5
+    points = list(grid)
+    assert [grid[i] for i in range(len(grid))] == points
+    chunks = list(grid.iter_chunks(5))
+    assert [len(ch) for ch in chunks] == [5, 5, 2]
+    assert sum(chunks, []) == points
+    assert sum(grid.iter_chunks(3, start=4, stop=9), []) == points[4:9]
+    raised = False
+    try:
+        grid[len(grid)]
+    except IndexError:
+        raised = True
+    assert raised
+
+
+def test_grid_huge():
+    """Test that huge grids are never materialized."""
+    p = as_pp([variable('v%d' % i, value_type=range(10)) for i in range(30)])
+    grid = Grid(p)
+    assert grid.count == 10 ** 30
+    assert grid[grid.count - 1] == dict(('v%d' % i, 9) for i in range(30))
+    assert len(next(grid.iter_chunks(4, start=10 ** 29))) == 4
+
+
+def test_grid_continuous():
+    """Test that continuous variables can't be enumerated."""
+    raised = False
+    try:
+        Grid(variable('f', value_type=float, minimum=0., maximum=1.))
+    except ValueError:
+        raised = True
+    assert raised
+
+
+def test_grid_equal_options():
+    """Test that options select the branches of keys they equal."""
+    c = variable('c', value_type=[True, 'b', 2.0])
+    x = variable('x', value_type=[0, 1, 2])
+    y = variable('y', value_type=[0, 1])
+    p = choice(c, (1, x), ('b', y), (2, 5))
+    grid = Grid(p)
+    assert len(grid) == 3 + 2 + 1
+    assert [point['c'] for point in grid] == [True] * 3 + ['b'] * 2 + [2.0]
+    for point in grid:
+        evaluate(p, **point)
+        assert ('x' in point) == (point['c'] is True)
+
+
+def test_grid_sequence_indices():
+    """Test negative indices, and indices out of the sequence's range."""
+    d = variable('d', value_type=[-1, 0])
+    x = variable('x', value_type=[0, 1, 2])
+    p = as_pp([0, x])[d]
+    grid = Grid(p)
+    assert len(grid) == 3 + 1
+    assert [evaluate(p, **point) for point in grid] == [0, 1, 2, 0]
+    for value_type in ([0, 1, 2], [-3, 0], ['a', 0]):
+        raised = False
+        try:
+            Grid(as_pp([0, x])[variable('d', value_type=value_type)])
+        except ValueError:
+            raised = True
+        assert raised
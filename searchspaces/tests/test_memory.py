@@ -0,0 +1,169 @@
+import os
+import shutil
+import tempfile
+import weakref
+from searchspaces.partialplus import partial, variable, choice, evaluate
+from searchspaces.partialplus import as_partialplus as as_pp
+from searchspaces.cache import ResultCache
+from searchspaces.memory import MemoryManager
+from searchspaces.test_utils import skip_if_no_module
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    pass
+try:
+    import numpy as np
+except ImportError:
+    pass
+
+
+class Blob(object):
+    def __init__(self, size):
+        self.size = size
+
+
+def blob_size(value):
+    return value.size if isinstance(value, Blob) else 0
+
+
+def load(size):
+    return Blob(size)
+
+
+def transform(blob):
+    return Blob(blob.size)
+
+
+def summarize(*blobs):
+    return sum(b.size for b in blobs)
+
+
+def test_memory_frees_consumed_values():
+    """Test that a chain only holds two values at a time."""
+    p = partial(summarize, partial(transform, partial(transform,
+                                                      partial(load, 100))))
+    memory = MemoryManager(sizeof=blob_size)
+    assert evaluate(p, _memory=memory) == 100
+    assert memory.peak_bytes == 200
+    assert memory.retained_bytes == 0
+    assert memory.released == 3
+    # Pinned blobs are all held to the end.
+    outer = p.args[0]
+    memory = MemoryManager(pinned=[outer, outer.args[0],
+                                   outer.args[0].args[0]],
+                           sizeof=blob_size)
+    assert evaluate(p, _memory=memory) == 100
+    assert memory.peak_bytes == 300 and memory.retained_bytes == 300
+
+
+def test_memory_values_collected():
+    """Test that freed values are actually garbage collected."""
+    refs = []
+
+    def keep_ref(blob):
+        refs.append(weakref.ref(blob))
+        return blob
+
+    def check_freed(blob):
+        assert refs[0]() is None
+        return blob
+
+    p = partial(check_freed,
+                partial(transform, partial(keep_ref, partial(load, 10))))
+    assert evaluate(p, _memory=MemoryManager()).size == 10
+    # Without freeing, the loaded blob is still alive at the end.
+    refs = []
+    raised = False
+    try:
+        evaluate(p)
+    except AssertionError:
+        raised = True
+    assert raised
+
+
+def test_memory_shared_and_choice():
+    """Test that shared values live until their last consumer."""
+    raw = partial(load, 50)
+    c = variable('c', value_type=['a', 'b'])
+    p = as_pp([partial(summarize, raw),
+               choice(c, ('a', partial(transform, raw)),
+                      ('b', partial(load, 7)))])
+    memory = MemoryManager(sizeof=blob_size)
+    result = evaluate(p, _memory=memory, c='a')
+    assert result[0] == 50 and result[1].size == 50
+    assert memory.peak_bytes == 100
+    # Only the root's list is retained (its blob isn't an int).
+    assert memory.retained_bytes == 0
+    result = evaluate(p, _memory=memory, c='b')
+    assert result[1].size == 7
+    assert memory.peak_bytes == 57
+
+
+@skip_if_no_module('concurrent.futures')
+def test_memory_executor():
+    """Test freeing values during concurrent evaluation."""
+    raw = partial(load, 10)
+    p = as_pp([partial(summarize, partial(transform, raw)),
+               partial(summarize, partial(transform, raw))])
+    memory = MemoryManager(sizeof=blob_size)
+    executor = ThreadPoolExecutor(2)
+    try:
+        assert evaluate(p, _executor=executor, _memory=memory) == [10, 10]
+    finally:
+        executor.shutdown()
+    assert 20 <= memory.peak_bytes <= 30
+    assert memory.retained_bytes == 0
+
+
+def test_memory_with_cache_raises():
+    """Test that memory and cache can't be combined."""
+    raised = False
+    try:
+        evaluate(partial(load, 1), _cache=ResultCache(),
+                 _memory=MemoryManager())
+    except ValueError:
+        raised = True
+    assert raised
+
+
+def make_array(n, value):
+    return np.ones(n) * value
+
+
+def total(*arrays):
+    return sum(a.sum() for a in arrays)
+
+
+@skip_if_no_module('numpy')
+def test_memory_budget_spills_arrays():
+    """Test that arrays over budget are spilled and mapped back."""
+    directory = tempfile.mkdtemp()
+    try:
+        arrays = [partial(make_array, 1000, i) for i in range(4)]
+        p = as_pp([partial(total, *arrays), as_pp(arrays)[2]])
+        memory = MemoryManager(budget=20000, directory=directory)
+        result = evaluate(p, _memory=memory)
+        assert result[0] == 6000
+        assert np.all(result[1] == 2)
+        assert memory.spilled >= 2
+        assert memory.spilled_bytes >= memory.spilled * 8000
+        assert memory.peak_bytes <= 20000 + 8100
+        # Files are removed as soon as they are mapped.
+        assert os.listdir(directory) == []
+        memory = MemoryManager(directory=directory)
+        assert evaluate(p, _memory=memory)[0] == 6000
+        assert memory.spilled == 0 and memory.peak_bytes > 32000
+    finally:
+        shutil.rmtree(directory)
+
+
+@skip_if_no_module('numpy')
+def test_memory_budget_keeps_root_and_pinned():
+    """Test that the root and pinned values are never spilled."""
+    pinned = partial(make_array, 1000, 1)
+    p = partial(make_array, 2000, partial(total, pinned))
+    memory = MemoryManager(pinned=[pinned], budget=100)
+    result = evaluate(p, _memory=memory)
+    assert type(result) is np.ndarray and np.all(result == 1000)
+    assert memory.spilled == 0
+    assert memory.retained_bytes > 24000
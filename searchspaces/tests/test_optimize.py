@@ -0,0 +1,151 @@
+from searchspaces.partialplus import partial, evaluate, variable, Literal
+from searchspaces.partialplus import choice
+from searchspaces.partialplus import as_partialplus as as_pp
+from searchspaces.partialplus import depth_first_traversal, mark_pure
+from searchspaces.optimize import eliminate_common_subexpressions
+from searchspaces.optimize import fold_constants, optimize
+
+
+def count_nodes(root):
+    return len(list(depth_first_traversal(root)))
+
+
+def test_cse_merges_literals_and_pure_calls():
+    """Test that structurally identical pure subgraphs are merged."""
+    x = variable('x', value_type=int)
+    y = variable('y', value_type=int)
+    p = as_pp([partial(float, 3) + x, partial(float, 3) + x, y, y])
+    before = count_nodes(p)
+    q, n_removed = eliminate_common_subexpressions(p)
+    assert n_removed > 0
+    assert count_nodes(q) == before - n_removed
+    assert q.args[0] is q.args[1]
+    assert q.args[2] is q.args[3]
+    assert evaluate(q, x=1, y=2) == evaluate(p, x=1, y=2)
+    # Defaults shared by both variables are merged, names are not.
+    assert x.keywords['minimum'] is not y.keywords['minimum']
+    assert (q.args[0].args[1].keywords['minimum'] is
+            q.args[2].keywords['minimum'])
+    assert (q.args[0].args[1].keywords['name'] is not
+            q.args[2].keywords['name'])
+
+
+def test_cse_keeps_impure_calls():
+    """Test that calls to functions not marked pure are never merged."""
+    class Foo(object):
+        pass
+    p = as_pp([partial(Foo), partial(Foo)])
+    q, n_removed = eliminate_common_subexpressions(p)
+    assert n_removed == 0
+    assert q is p
+    r = evaluate(q)
+    assert r[0] is not r[1]
+
+
+def test_cse_literal_types():
+    """Test that equal literals of different types are kept apart."""
+    p = as_pp((1, 1.0, True, 0.0, -0.0, 1))
+    q, n_removed = eliminate_common_subexpressions(p)
+    assert n_removed == 1
+    r = evaluate(q)
+    assert [type(v) for v in r] == [int, float, bool, float, float, int]
+    assert repr(r[4]) == '-0.0'
+
+
+def test_cse_container_literal_types():
+    """Test that literal tuples and frozensets are compared by type too."""
+    values = [(1,), (1.0,), (True,), (0.0,), (-0.0,), ((1,),), ((1.0,),),
+              frozenset([1]), frozenset([1.0]), frozenset([True]),
+              frozenset([0.0]), frozenset([-0.0]), (1,)]
+    p = as_pp([Literal(v) for v in values])
+    q, n_removed = eliminate_common_subexpressions(p)
+    assert n_removed == 1
+    r = evaluate(q)
+    assert [repr(v) for v in r] == [repr(v) for v in values]
+
+
+def test_cse_does_not_modify_input():
+    """Test that the original graph is left untouched."""
+    p = as_pp([partial(int, 2) + 1, partial(int, 2) + 1])
+    args = p.args
+    q, n_removed = eliminate_common_subexpressions(p)
+    assert n_removed == 4
+    assert p.args is args
+    assert p.args[0] is not p.args[1]
+    assert isinstance(q.args[0].args[1], Literal)
+
+
+def test_fold_constants():
+    """Test that literal-only pure subgraphs become literals."""
+    p = partial(float, 3) * 2 + 1
+    q, n_folded = fold_constants(p)
+    assert n_folded == 3
+    assert isinstance(q, Literal) and q.value == 7.0
+    x = variable('x', value_type=int)
+    p = as_pp((x + partial(int, 2) * 3, (1, 2)))
+    q, n_folded = fold_constants(p)
+    assert n_folded == 3
+    assert q.func is p.func
+    assert q.args[0].args[0] is x
+    assert q.args[0].args[1].value == 6
+    assert q.args[1].value == (1, 2)
+    assert evaluate(q, x=1) == evaluate(p, x=1)
+
+
+def test_fold_constants_keeps_impure_calls():
+    """Test that calls not declared pure are left alone."""
+    def shout(s):
+        return s.upper()
+    p = as_pp([partial(shout, 'a'), {'b': 1}, [2]])
+    q, n_folded = fold_constants(p)
+    assert n_folded == 0 and q is p
+    mark_pure(shout)
+    q, n_folded = fold_constants(p)
+    assert n_folded == 1
+    assert q.args[0].value == 'A'
+    assert evaluate(q) == evaluate(p)
+
+
+def test_fold_constants_keeps_variables():
+    """Test that variables and their inputs are not folded."""
+    x = variable('x', value_type=(1, 2), maximum=partial(int, 3))
+    q, n_folded = fold_constants(x)
+    assert n_folded == 0 and q is x
+
+
+def test_fold_constants_choice():
+    """Test that choices still evaluate lazily after folding."""
+    def dont_eval():
+        assert 0, 'Evaluate does not need this, should not eval'
+    p = choice(variable('c', value_type=['a', 'b', 'c']),
+               ('a', 1), ('b', partial(int, 2)), ('c', partial(dont_eval)))
+    q, n_folded = fold_constants(p)
+    assert n_folded == 1
+    assert evaluate(q, c='a') == 1
+    assert evaluate(q, c='b') == 2
+
+
+def test_fold_constants_leaves_errors():
+    """Test that calls raising when folded are left to raise later."""
+    p = as_pp([partial(int, 'abc'), partial(int, '5')])
+    q, n_folded = fold_constants(p)
+    assert n_folded == 1
+    assert q.args[0] is p.args[0]
+    assert q.args[1].value == 5
+
+
+def test_optimize():
+    """Test that optimize runs passes in order."""
+    x = variable('x', value_type=int)
+    p = as_pp([x * (partial(int, 2) + 1), x * (partial(int, 1) + 2)])
+    q = optimize(p)
+    assert q.args[0] is q.args[1]
+    assert evaluate(q, x=2) == evaluate(p, x=2) == [6, 6]
+    assert optimize(p, passes=()) is p
+    seen = []
+
+    def record(root):
+        seen.append(root)
+        return root, 0
+    optimize(p, passes=[record, fold_constants, record])
+    assert seen[0] is p and seen[1] is not p
@@ -1,9 +1,20 @@
 from collections import OrderedDict
 import operator
+import threading
+import weakref
 from searchspaces.partialplus import partial, Literal, choice
 from searchspaces.partialplus import evaluate, variable, is_indexable
+from searchspaces.partialplus import evaluate_batch, variable_dependents
+from searchspaces.partialplus import _LayeredBindings
+from searchspaces.partialplus import EvaluationSession, iter_evaluate
+from searchspaces.partialplus import evaluate_async
 from searchspaces.partialplus import depth_first_traversal, topological_sort
 from searchspaces.partialplus import as_partialplus as as_pp
+from searchspaces.test_utils import skip_if_no_module
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    pass
 
 
 def test_is_indexable():
@@ -364,3 +375,486 @@ def test_choice_raises():
     except ValueError:
         raised = True
     assert raised
+
+
+def test_evaluate_deep_graph():
+    """Test that evaluation does not hit the recursion limit."""
+    p = partial(int, 0)
+    for _ in xrange(5000):
+        p = p + 1
+    assert evaluate(p) == 5000
+    q = partial(int, 0)
+    for i in xrange(5000):
+        q = as_pp([q, partial(float, i)])[0]
+    assert evaluate(q) == 0
+
+
+def test_evaluate_order():
+    """Test that inputs are evaluated depth-first, left to right."""
+    order = []
+
+    def record(name, *args, **kwargs):
+        order.append(name)
+        return name
+
+    a = partial(record, 'a')
+    b = partial(record, 'b', a)
+    c = partial(record, 'c', a, x=partial(record, 'd'))
+    evaluate(partial(record, 'e', b, c))
+    assert order == ['a', 'b', 'd', 'c', 'e']
+
+
+def test_evaluate_cycle_detection():
+    """Test that evaluate raises on a graph with a directed cycle."""
+    p1 = partial(float, 5)
+    p2 = partial(int, p1)
+    p1.append_arg(p2)
+    raised = False
+    try:
+        evaluate(p2)
+    except ValueError:
+        raised = True
+    assert raised
+
+
+def test_evaluate_option_names_bind_variables():
+    """Test that variables named like evaluate's options are bound."""
+    names = ['executor', 'cache', 'profiler', 'memory']
+    p = as_pp([variable(name, value_type=int) + 1 for name in names])
+    bindings = dict((name, i) for i, name in enumerate(names))
+    assert evaluate(p, **bindings) == [1, 2, 3, 4]
+    assert list(iter_evaluate(p, **bindings))[-1] == (p, [1, 2, 3, 4])
+
+
+@skip_if_no_module('concurrent.futures')
+def test_evaluate_executor():
+    """Test that evaluating with an executor matches evaluate."""
+    def add(x, y):
+        return x + y
+
+    def dont_eval():
+        assert 0, 'Evaluate does not need this, should not eval'
+
+    x = variable('x', value_type=int)
+    cases = [
+        (as_pp([[3, partial(add, 2, 3)], partial(float, 9)]), {}),
+        (as_pp({5: partial(add, 5, 3), 3: (7, 9), 4: [1]}), {}),
+        (partial(dict, a=partial(add, 1, 2), b=[3, 4]), {}),
+        (as_pp([x, partial(add, x, x)]), {'x': 4}),
+        (as_pp([-1, partial(dont_eval)])[0], {}),
+        (as_pp((-1, 0, 1, partial(dont_eval)))[:3], {}),
+        (as_pp({'a': partial(dont_eval), 'b': 3})['b'], {}),
+        (choice(variable('c', value_type=['a', 'b']),
+                ('a', partial(float, 2)),
+                ('b', partial(dont_eval))), {'c': 'a'}),
+        (as_pp(5), {}),
+    ]
+    executor = ThreadPoolExecutor(4)
+    try:
+        for p, bindings in cases:
+            assert (evaluate(p, _executor=executor, **bindings) ==
+                    evaluate(p, **bindings))
+    finally:
+        executor.shutdown()
+
+
+@skip_if_no_module('concurrent.futures')
+def test_evaluate_executor_concurrent():
+    """
+    Test that independent calls run concurrently, and that a node
+    shared between them runs once.
+    """
+    calls = []
+    events = [threading.Event(), threading.Event()]
+
+    def rendezvous(i, shared):
+        # Each call waits for the other, which deadlocks unless both
+        # are running at once.
+        events[i].set()
+        return events[1 - i].wait(10)
+
+    def make_shared():
+        calls.append(None)
+        return object()
+
+    shared = partial(make_shared)
+    p = as_pp([partial(rendezvous, 0, shared),
+               partial(rendezvous, 1, shared)])
+    executor = ThreadPoolExecutor(2)
+    try:
+        assert evaluate(p, _executor=executor) == [True, True]
+    finally:
+        executor.shutdown()
+    assert len(calls) == 1
+
+
+@skip_if_no_module('concurrent.futures')
+def test_evaluate_executor_errors():
+    """Test that errors and cycles are reported with an executor."""
+    def fail():
+        raise ZeroDivisionError()
+
+    executor = ThreadPoolExecutor(2)
+    try:
+        raised = False
+        try:
+            evaluate(as_pp([partial(float, 1), partial(fail)]),
+                     _executor=executor)
+        except ZeroDivisionError:
+            raised = True
+        assert raised
+        p1 = partial(float, 5)
+        p2 = partial(int, p1)
+        p1.append_arg(p2)
+        raised = False
+        try:
+            evaluate(p2, _executor=executor)
+        except ValueError:
+            raised = True
+        assert raised
+    finally:
+        executor.shutdown()
+
+
+def test_iter_evaluate():
+    """Test that iter_evaluate yields each node evaluated, root last."""
+    def dont_eval():
+        assert 0, 'Evaluate does not need this, should not eval'
+
+    x = variable('x', value_type=int)
+    cases = [
+        (as_pp([[3, partial(float, 2)], x + 1]), {'x': 4}),
+        (as_pp({'a': partial(dont_eval), 'b': partial(float, 3)})['b'], {}),
+        (choice(variable('c', value_type=['a', 'b']),
+                ('a', partial(float, 2)),
+                ('b', partial(dont_eval))), {'c': 'a'}),
+    ]
+    for p, bindings in cases:
+        results = list(iter_evaluate(p, **bindings))
+        assert results[-1] == (p, evaluate(p, **bindings))
+        nodes = [node for node, _ in results]
+        assert len(set(nodes)) == len(nodes)
+        assert not any(isinstance(node, Literal) for node in nodes)
+    # Each node follows its inputs.
+    p = as_pp([partial(float, 1), partial(int, partial(float, 2))])
+    nodes = [node for node, _ in iter_evaluate(p)]
+    assert nodes.index(p.args[1].args[0]) < nodes.index(p.args[1])
+    assert list(iter_evaluate(as_pp(5))) == []
+
+
+def test_iter_evaluate_stops_early():
+    """Test that no calls are made once iteration stops."""
+    calls = []
+
+    def record(i):
+        calls.append(i)
+        return i
+
+    p = as_pp([partial(record, i) for i in range(5)])
+    results = iter_evaluate(p)
+    node, value = next(results)
+    assert calls == [value]
+    results.close()
+    assert len(calls) == 1
+    assert evaluate(p) == range(5)
+
+
+@skip_if_no_module('concurrent.futures')
+def test_iter_evaluate_executor():
+    """Test that results are yielded as they complete."""
+    event = threading.Event()
+    cancelled = []
+
+    def slow():
+        return event.wait(10)
+
+    def fast(i):
+        return i
+
+    def never():
+        cancelled.append(None)
+
+    p = as_pp([partial(slow), partial(fast, 1), partial(fast, 2)])
+    executor = ThreadPoolExecutor(2)
+    try:
+        results = iter_evaluate(p, _executor=executor)
+        first = [next(results), next(results)]
+        # The fast calls complete while the slow one is still running.
+        assert sorted(value for _, value in first) == [1, 2]
+        event.set()
+        assert list(results)[-1] == (p, [True, 1, 2])
+    finally:
+        executor.shutdown()
+    # Closing the iterator cancels calls that have not started: here,
+    # the single worker is busy with `slow` once `fast` completes.
+    # Calls are submitted in reverse order of their position.
+    event.clear()
+    q = as_pp([partial(never) for _ in range(5)] +
+              [partial(slow), partial(fast, 0)])
+    executor = ThreadPoolExecutor(1)
+    try:
+        results = iter_evaluate(q, _executor=executor)
+        assert next(results) == (q.args[-1], 0)
+        results.close()
+        event.set()
+    finally:
+        executor.shutdown()
+    assert cancelled == []
+
+
+@skip_if_no_module('concurrent.futures')
+def test_evaluate_async():
+    """Test that futures returned by calls are waited for concurrently."""
+    events = [threading.Event(), threading.Event()]
+
+    def rendezvous(i):
+        # Each read waits for the other, which deadlocks unless the
+        # second is submitted before the first is waited for.
+        events[i].set()
+        return events[1 - i].wait(10)
+
+    def read(i):
+        return io.submit(rendezvous, i)
+
+    def fail():
+        raise ZeroDivisionError()
+
+    io = ThreadPoolExecutor(2)
+    try:
+        x = variable('x', value_type=int)
+        p = as_pp([partial(int, partial(read, 0)), partial(read, 1), x])
+        result = evaluate_async(p, x=3)
+        assert result.result(20) == [1, True, 3]
+        assert evaluate_async(as_pp(5)).result(10) == 5
+        memory = variable('memory', value_type=int)
+        assert evaluate_async(memory + 1, memory=3).result(10) == 4
+        result = evaluate_async(partial(float, partial(io.submit, fail)))
+        raised = False
+        try:
+            result.result(10)
+        except ZeroDivisionError:
+            raised = True
+        assert raised
+        # Synchronously, nodes are bound to the futures themselves.
+        assert evaluate(partial(read, 0)).result(10) is True
+    finally:
+        io.shutdown()
+
+
+class Interrupt(BaseException):
+    pass
+
+
+@skip_if_no_module('concurrent.futures')
+def test_evaluate_async_thread():
+    """Test that the evaluation thread is a daemon reporting any error."""
+    threads = []
+
+    def interrupt():
+        threads.append(threading.current_thread())
+        raise Interrupt()
+
+    result = evaluate_async(partial(interrupt))
+    assert isinstance(result.exception(10), Interrupt)
+    assert threads[0].daemon
+
+
+def test_evaluate_batch():
+    """Test that evaluate_batch matches evaluate for each configuration."""
+    x = variable(name='x', value_type=int)
+    y = variable(name='y', value_type=float)
+    p = as_pp({3: x, 'a': [y, [y]], 'b': partial(float, 4) + x})
+    configs = [{'x': 1, 'y': 2.0}, {'x': 5, 'y': -1.0}]
+    assert evaluate_batch(p, configs) == [evaluate(p, **c) for c in configs]
+    columns = {'x': [1, 5], 'y': [2.0, -1.0]}
+    assert evaluate_batch(p, columns) == [evaluate(p, **c) for c in configs]
+
+
+def test_evaluate_batch_shares_independent_nodes():
+    """
+    Test that variable-independent nodes are evaluated once per batch
+    and variable-dependent nodes once per configuration.
+    """
+    calls = []
+
+    class Foo(object):
+        def __init__(self, *args):
+            calls.append(args)
+
+    x = variable(name='x', value_type=[0, 1])
+    fixed = partial(Foo)
+    lazy = partial(Foo, 'lazy')
+    p = as_pp([fixed, partial(Foo, fixed, x), as_pp([0, lazy])[x]])
+    r = evaluate_batch(p, {'x': [0, 1, 0, 1]})
+    assert len(calls) == 1 + 4 + 1
+    assert all(q[0] is r[0][0] for q in r)
+    assert r[1][2] is r[3][2]
+    assert r[0][1] is not r[2][1]
+
+
+def test_layered_bindings():
+    """Test that batch bindings read through to shared values."""
+    node = partial(float, 1)
+    shared = {node: 'shared'}
+    bindings = _LayeredBindings(shared, {'x': 1})
+    assert node in bindings and bindings[node] == 'shared'
+    assert 'x' in bindings and 'y' not in bindings
+    bindings[partial(int, 2)] = 2
+    # Shared values are not copied into the layer.
+    assert len(bindings) == 2 and len(shared) == 1
+
+
+def test_variable_dependents():
+    """Test that variable_dependents finds exactly the dependent nodes."""
+    x = variable(name='x', value_type=int)
+    a = partial(float, 3)
+    b = a + x
+    c = as_pp([a, b])
+    deps = variable_dependents(c)
+    assert x in deps and b in deps and c in deps
+    assert a not in deps
+    assert x.keywords['name'] not in deps
+
+
+def test_evaluation_session():
+    """
+    Test that an EvaluationSession only recomputes nodes downstream of
+    variables whose values changed.
+    """
+    calls = []
+
+    def record(name, *args):
+        calls.append(name)
+        return (name,) + args
+
+    x = variable(name='x', value_type=int)
+    y = variable(name='y', value_type=int)
+    a = partial(record, 'a', x)
+    b = partial(record, 'b', y)
+    c = partial(record, 'c', a, b)
+    expected = evaluate(c, x=1, y=3)
+    session = EvaluationSession(c)
+    del calls[:]
+    session.evaluate(x=1, y=2)
+    assert sorted(calls) == ['a', 'b', 'c']
+    del calls[:]
+    assert session.evaluate(x=1, y=3) == expected
+    assert sorted(calls) == ['b', 'c']
+    assert session.n_invalidated == 3
+    del calls[:]
+    session.evaluate(x=1, y=3)
+    assert calls == []
+    assert session.n_invalidated == 0
+    r1 = session.evaluate(x=4, y=3)
+    r2 = session.evaluate(x=4, y=3)
+    assert r1 is r2
+    assert sorted(calls) == ['a', 'c']
+
+
+def test_evaluation_session_lazy_branches():
+    """Test that sessions handle branches selected by a variable."""
+    p = choice(variable('x', value_type=['a', 'b']),
+               ('a', partial(float, 2)),
+               ('b', variable('y', value_type=int) + 1))
+    session = EvaluationSession(p)
+    assert session.evaluate(x='a') == 2.0
+    assert session.evaluate(x='b', y=3) == 4
+    assert session.evaluate(x='b', y=5) == 6
+    assert session.evaluate(x='a', y=5) == 2.0
+    raised = False
+    try:
+        session.evaluate(x='b')
+    except KeyError:
+        raised = True
+    assert raised
+
+
+def test_compact_nodes():
+    """Test that nodes are slot-based and keep the partial-like API."""
+    p = partial(operator.add, 1, 2)
+    q = partial(dict, a=p)
+    for node in (p, q, Literal(3)):
+        assert not hasattr(node, '__dict__')
+    assert p.func is operator.add
+    assert p.args == (Literal(1), Literal(2))
+    assert p.keywords == {}
+    assert q.keywords == {'a': p}
+    assert q.inputs() == (p,)
+    p.keywords['b'] = Literal(4)
+    assert p.inputs()[-1] == Literal(4)
+    assert weakref.ref(p)() is p
+    literal = Literal(3)
+    assert weakref.ref(literal)() is literal
+    raised = False
+    try:
+        literal.value = 4
+    except AttributeError:
+        raised = True
+    assert raised
+    assert literal.value == 3
+
+
+def test_reading_keywords_does_not_store():
+    """Test that nodes without keywords keep none after being read."""
+    from searchspaces.optimize import optimize
+    from searchspaces.plan import compile as compile_plan
+    x = variable('x', value_type=int)
+    p = partial(operator.add, partial(operator.mul, 2, 3), x)
+    nodes = [n for n in topological_sort(p) if isinstance(n, type(p))
+             and n is not x]
+    for node in nodes:
+        assert node.keywords == {}
+        assert 'a' not in node.keywords
+    p.clone()
+    optimize(p)
+    compile_plan(p)
+    assert evaluate(p, x=1) == 7
+    for node in nodes:
+        assert node._keywords is None
+    # Writing through the returned dictionary still attaches it.
+    node.keywords.setdefault('b', Literal(1))
+    assert node._keywords == {'b': Literal(1)}
+
+
+def test_pickle_round_trip():
+    """Test that nodes can be pickled and unpickled."""
+    import pickle
+    p = as_pp({'a': partial(operator.add, 1, 2), 'b': [3, 4.5]})
+    for protocol in (0, pickle.HIGHEST_PROTOCOL):
+        q = pickle.loads(pickle.dumps(p, protocol))
+        assert evaluate(q) == evaluate(p)
+
+
+def test_topological_sort_reverse():
+    """Test that the reverse topological sort puts inputs first."""
+    p1 = partial(float, 5)
+    p2 = p1 + 0.5
+    p3 = p1 / p2
+    p4 = p2 * p3
+    p5 = partial(int, p4)
+    forward = list(topological_sort(p5))
+    backward = list(topological_sort(p5, reverse=True))
+    assert backward == forward[::-1]
+    assert backward[-1] is p5
+    for node in backward:
+        for child in node.inputs():
+            assert backward.index(child) < backward.index(node)
+
+
+def test_topological_sort_wide():
+    """Test topological sort on a wide graph with shared inputs."""
+    shared = partial(float, 1)
+    p = as_pp([shared + i for i in range(2000)] + [shared])
+    order = list(topological_sort(p))
+    assert len(order) == len(set(order)) == 1 + 2000 * 2 + 2
+    assert order.index(shared) > max(order.index(a) for a in p.args[:-1])
+
+
+def test_clone():
+    """Test that clone copies every node and preserves sharing."""
+    q = partial(float, 5)
+    p = as_pp([q, q + 1, {'a': q}])
+    c = p.clone()
+    assert evaluate(c) == evaluate(p)
+    assert set(depth_first_traversal(c)).isdisjoint(depth_first_traversal(p))
+    assert c.args[0] is c.args[1].args[0]
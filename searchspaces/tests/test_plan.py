@@ -0,0 +1,145 @@
+from collections import OrderedDict
+import operator
+from searchspaces.partialplus import partial, choice, evaluate, variable
+from searchspaces.partialplus import as_partialplus as as_pp
+from searchspaces.plan import compile
+
+
+def dont_eval():
+    # -- This function body should never be evaluated.
+    assert 0, 'Evaluate does not need this, should not eval'
+
+
+def test_compile_matches_evaluate():
+    """Test that plans produce the same values as evaluate."""
+    def add(x, y):
+        return x + y
+
+    def check(p, bindings=None):
+        bindings = {} if bindings is None else bindings
+        assert compile(p)(**bindings) == evaluate(p, **bindings)
+
+    yield check, as_pp(((3, partial(add, 2, 3)), partial(add, 5, 7)))
+    yield check, as_pp([[3, partial(add, 2, 3)], partial(float, 9)])
+    yield check, as_pp({5: partial(add, 5, 3), 3: (7, 9), 4: [1]})
+    yield check, as_pp(OrderedDict({5: partial(add, 5, 3), 3: (7, 9)}))
+    yield check, partial(int, 6) * partial(int, 7) - 3
+    yield check, partial(dict, a=partial(add, 1, 2), b=[3, 4])
+    yield check, as_pp(5)
+    x = variable(name='x', value_type=int)
+    y = variable(name='y', value_type=float)
+    yield check, as_pp({3: x, x: [y, [y]], y: 4}), {'x': 'hey', 'y': 5}
+
+
+def test_compile_reuse():
+    """Test that a plan can be run repeatedly with different bindings."""
+    x = variable('x', value_type=int)
+    plan = compile(as_pp([x, x + partial(int, 1)]))
+    for i in range(5):
+        assert plan(x=i) == [i, i + 1]
+
+
+def test_compile_unbound_variable():
+    """Test that running a plan with a missing variable raises."""
+    plan = compile(variable('x', value_type=int) + 1)
+    raised = False
+    try:
+        plan()
+    except KeyError:
+        raised = True
+    assert raised
+
+
+def test_compile_lazy_index():
+    """Test that unselected sequence elements are never evaluated."""
+    plan = compile(as_pp([-1, partial(dont_eval)])[0])
+    assert plan() == -1
+    plan = compile(as_pp((-1, 0, 1, partial(dont_eval)))[:3])
+    assert plan() == (-1, 0, 1)
+    plan = compile(as_pp({'a': partial(dont_eval), 'b': 3})['b'])
+    assert plan() == 3
+
+
+def test_compile_choice():
+    """Test that plans evaluate only the chosen branch of a choice."""
+    p = choice(variable('x', value_type=['a', 'b', 'c']),
+               ('a', partial(float, 2)),
+               ('b', partial(dont_eval)),
+               ('c', partial(int, 3)))
+    plan = compile(p)
+    assert plan(x='a') == 2.0
+    assert plan(x='c') == 3
+
+
+def test_compile_shared_node():
+    """
+    Test that a node shared between lazily indexed branches and the
+    rest of the graph is only evaluated once per run.
+    """
+    class Foo(object):
+        pass
+    p = partial(Foo)
+    x = variable('x', value_type=[0, 1])
+    q = as_pp([as_pp([p, [p]])[x], p, (p,)])
+    plan = compile(q)
+    for i in (0, 1):
+        r = plan(x=i)
+        assert r[1] is r[2][0]
+        assert (r[0] if i == 0 else r[0][0]) is r[1]
+
+
+def test_compile_evaluation_order():
+    """Test that plans evaluate nodes in the same order as evaluate."""
+    order = []
+
+    def record(name, *args, **kwargs):
+        order.append(name)
+        return name
+
+    a = partial(record, 'a')
+    b = partial(record, 'b', a)
+    c = partial(record, 'c', a, x=partial(record, 'd'))
+    p = partial(record, 'e', b, c, as_pp([c, partial(record, 'f')])[1])
+    evaluate(p)
+    expected = list(order)
+    del order[:]
+    compile(p)()
+    assert order == expected
+
+
+def test_compile_instantiate_call():
+    """Test that instantiate_call is used for every call in a plan."""
+    calls = []
+
+    def instantiate(f, *args, **kwargs):
+        calls.append(f)
+        return f(*args, **kwargs)
+
+    p = partial(operator.add, partial(int, 2), 3)
+    assert compile(p, instantiate_call=instantiate)() == 5
+    assert calls == [int, operator.add]
+
+
+def test_compile_deep_graph():
+    """Test that compiling and running deep graphs does not recurse."""
+    p = partial(int, 0)
+    for _ in xrange(5000):
+        p = p + 1
+    assert compile(p)() == 5000
+    q = partial(int, 0)
+    for i in xrange(5000):
+        q = as_pp([q, partial(dont_eval)])[0]
+    assert compile(q)() == 0
+
+
+def test_compile_cycle_detection():
+    """Test that compile raises on a graph with a directed cycle."""
+    p1 = partial(float, 5)
+    p2 = partial(int, p1)
+    p1.append_arg(p2)
+    raised = False
+    try:
+        compile(p2)
+    except ValueError:
+        raised = True
+    assert raised
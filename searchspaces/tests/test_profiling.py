@@ -0,0 +1,177 @@
+from StringIO import StringIO
+import json
+import time
+from searchspaces.partialplus import partial, variable, choice, evaluate
+from searchspaces.partialplus import as_partialplus as as_pp
+from searchspaces.profiling import Profiler, Tracer
+from searchspaces.test_utils import skip_if_no_module
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    pass
+
+
+def sleep_and_return(seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+def make_graph():
+    slow = partial(sleep_and_return, 0.05, 'x' * 1000)
+    fast = partial(sleep_and_return, 0.001, 1)
+    c = variable('c', value_type=['a', 'b'])
+    return as_pp([partial(len, slow), fast,
+                  choice(c, ('a', partial(sleep_and_return, 0.02, 2)),
+                         ('b', partial(sleep_and_return, 0.03, 3)))])
+
+
+def test_profiler_records_calls():
+    """Test that calls are timed and counted per node and per func."""
+    p = make_graph()
+    profiler = Profiler()
+    assert evaluate(p, _profiler=profiler, c='a') == [1000, 1, 2]
+    by_node = profiler.by_node()
+    assert by_node[0][0].func is sleep_and_return
+    assert by_node[0][1] == 1 and by_node[0][2] >= 0.05
+    assert by_node[0][3] >= 1000
+    # The unselected branch is not evaluated.
+    assert len([n for n in by_node if n[0].func is sleep_and_return]) == 3
+    evaluate(p, _profiler=profiler, c='b')
+    by_func = dict((f, (c, t)) for f, c, t, _ in profiler.by_func())
+    assert by_func[sleep_and_return][0] == 6
+    assert by_func[len][0] == 2
+    assert profiler.total_seconds >= 0.15
+    profiler.reset()
+    assert profiler.by_node() == [] and profiler.critical_path() == (0., [])
+
+
+def test_critical_path():
+    """Test that the critical path follows the costliest chain."""
+    slow = partial(sleep_and_return, 0.03, 1)
+    p = as_pp([partial(sleep_and_return, 0.001, slow + 1),
+               partial(sleep_and_return, 0.02, 5)])
+    profiler = Profiler()
+    evaluate(p, _profiler=profiler)
+    seconds, path = profiler.critical_path()
+    funcs = [node.func for node, _ in path]
+    assert funcs[0] is sleep_and_return and path[0][0] is slow
+    assert path[-1][0] is p
+    assert 0.031 <= seconds < profiler.total_seconds
+    report = profiler.report()
+    assert 'sleep_and_return' in report and 'critical path' in report
+    assert len(profiler.report(by='node', limit=2).splitlines()) == 4 + 2 + 4
+
+
+def test_critical_path_through_choice():
+    """Test that the critical path follows the branch taken."""
+    c = variable('c', value_type=['a', 'b'])
+    slow = partial(sleep_and_return, 0.03, 1)
+    p = partial(consume, choice(c, ('a', slow),
+                                ('b', partial(sleep_and_return, 0, 2))))
+    profiler = Profiler()
+    assert evaluate(p, _profiler=profiler, c='a') == 1
+    seconds, path = profiler.critical_path()
+    assert path[0][0] is slow and path[-1][0] is p
+    assert seconds >= 0.03
+
+
+@skip_if_no_module('concurrent.futures')
+def test_profiler_executor():
+    """Test profiling calls run by an executor."""
+    p = make_graph()
+    profiler = Profiler()
+    executor = ThreadPoolExecutor(4)
+    try:
+        assert evaluate(p, _executor=executor, _profiler=profiler,
+                        c='b') == [1000, 1, 3]
+    finally:
+        executor.shutdown()
+    seconds, path = profiler.critical_path()
+    assert path[0][0].args[0].value == 0.05
+    assert 0.05 <= seconds < profiler.total_seconds
+
+
+class Sourced(object):
+    pass
+
+
+def sourced(yaml_src):
+    obj = Sourced()
+    obj.yaml_src = yaml_src
+    return obj
+
+
+def test_tracer_nested_spans():
+    """Test that traced spans nest under their parents."""
+    x = variable('x', value_type=float, minimum=0., maximum=1.)
+    inner = partial(sleep_and_return, 0.01, x)
+    p = as_pp([partial(sleep_and_return, 0.005, inner),
+               partial(sourced, '!obj:foo.Bar {\n  a: 1\n}')])
+    tracer = Tracer()
+    evaluate(p, _profiler=tracer, x=0.5)
+    spans = dict((e['name'], e) for e in tracer.events)
+    # The variable's keyword arguments are a dict built by a call too.
+    assert sorted(spans) == ['call_with_list_of_pos_args', 'make_list',
+                             'sleep_and_return', 'sleep_and_return (x)',
+                             'sourced: !obj:foo.Bar {...']
+    outer, inner, root = (spans['sleep_and_return'],
+                          spans['sleep_and_return (x)'], spans['make_list'])
+    assert outer['ts'] <= inner['ts']
+    assert inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+    assert outer['dur'] >= 15000 and 5000 <= outer['args']['self_us'] < 10000
+    assert root['ts'] <= outer['ts'] and root['dur'] >= outer['dur']
+    assert len(set((e['pid'], e['tid']) for e in tracer.events)) == 1
+    f = StringIO()
+    tracer.write(f)
+    assert json.loads(f.getvalue())['traceEvents'] == tracer.events
+    tracer.reset()
+    assert tracer.events == []
+
+
+def shared():
+    return 1
+
+
+def consume(x):
+    return x
+
+
+def test_tracer_choice_spans():
+    """Test that spans nest by the branch taken, not the others."""
+    s = partial(shared)
+    c = variable('c', value_type=['a', 'b'])
+    p = as_pp([choice(c, ('a', partial(float, 1)), ('b', partial(len, s))),
+               partial(consume, s)])
+    tracer = Tracer()
+    assert evaluate(p, _profiler=tracer, c='a') == [1., 1]
+    spans = dict((e['name'], e) for e in tracer.events)
+    assert 'len' not in spans
+    # `shared` was evaluated for `consume`, not for the unused branch.
+    inner, outer = spans['shared'], spans['consume']
+    assert outer['ts'] <= inner['ts']
+    assert inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+    assert spans['float']['ts'] + spans['float']['dur'] <= inner['ts']
+
+
+@skip_if_no_module('concurrent.futures')
+def test_tracer_executor():
+    """Test that traces of concurrent calls link inputs to consumers."""
+    a = partial(sleep_and_return, 0.02, 1)
+    b = partial(sleep_and_return, 0.02, 2)
+    p = partial(sleep_and_return, 0, as_pp([a, b]))
+    tracer = Tracer()
+    executor = ThreadPoolExecutor(2)
+    try:
+        assert evaluate(p, _executor=executor, _profiler=tracer) == [1, 2]
+    finally:
+        executor.shutdown()
+    spans = [e for e in tracer.events if e['ph'] == 'X']
+    assert len(spans) == 4
+    # a and b ran concurrently, in different threads.
+    assert len(set(e['tid'] for e in spans)) >= 2
+    starts = [e for e in tracer.events if e['ph'] == 's']
+    finishes = [e for e in tracer.events if e['ph'] == 'f']
+    # a -> list, b -> list, list -> p.
+    assert len(starts) == len(finishes) == 3
+    assert (sorted(e['id'] for e in starts) ==
+            sorted(e['id'] for e in finishes))
@@ -0,0 +1,185 @@
+import numpy as np
+from searchspaces.partialplus import (partial, variable, choice,
+                                      evaluate_batch, evaluate)
+from searchspaces.partialplus import as_partialplus as as_pp
+from searchspaces.sampling import sample, sobol, halton, latin_hypercube
+
+
+def test_sample_ranges():
+    """Test that samples respect their variables' specifications."""
+    p = as_pp([
+        variable('f', value_type=float, minimum=-1., maximum=2.),
+        variable('i', value_type=int, minimum=3, maximum=5),
+        variable('l', value_type=float, minimum=1e-4, maximum=1.,
+                 log_scale=True),
+        variable('c', value_type=['a', 'b', 3]),
+        variable('r', value_type=int, distribution='randint', maximum=4),
+        variable('q', value_type=float, distribution='quniform',
+                 minimum=0, maximum=10, q=2.5),
+        variable('n', value_type=float, distribution='lognormal',
+                 mu=0., sigma=1.),
+        variable('m', value_type=float, minimum=0.,
+                 maximum=partial(float, 2) * 3),
+    ])
+    values, active = sample(p, 1000, rng=0)
+    assert values.keys() == ['f', 'i', 'l', 'c', 'r', 'q', 'n', 'm']
+    assert all(len(v) == 1000 and active[k].all()
+               for k, v in values.iteritems())
+    assert values['f'].min() >= -1 and values['f'].max() < 2
+    assert set(values['i']) == set([3, 4, 5])
+    assert values['l'].min() >= 1e-4 and values['l'].max() <= 1
+    # Log scale: about as many samples below 1e-2 as above.
+    assert 400 < (values['l'] < 1e-2).sum() < 600
+    assert set(values['c']) == set(['a', 'b', 3])
+    assert values['c'].dtype == object
+    assert set(values['r']) == set(range(5))
+    assert set(values['q']) <= set([0., 2.5, 5., 7.5, 10.])
+    assert values['n'].min() > 0
+    assert values['m'].max() <= 6
+
+
+def test_sample_categorical_probabilities():
+    """Test that categorical probabilities are honoured."""
+    v = variable('v', value_type=[2, 4, 8], distribution='categorical',
+                 p=[0.2, 0.8, 0.])
+    values, _ = sample(v, 2000, rng=np.random.RandomState(1))
+    assert values['v'].dtype.kind == 'i'
+    assert 300 < (values['v'] == 2).sum() < 500
+    assert (values['v'] == 8).sum() == 0
+
+
+def test_sample_choice_activity():
+    """Test that variables in choice branches are active as selected."""
+    c = variable('c', value_type=['a', 'b'])
+    d = variable('d', value_type=[0, 1])
+    x = variable('x', value_type=float, minimum=0., maximum=1.)
+    y = variable('y', value_type=int, minimum=0, maximum=3)
+    z = variable('z', value_type=int, minimum=0, maximum=3)
+    p = choice(c, ('a', x), ('b', as_pp([y, z])[d]))
+    values, active = sample(p, 500, rng=2)
+    assert active['c'].all()
+    assert np.all(active['x'] == (values['c'] == 'a'))
+    assert np.all(active['d'] == (values['c'] == 'b'))
+    assert np.all(active['y'] == ((values['c'] == 'b') & (values['d'] == 0)))
+    assert np.all(active['z'] == ((values['c'] == 'b') & (values['d'] == 1)))
+    assert 0 < active['y'].sum() < 500
+
+
+def test_sample_feeds_evaluate_batch():
+    """Test that samples can be evaluated directly."""
+    x = variable('x', value_type=int, minimum=0, maximum=9)
+    c = variable('c', value_type=['a', 'b'])
+    p = as_pp([x * 2, choice(c, ('a', x), ('b', -1))])
+    values, _ = sample(p, 20, rng=3)
+    results = evaluate_batch(p, values)
+    for i, r in enumerate(results):
+        assert r == evaluate(p, x=values['x'][i], c=values['c'][i])
+
+
+def test_sample_masks_inactive_rows():
+    """Test that values of inactive variables are masked."""
+    c = variable('c', value_type=['a', 'b'])
+    x = variable('x', value_type=float, minimum=0., maximum=1.)
+    y = variable('y', value_type=['u', 'v'])
+    p = choice(c, ('a', x), ('b', y))
+    values, active = sample(p, 50, rng=4)
+    for name in ('c', 'x', 'y'):
+        assert np.all(np.ma.getmaskarray(values[name]) == ~active[name])
+    assert values['x'].count() == (values['c'] == 'a').sum()
+    assert 0 < values['x'].count() < 50
+    assert values['x'].max() <= 1
+    results = evaluate_batch(p, values)
+    for i, r in enumerate(results):
+        assert r == (values['x'][i] if values['c'][i] == 'a' else
+                     values['y'][i])
+
+
+def test_sample_reproducible():
+    """Test that a seed determines the samples."""
+    p = variable('x', value_type=float, minimum=0., maximum=1.)
+    assert np.all(sample(p, 10, rng=5)[0]['x'] == sample(p, 10, rng=5)[0]['x'])
+
+
+def test_sample_errors():
+    """Test that unsampleable variables raise."""
+    x = variable('x', value_type=int, minimum=0, maximum=9)
+    cases = [
+        variable('a', value_type=float),
+        variable('a', value_type=float, distribution='normal', mu=0.),
+        variable('a', value_type=float, distribution='bogus'),
+        variable('a', value_type=float, minimum=0., maximum=x),
+    ]
+    for p in cases:
+        raised = False
+        try:
+            sample(p, 5)
+        except ValueError:
+            raised = True
+        assert raised
+
+
+def test_sobol():
+    """Test the Sobol sequence and its slices."""
+    points = sobol(8, 3)
+    assert np.all(points[:4] == [[0., 0., 0.], [0.5, 0.5, 0.5],
+                                 [0.75, 0.25, 0.25], [0.25, 0.75, 0.75]])
+    # Every dimension, including generated ones, is stratified.
+    points = sobol(256, 30)
+    for j in range(30):
+        assert np.all(np.bincount((points[:, j] * 256).astype(int)) == 1)
+    assert np.all(sobol(10, 30, skip=37) == sobol(47, 30)[37:])
+
+
+def test_halton():
+    """Test the Halton sequence and its slices."""
+    points = halton(4, 2)
+    assert np.allclose(points, [[0., 0.], [0.5, 1. / 3],
+                                [0.25, 2. / 3], [0.75, 1. / 9]])
+    assert np.all(halton(5, 4, skip=20) == halton(25, 4)[20:])
+
+
+def test_latin_hypercube():
+    """Test that Latin hypercube points are stratified."""
+    points = latin_hypercube(50, 3, rng=0)
+    for j in range(3):
+        assert np.all(np.sort((points[:, j] * 50).astype(int)) ==
+                      np.arange(50))
+
+
+def test_sample_methods():
+    """Test that every method respects variable specifications."""
+    c = variable('c', value_type=['a', 'b'])
+    x = variable('x', value_type=float, minimum=1e-3, maximum=10.,
+                 log_scale=True)
+    i = variable('i', value_type=int, minimum=0, maximum=3)
+    n = variable('n', value_type=float, distribution='normal', mu=1.,
+                 sigma=2.)
+    p = choice(c, ('a', x), ('b', as_pp([i, n])))
+    for method in ('random', 'sobol', 'halton', 'lhs'):
+        values, active = sample(p, 64, rng=1, method=method)
+        assert values['x'].min() >= 1e-3 and values['x'].max() <= 10.
+        assert set(values['i'].compressed()) == set(range(4))
+        assert np.all(active['i'] == (values['c'] == 'b'))
+        assert set(values['c']) == set(['a', 'b'])
+    values, _ = sample(p, 64, method='sobol')
+    # Low discrepancy: exactly balanced strata, in every dimension
+    # including the rows where it is masked.
+    assert (values['c'] == 'a').sum() == 32
+    assert np.all(np.bincount(values['i'].data) == 16)
+    assert (values['x'].data < 0.1).sum() == 32
+    assert (values['n'].data < 1.).sum() == 32
+    first, _ = sample(p, 16, method='sobol', skip=48)
+    assert np.all(first['x'] == values['x'][48:])
+
+
+def test_sample_method_errors():
+    """Test that bad methods and unsupported skips raise."""
+    p = variable('x', value_type=float, minimum=0., maximum=1.)
+    for kwargs in [dict(method='bogus'), dict(skip=3),
+                   dict(method='lhs', skip=3)]:
+        raised = False
+        try:
+            sample(p, 5, **kwargs)
+        except ValueError:
+            raised = True
+        assert raised
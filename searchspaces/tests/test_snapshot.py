@@ -0,0 +1,136 @@
+from cStringIO import StringIO
+import operator
+import os
+import tempfile
+import numpy as np
+from searchspaces.partialplus import (partial, evaluate, variable, choice,
+                                      topological_sort, Literal)
+from searchspaces.partialplus import as_partialplus as as_pp
+from searchspaces.graph import FrozenGraph
+from searchspaces.snapshot import dump, load, _import_object
+
+
+def round_trip(p, **kwargs):
+    f = StringIO()
+    dump(p, f, **kwargs)
+    f.seek(0)
+    return load(f)
+
+
+def test_snapshot_round_trip():
+    """Test that loaded graphs evaluate like the originals."""
+    x = variable('x', value_type=int)
+    c = choice(variable('c', value_type=['a', 'b']),
+               ('a', partial(float, 2)), ('b', x * 3))
+    cases = [
+        (as_pp([[3, partial(operator.add, 2, 3)], partial(float, 9)]), {}),
+        (as_pp({5: partial(operator.add, 5, 3), 3: (7, 9), 4: [1]}), {}),
+        (partial(dict, a=partial(operator.add, 1, 2), b=[3, 4]), {}),
+        (as_pp([x, x + 1, (x, 'str', None, 2.5)]), {'x': 4}),
+        (c, {'c': 'b', 'x': 2}),
+        (as_pp(5), {}),
+    ]
+    for p, bindings in cases:
+        q = round_trip(p)
+        assert evaluate(q, **bindings) == evaluate(p, **bindings)
+        assert (len(list(topological_sort(q))) ==
+                len(list(topological_sort(p))))
+
+
+def test_snapshot_preserves_sharing():
+    """Test that shared nodes stay shared, and literals are interned."""
+    q = partial(float, 5)
+    p = as_pp([q, q, [q], 7, 7])
+    r = round_trip(p)
+    assert r.args[0] is r.args[1] is r.args[2].args[0]
+    assert r.args[3] is not r.args[4]
+    assert r.args[3].value == r.args[4].value == 7
+    f = StringIO()
+    dump(p, f)
+    big = StringIO()
+    dump(as_pp([q, q, [q]] + [7] * 1000), big)
+    # 1000 more literal nodes cost their table entries (two ints each,
+    # plus one in the list's arguments), not their values.
+    assert len(big.getvalue()) - len(f.getvalue()) < 1000 * 3 * 4 + 100
+
+
+def test_snapshot_literal_types():
+    """Test that equal literals of different types aren't merged."""
+    values = [(1,), (1.0,), (True,), ((1,), 0.0), ((1.0,), -0.0),
+              frozenset([1]), frozenset([1.0]), 1, 1.0]
+    p = as_pp([Literal(v) for v in values])
+    r = round_trip(p)
+    for literal, value in zip(r.args, values):
+        assert repr(literal.value) == repr(value)
+
+
+def test_snapshot_frozen_graph():
+    """Test that a FrozenGraph can be saved."""
+    p = as_pp([partial(operator.add, 1, 2), 3])
+    assert evaluate(round_trip(FrozenGraph(p))) == [3, 3]
+
+
+def test_snapshot_deep_graph():
+    """Test that saving and loading deep graphs does not recurse."""
+    p = partial(int, 0)
+    for _ in xrange(20000):
+        p = p + 1
+    assert evaluate(round_trip(p)) == 20000
+
+
+def test_snapshot_arrays():
+    """Test that large arrays are stored out of line and memory-mapped."""
+    small = np.arange(3)
+    large = np.asfortranarray(np.arange(2000.).reshape(40, 50))
+    p = as_pp([partial(np.sum, large), small, large])
+    q = round_trip(p)
+    assert np.all(q.args[2].value == large)
+    assert q.args[2].value.flags.f_contiguous
+    assert evaluate(q)[0] == large.sum()
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write('prefix')
+            dump(p, f)
+            dump(as_pp(large.T), f, array_threshold=0)
+        with open(path, 'rb') as f:
+            assert f.read(6) == 'prefix'
+            q = load(f)
+            r = load(f)
+            assert f.read() == ''
+        assert isinstance(q.args[2].value, np.memmap)
+        assert not isinstance(q.args[1].value, np.memmap)
+        assert np.all(q.args[2].value == large)
+        assert np.all(q.args[1].value == small)
+        assert np.all(r.value == large.T)
+    finally:
+        os.remove(path)
+
+
+def make_helper():
+    def helper(x):
+        return x
+    return helper
+
+
+def test_snapshot_errors():
+    """Test that unsaveable graphs and bad snapshots raise."""
+    for func in (lambda: 3, make_helper()):
+        raised = False
+        try:
+            dump(partial(func), StringIO())
+        except ValueError:
+            raised = True
+        assert raised
+    raised = False
+    try:
+        load(StringIO('not a snapshot'))
+    except ValueError:
+        raised = True
+    assert raised
+    raised = False
+    try:
+        _import_object('operator.no_such_function')
+    except ImportError:
+        raised = True
+    assert raised
@@ -0,0 +1,42 @@
+import numpy as np
+from searchspaces.partialplus import partial, variable
+from searchspaces.variables import (hyperparameter, as_column, require,
+                                    from_unit_interval)
+
+
+def test_hyperparameter():
+    """Test that hyperparameters are evaluated, but not from variables."""
+    assert hyperparameter(partial(float, 2) * 3, 'x') == 6.
+    raised = False
+    try:
+        hyperparameter(variable('y', value_type=int) + 1, 'x')
+    except ValueError:
+        raised = True
+    assert raised
+
+
+def test_as_column():
+    """Test that columns are numeric only if every option is."""
+    assert as_column([1, 2.5]).dtype == float
+    assert as_column([True, False]).dtype == bool
+    assert as_column([True, 1]).dtype == object
+    assert list(as_column(['a', (1, 2)])) == ['a', (1, 2)]
+
+
+def test_require():
+    """Test that missing hyperparameters raise."""
+    kw = {'mu': 0., 'sigma': None}
+    assert require(kw, 'x', 'normal', 'mu') == [0.]
+    raised = False
+    try:
+        require(kw, 'x', 'normal', 'mu', 'sigma')
+    except ValueError:
+        raised = True
+    assert raised
+
+
+def test_from_unit_interval():
+    """Test that the unit interval maps onto the variable's range."""
+    x = variable('x', value_type=int, minimum=2, maximum=5)
+    u = np.array([0., 0.249, 0.25, 0.999])
+    assert list(from_unit_interval(x, u)) == [2, 2, 3, 5]
@@ -0,0 +1,222 @@
+"""
+Helpers interpreting the keywords of `variable` nodes, shared by
+sampling, encoding and grid enumeration.
+"""
+__authors__ = "David Warde-Farley"
+__license__ = "3-clause BSD License"
+__contact__ = "github.com/hyperopt/hyperopt"
+
+__all__ = ["hyperparameter", "as_column", "require", "from_unit_interval",
+           "active_masks"]
+
+from collections import OrderedDict
+import numbers
+import operator
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .partialplus import (Literal, evaluate, is_categorical, is_indexable,
+                          is_literal, is_sequence_node, is_variable_node)
+
+
+def hyperparameter(node, name):
+    """The value of a hyperparameter of the variable named `name`."""
+    if is_literal(node):
+        return node.value
+    try:
+        return evaluate(node)
+    except KeyError:
+        raise ValueError("hyperparameters of variable '%s' can't depend on "
+                         "other variables" % name)
+
+
+def as_column(options):
+    """An array holding `options`, numeric if they all are."""
+    if (all(isinstance(v, bool) for v in options) or
+            all(isinstance(v, numbers.Real) and not isinstance(v, bool)
+                for v in options)):
+        return np.array(options)
+    column = np.empty(len(options), dtype=object)
+    for i, v in enumerate(options):
+        column[i] = v
+    return column
+
+
+def require(kw, name, distribution, *keys):
+    """
+    The values of the hyperparameters `keys` in `kw`, raising
+    ValueError if any is missing.
+    """
+    missing = [k for k in keys if kw.get(k) is None]
+    if missing:
+        raise ValueError("variable '%s' with distribution '%s' requires %s" %
+                         (name, distribution, ', '.join(missing)))
+    return [kw[k] for k in keys]
+
+
+def _quantize(x, q):
+    return np.round(x / q) * q
+
+
+# Coefficients of Acklam's rational approximation of the inverse of the
+# standard normal CDF, accurate to a relative error of about 1e-9.
+_PPF_A = (-3.969683028665376e+01, 2.209460984245205e+02,
+          -2.759285104469687e+02, 1.383577518672690e+02,
+          -3.066479806614716e+01, 2.506628277459239e+00)
+_PPF_B = (-5.447609879822406e+01, 1.615858368580409e+02,
+          -1.556989798598866e+02, 6.680131188771972e+01,
+          -1.328068155288572e+01, 1.)
+_PPF_C = (-7.784894002430293e-03, -3.223964580411365e-01,
+          -2.400758277161838e+00, -2.549732539343734e+00,
+          4.374664141464968e+00, 2.938163982698783e+00)
+_PPF_D = (7.784695709041462e-03, 3.224671290700398e-01,
+          2.445134137142996e+00, 3.754408661907416e+00, 1.)
+_PPF_LOW = 0.02425
+
+
+def _normal_ppf(u):
+    """The inverse of the standard normal CDF, elementwise."""
+    u = np.clip(u, 1e-300, 1 - 1e-16)
+    x = np.empty_like(u)
+    tail = np.minimum(u, 1 - u)
+    central = tail >= _PPF_LOW
+    q = u[central] - 0.5
+    r = q * q
+    x[central] = (np.polyval(_PPF_A, r) * q / np.polyval(_PPF_B, r))
+    tails = ~central
+    q = np.sqrt(-2 * np.log(tail[tails]))
+    sign = np.where(u[tails] < 0.5, 1., -1.)
+    x[tails] = sign * np.polyval(_PPF_C, q) / np.polyval(_PPF_D, q)
+    return x
+
+
+def from_unit_interval(node, u):
+    """
+    Map points `u` of the unit interval to values of the variable
+    `node`, so that uniformly distributed points give values
+    distributed as the variable specifies.
+    """
+    kw = node.keywords
+    name = kw['name'].value
+    if is_categorical(node):
+        options = hyperparameter(kw['value_type'], name)
+        if 'p' in kw:
+            cdf = np.cumsum(hyperparameter(kw['p'], name), dtype=float)
+            cdf /= cdf[-1]
+        else:
+            cdf = np.arange(1., len(options) + 1) / len(options)
+        index = np.minimum(np.searchsorted(cdf, u, side='right'),
+                           len(options) - 1)
+        return as_column(options)[index]
+    kw = dict((k, hyperparameter(v, name)) for k, v in kw.iteritems())
+    distribution = kw['distribution']
+    value_type = kw['value_type']
+    low, high = kw['minimum'], kw['maximum']
+    if distribution is None:
+        if value_type not in (int, float):
+            raise ValueError("variable '%s' has no distribution and a "
+                             "value_type that is neither int, float nor "
+                             "a sequence" % name)
+        if low is None or high is None:
+            raise ValueError("variable '%s' needs a minimum and a maximum "
+                             "to be sampled" % name)
+        if kw['log_scale']:
+            log_low, log_high = np.log(low), np.log(high)
+            values = np.exp(log_low + u * (log_high - log_low))
+            if value_type is int:
+                values = np.clip(np.round(values), low, high)
+        elif value_type is int:
+            return np.minimum(low + np.floor(u * (high - low + 1)),
+                              high).astype(int)
+        else:
+            values = low + u * (high - low)
+    # Distributions named and parametrized as in hyperopt.pyll.stochastic.
+    elif distribution == 'randint':
+        high, = require(kw, name, distribution, 'maximum')
+        if low is not None:
+            raise ValueError("nonzero minimum not supported by randint")
+        return np.minimum(np.floor(u * (high + 1)), high).astype(int)
+    elif distribution in ('uniform', 'quniform', 'loguniform', 'qloguniform'):
+        low, high = require(kw, name, distribution, 'minimum', 'maximum')
+        values = low + u * (high - low)
+        if 'log' in distribution:
+            values = np.exp(values)
+    elif distribution in ('normal', 'qnormal', 'lognormal', 'qlognormal'):
+        mu, sigma = require(kw, name, distribution, 'mu', 'sigma')
+        values = mu + sigma * _normal_ppf(u)
+        if 'log' in distribution:
+            values = np.exp(values)
+    else:
+        raise ValueError("variable '%s' has unknown distribution '%s'" %
+                         (name, distribution))
+    if distribution is not None and distribution.startswith('q'):
+        q, = require(kw, name, distribution, 'q')
+        values = _quantize(values, q)
+    if value_type is int:
+        values = values.astype(int)
+    return values
+
+
+def _lazy_masks(node, mask, values):
+    """
+    Yield `(input, mask)` pairs for the nodes a lazily evaluated
+    getitem `node` evaluates, when it is evaluated in the rows of
+    `mask`.
+    """
+    obj, index = node.args
+    yield index, mask
+    if is_variable_node(index):
+        column = values[index.keywords['name'].value]
+        selects = lambda key: mask & (column == key)
+    elif is_literal(index):
+        selects = lambda key: mask if key == index.value else None
+    else:
+        selects = lambda key: mask
+    if is_sequence_node(obj):
+        if is_literal(index) and isinstance(index.value, slice):
+            for elem in obj.args[index.value]:
+                yield elem, mask
+        else:
+            for i, elem in enumerate(obj.args):
+                yield elem, selects(i)
+    else:
+        for pair in obj.args[1:]:
+            key, value = pair.args
+            yield key, mask
+            # Keys are evaluated, but values selected by computed keys
+            # can't be told apart ahead of time.
+            yield value, (selects(key.value) if is_literal(key) else mask)
+
+
+def active_masks(graph, values, n):
+    """
+    The rows in which each variable of `graph` is used, given `n`
+    values of every variable.
+    """
+    # Rows in which each node is evaluated, found going down from the
+    # root; a node's mask is complete once all its parents are visited.
+    masks = {graph.root: np.ones(n, dtype=bool)}
+    active = OrderedDict((name, np.zeros(n, dtype=bool)) for name in values)
+    for node in graph.nodes:
+        mask = masks.pop(node, None)
+        if mask is None or isinstance(node, Literal):
+            continue
+        if is_variable_node(node):
+            name = node.keywords['name'].value
+            active[name] |= mask
+            continue
+        if node.func is operator.getitem and is_indexable(node):
+            inputs = _lazy_masks(node, mask, values)
+        else:
+            inputs = ((child, mask) for child in node.inputs())
+        for child, child_mask in inputs:
+            if child_mask is None:
+                continue
+            elif child in masks:
+                masks[child] = masks[child] | child_mask
+            else:
+                masks[child] = child_mask
+    return active